@@ -6,15 +6,26 @@
 # from the client.
 # http://support.microsoft.com/kb/216893#LetMeFixItMyselfAlways
 
+import imp
+import os
+for _helper in ['elements', 'lazy_grammar', 'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import elements
+import lazy_grammar
+import window_state
+
 import aenea
-import aenea.misc
 import aenea.configuration
 
 import dragonfly
 
-awesome_context = aenea.ProxyPlatformContext('linux')
-
-grammar = dragonfly.Grammar('awesome', context=awesome_context)
+awesome_context = window_state.CachedContext(
+    aenea.ProxyPlatformContext('linux'))
 
 awesome = 'W'
 
@@ -40,9 +51,13 @@ basics_mapping = aenea.configuration.make_grammar_commands('awesome', {
 
 class Basics(dragonfly.MappingRule):
     mapping = basics_mapping
-    extras = [aenea.misc.DigitalInteger('n', 1, None)]
+    extras = [elements.digital_integer('n', 1, None)]
 
-grammar.add_rule(Basics())
+grammar = lazy_grammar.LazyGrammar(
+    'awesome',
+    context=awesome_context,
+    build=lambda grammar: grammar.add_rule(Basics()),
+    )
 grammar.load()
 
 
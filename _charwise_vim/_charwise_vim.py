@@ -1,7 +1,22 @@
+import imp
 import operator
-import re
+import os
 import datetime
 
+for _helper in ['batch_executor', 'command_chain', 'formatting',
+                'lazy_grammar', 'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import batch_executor
+import command_chain
+import formatting
+import lazy_grammar
+import window_state
+
 import aenea.config
 import aenea.misc
 import aenea.vocabulary
@@ -20,7 +35,6 @@ from dragonfly import (
     AppContext,
     CompoundRule,
     Dictation,
-    Grammar,
     MappingRule,
     Repetition,
     RuleRef
@@ -34,6 +48,8 @@ PRINT_COUNTER_STATISTICS = False
 
 GRAMMAR_NAME = 'charwise_vim'
 INHIBITED_GRAMMAR_TAGS = ["vim.insertions", "multiedit.count", "global"]
+# The most keys and commands that can be chained in one utterance.
+MAX_CHAIN = 20
 
 CHAR_KEY_MAPPINGS = {  # TODO move this into a separate importable file?
     # See the Dragonfly documentation to see what the values should be:
@@ -191,21 +207,24 @@ def setup_key_mappings():
 
 def setup_grammar():
     vim_context = create_app_context()
-    new_grammar = Grammar(GRAMMAR_NAME, context=vim_context)
+    new_grammar = lazy_grammar.LazyGrammar(
+        GRAMMAR_NAME,
+        context=vim_context,
+        build=lambda grammar: grammar.add_rule(CharwiseVimRule()),
+    )
 
     # TODO does this prevent other vocabs from using the global grammars
     aenea.vocabulary.inhibit_global_dynamic_vocabulary(
         GRAMMAR_NAME, INHIBITED_GRAMMAR_TAGS
     )
 
-    new_grammar.add_rule(CharwiseVimRule())
     new_grammar.load()
 
     return new_grammar
 
 
 def create_app_context():
-    return aenea.wrappers.AeneaContext(
+    return window_state.WindowContext(
         AlwaysContext(),
         AppContext(title='VIM'),
     )
@@ -287,7 +306,7 @@ class ModifiableSingleKeyRule(CompoundRule):
         else:
             key_str = char
 
-        return Key(key_str) * repeats
+        return Key('{}:{}'.format(key_str, repeats))
 
 
 def notes_complete_line():
@@ -511,148 +530,11 @@ class TextRule(CompoundRule):
     def value(self, node):
         words = node.words()
         self.preprocess_words(words)
-
-        uppercase = words[0] == 'upper'
-        lowercase = words[0] != 'natural'
-
-        if lowercase:
-            words = [word.lower() for word in words]
-        if uppercase:
-            words = [word.upper() for word in words]
-
-        if words[0].lower() in ('upper', 'natural'):
-            del words[0]
-
-        format_type = words[0].lower().replace('-', '')
-        del words[0]
-
-        words = self.properly_separate_words(words)
-
-        func = getattr(TextRule, 'format_%s' % format_type)
-        formatted = func(words)
-
-        return Text(formatted)
-
-    def properly_separate_words(self, words):
-        # Fix dragon not properly formatting words. Examples of `words`:
-        # ['hello', 'world'],
-        # ["let's", 'use', 'the', 'control panel'],
-        # ['well', 'I\\pronoun', 'think', 'we', 'should', 'go'],
-        # ['\x96\\dash\\dash'],  # when you say 'natword dash'
-        # ['\x97\\em-dash\\m dash'],  # when you say 'natword em dash'
-        # ["let's", 'go', 'off-campus'],
-
-        def flat_map(function, iterable):
-            map_results = [function(item) for item in iterable]
-            if not map_results:
-                return []
-            return reduce(operator.add, map_results)
-
-        words = [
-            word.split('\\', 1)[0].replace('-', '')
-            for word in words
-            if not re.match(r'^[,\x96\x97]', word)
-        ]
-        words = flat_map(lambda word: word.split(' '), words)
-        words = [word for word in words if word]
-        return words
+        return Text(formatting.format_words(words))
 
     def preprocess_words(self, words):
         pass
 
-    @staticmethod
-    def format_snakeway(text):
-        formatted = text[0][0].upper()
-        formatted += text[0][1:]
-        formatted += ('_' if len(text) > 1 else '')
-        formatted += TextRule.format_score(text[1:])
-        return formatted
-
-    @staticmethod
-    def format_score(text):
-        return '_'.join(text)
-
-    @staticmethod
-    def format_params(text):
-        return ', '.join(text)
-
-    @staticmethod
-    def format_camel(text):
-        return text[0] + ''.join(
-            [word[0].upper() + word[1:]
-             for word in text[1:]]
-        )
-
-    @staticmethod
-    def format_proper(text):
-        return ''.join(word.capitalize() for word in text)
-
-    @staticmethod
-    def format_relpath(text):
-        return '/'.join(text)
-
-    @staticmethod
-    def format_abspath(text):
-        return '/' + TextRule.format_relpath(text)
-
-    @staticmethod
-    def format_scoperesolve(text):
-        return '::'.join(text)
-
-    @staticmethod
-    def format_jumble(text):
-        return ''.join(text)
-
-    @staticmethod
-    def format_dotway(text):
-        return '.'.join(text)
-
-    @staticmethod
-    def format_spineway(text):
-        return '-'.join(text)
-
-    @staticmethod
-    def format_natway(text):
-        return ' '.join(text)
-
-    @staticmethod
-    def format_spaceway(text):
-        if len(text) == 0:
-            return ''
-        return ' '.join(text) + ' '
-
-    format_spayway = format_spaceway
-
-    @staticmethod
-    def format_broodingnarrative(text):
-        return ''
-
-    @staticmethod
-    def format_sentence(text):
-        if len(text) == 0:
-            return ''
-        return ' '.join([text[0].capitalize()] + text[1:])
-
-    @staticmethod
-    def format_spaytince(text):
-        if len(text) == 0:
-            return ''
-        return ' '.join([text[0].capitalize()] + text[1:]) + ' '
-
-    @staticmethod
-    def format_title(text):
-        words_to_keep_lowercase = (
-            'a,an,the,at,by,for,in,of,on,to,up,and,as,but,or,nor'.split(',')
-        )
-        words = []
-        for index, word in enumerate(text):
-            if index == 0 or word not in words_to_keep_lowercase:
-                words.append(word.capitalize())
-            else:
-                words.append(word)
-
-        return ' '.join(words)
-
 
 class ContinuableTextRule(TextRule):
     spec = TextRule.spec + ' ' + END_CONTINUABLE_TEXT_WORD
@@ -730,14 +612,14 @@ class CharwiseVimRule(CompoundRule):
         'repeat_last_rule',
     )
     extras = [
-        Repetition(
+        command_chain.chain(
             Alternative([
                 RuleRef(ModifiableSingleKeyRule()),
                 RuleRef(SimpleCommandRule()),
                 RuleRef(ContinuableTextRule()),
             ]),
-            max=20,
-            name='repeated_rules'
+            max=MAX_CHAIN,
+            name='repeated_rules',
         ),
         Alternative(
             [
@@ -763,11 +645,12 @@ class CharwiseVimRule(CompoundRule):
         to_repeat_getters = extras.get('repeat_last_rule', [])
 
         to_execute = [item for item in to_execute if item]
+        batch = batch_executor.ActionBatch()
 
         if to_execute:
             for executable in to_execute:
                 print 'Executing {}'.format(executable)
-                executable.execute()
+                batch.add(executable)
                 Counter.update(executable)
             RepeatLastRule.last_chunk = to_execute
 
@@ -775,7 +658,9 @@ class CharwiseVimRule(CompoundRule):
         for to_repeat_getter in to_repeat_getters:
             to_repeat = to_repeat_getter()
             print 'Repeating {}'.format(to_repeat)
-            to_repeat.execute()
+            batch.add(to_repeat)
+
+        batch.execute()
 
 
 load()
@@ -1,25 +1,36 @@
+import imp
+import os
+for _helper in ['elements', 'lazy_grammar', 'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import elements
+import lazy_grammar
+
 import aenea.config
 import aenea.configuration
 
 from aenea import (
-    AeneaContext,
     AppContext,
     Dictation,
-    Grammar,
-    IntegerRef,
     Key,
     MappingRule,
-    ProxyAppContext,
     Text
     )
 
-chromium_context = aenea.AeneaContext(
+from window_state import (
+    ProxyAppContext,
+    WindowContext,
+    )
+
+chromium_context = WindowContext(
     ProxyAppContext(cls_name='chromium', cls='chromium'),
     (AppContext(executable='chrome') | AppContext(executable='chromium'))
     )
 
-chromium_grammar = Grammar('chromium', context=chromium_context)
-
 
 class ChromiumRule(MappingRule):
     mapping = aenea.configuration.make_grammar_commands('chromium', {
@@ -40,13 +51,17 @@ class ChromiumRule(MappingRule):
         'forward [<n>]':                     Key('a-right:%(n)d'),
         })
 
-    extras = [IntegerRef('n', 1, 10), Dictation('text')]
+    extras = [elements.integer_ref('n', 1, 10, 'chromium'), Dictation('text')]
     defaults = {
         'n': 1,
         'text': ''
         }
 
-chromium_grammar.add_rule(ChromiumRule())
+chromium_grammar = lazy_grammar.LazyGrammar(
+    'chromium',
+    context=chromium_context,
+    build=lambda grammar: grammar.add_rule(ChromiumRule()),
+    )
 
 chromium_grammar.load()
 
@@ -56,3 +71,4 @@ def unload():
     if chromium_grammar:
         chromium_grammar.unload()
     chromium_grammar = None
+    elements.release('chromium')
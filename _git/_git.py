@@ -1,25 +1,49 @@
 import imp
 import os
-try:
-    imp.find_module('git_commands')
-except ImportError:
-    dir = os.path.dirname(os.path.realpath(__file__))
-    raise ImportError('You need to copy the "git_commands.py" file to ' + dir)
+for _module in ['git_commands', 'git_options', 'git_refs', 'git_usage']:
+    try:
+        imp.find_module(_module)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "%s.py" file to %s' % (_module, dir))
 import git_commands
+import git_options
+import git_refs
+import git_usage
+for _helper in ['batch_executor', 'grammar_cache', 'lazy_grammar',
+                'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import batch_executor
+import grammar_cache
+import lazy_grammar
+import window_state
 
 import aenea.config
 import aenea.configuration
+import pipes
 import re
 
-from aenea.proxy_contexts import ProxyAppContext
+from window_state import (
+    ProxyAppContext,
+    WindowContext,
+)
 
 from dragonfly import (
     Alternative,
     AppContext,
     CompoundRule,
+    Dictation,
+    DictListRef,
     Grammar,
     MappingRule,
     Repetition,
+    Rule,
     RuleRef,
 )
 
@@ -29,17 +53,58 @@ from aenea import (
 )
 
 
+conf = aenea.configuration.ConfigWatcher(('grammar_config', 'git')).conf
+
+# How many options can be said after a command in staged mode.
+STAGED_MAX_OPTIONS = 16
+
+git_context = WindowContext(
+    ProxyAppContext(
+        match='regex',
+        app_id='(?i)(?:(?:DOS|CMD).*)|(?:.*(?:TERM|SHELL).*)',
+    ),
+    AppContext(title='git'),
+)
+
+# Command name -> StagedOptionGrammar, loaded the first time it is needed.
+staged_option_grammars = {}
+
+# The refs of the repository in git.json are offered wherever the common refs
+# are.
+REFS_GROUP = 'common_refs'
+ref_vocabulary = None
+if conf.get('repository'):
+    ref_vocabulary = git_refs.RefVocabulary(str(conf['repository']))
+
+
+option_usage = git_usage.OptionUsage()
+
+
+def refresh_refs():
+    if ref_vocabulary is not None:
+        ref_vocabulary.refresh()
+
+
+OPTION_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'git_option_index.json')
+
+
+def build_grammar(grammar):
+    if conf.get('option_dictation', False):
+        grammar.add_rule(GitCommandNameRule(dictated_options=True))
+    elif conf.get('staged_options', False):
+        grammar.add_rule(GitCommandNameRule())
+    else:
+        grammar.add_rule(GitRule())
+
+
 def load():
     global git_grammar
-    context = aenea.wrappers.AeneaContext(
-        ProxyAppContext(
-            match='regex',
-            app_id='(?i)(?:(?:DOS|CMD).*)|(?:.*(?:TERM|SHELL).*)',
-        ),
-        AppContext(title='git'),
+    git_grammar = lazy_grammar.LazyGrammar(
+        'git',
+        context=git_context,
+        build=build_grammar,
     )
-    git_grammar = Grammar('git', context=context)
-    git_grammar.add_rule(GitRule())
     git_grammar.load()
 
 
@@ -48,6 +113,120 @@ def unload():
     if git_grammar:
         git_grammar.unload()
     git_grammar = None
+    for grammar in staged_option_grammars.values():
+        grammar.unload()
+    staged_option_grammars.clear()
+    option_usage.save()
+
+
+# Shells that don't take POSIX quotes (cmd.exe, DOS prompts, PowerShell),
+# matched against the name of the terminal's application. Options are typed
+# unquoted there.
+_NON_POSIX_SHELL = re.compile(r'(?i)^(?:.*[\\/])?(?:dos|cmd|powershell|pwsh)')
+
+
+def posix_shell():
+    '''Whether the focused terminal runs a POSIX shell.'''
+    return not _NON_POSIX_SHELL.match(window_state.state.executable())
+
+
+def _shell_argument(option):
+    '''Quotes an option (with its leading space) as one shell argument.'''
+    argument = option.lstrip()
+    if not argument:
+        return option
+    return option[:len(option) - len(argument)] + pipes.quote(argument)
+
+
+def _command_line(parts):
+    '''
+    Returns one action that types ``parts``, the pieces of a command line.
+    Adjacent strings are joined into a single Text, so a whole command with
+    its options is typed in one go. Options that are actions are kept.
+
+    Each option is one argument, and is quoted if a POSIX shell would split
+    or expand it (e.g. stash@{0}). git_commands.Verbatim text, such as the
+    command itself and convenience options, is typed as it is.
+    '''
+    quote = posix_shell()
+    actions = []
+    text = ''
+    for part in parts:
+        if isinstance(part, basestring):
+            if quote and not isinstance(part, git_commands.Verbatim):
+                part = _shell_argument(part)
+            text += part
+            continue
+        if text:
+            actions.append(Text(text))
+            text = ''
+        actions.append(part)
+    if text:
+        actions.append(Text(text))
+
+    action = None
+    for part in actions:
+        action = part if action is None else action + part
+    return action
+
+
+def _option_mapping_rule(name, options):
+    return MappingRule(
+        name=name,
+        mapping=options,
+        exported=False,
+    )
+
+
+def shared_option_rules(groups):
+    '''
+    Returns a rule for each group of shared options, to be referred to by
+    every command in one grammar that uses the group.
+    '''
+    rules = dict(
+        (group, _option_mapping_rule(group, options))
+        for (group, options) in groups.iteritems()
+    )
+    if ref_vocabulary is not None and REFS_GROUP in groups:
+        rules['repository_refs'] = Rule(
+            name='repository_refs',
+            element=DictListRef(
+                None, ref_vocabulary.new_list('repository_refs')),
+            exported=False,
+        )
+    return rules
+
+
+class CommandOptionsRule(MappingRule):
+    '''
+    The options of one command. Its value is the option's text, and saying an
+    option counts towards its usage (see git_usage).
+    '''
+    def __init__(self, command, name, options):
+        self.command = command
+        super(CommandOptionsRule, self).__init__(
+            name=name,
+            mapping=options,
+            exported=False,
+        )
+
+    def value(self, node):
+        option = super(CommandOptionsRule, self).value(node)
+        if isinstance(option, basestring):
+            option_usage.record(self.command, option.strip())
+        return option
+
+
+def _option_element(command, name, options, shared_options, shared_rules):
+    '''Matches one option: one of the command's own, or a shared one.'''
+    choices = [RuleRef(CommandOptionsRule(command, name, options))]
+    for group in shared_options:
+        choices.append(RuleRef(shared_rules[group]))
+        if group == REFS_GROUP and 'repository_refs' in shared_rules:
+            choices.append(RuleRef(shared_rules['repository_refs']))
+    if len(choices) == 1:
+        return choices[0]
+    return Alternative(choices)
 
 
 class GitCommandRule(CompoundRule):
@@ -63,6 +242,9 @@ class GitCommandRule(CompoundRule):
             options,
             alias=None,
             base_options=[],
+            shared_options=[],
+            shared_rules={},
+            **ignored
     ):
         alias = alias or name
         self.base_options = base_options
@@ -75,11 +257,13 @@ class GitCommandRule(CompoundRule):
                 name='options',
                 min=0,
                 max=10,
-                child=RuleRef(MappingRule(
-                    name=name + '_options',
-                    mapping=options,
-                    exported=False,
-                )),
+                child=_option_element(
+                    name,
+                    name + '_options',
+                    options,
+                    shared_options,
+                    shared_rules,
+                ),
             )],
         )
 
@@ -89,39 +273,42 @@ class GitCommandRule(CompoundRule):
         help = not not sequence_values[0]
         option_values = sequence_values[2]
 
-        output_text = Text('git {}{}'.format(
-            'help ' if help else '',
-            self.name,
-        ))
-
         if help:
             options = option_values
         else:
             options = self.base_options + option_values
-        for option in options:
-            output_text += option
-
-        return output_text
+        return _command_line(
+            [git_commands.Verbatim(
+                'git {}{}'.format('help ' if help else '', self.name))]
+            + options)
 
 
 class GitCommandRuleBuilder:
     def __init__(self, **data):
         if 'options' not in data:
             data['options'] = dict()
+        if 'shared_options' not in data:
+            data['shared_options'] = []
         self.data = data
+        # Aliases in the order they were added, to break ties deterministically.
+        self._order = list(data.pop('option_order', None) or data['options'])
 
     def option(self, alias, option, append_space=True):
         alias = alias.strip()
 
         if alias in self.data['options']:
-            return
+            return self
 
         result_text = option
-        if isinstance(result_text, basestring):
-            result_text = Text(option)
         if append_space:
-            result_text = Text(' ') + result_text
-
+            if isinstance(result_text, git_commands.Verbatim):
+                result_text = git_commands.Verbatim(' ' + result_text)
+            elif isinstance(result_text, basestring):
+                result_text = ' ' + result_text
+            else:
+                result_text = Text(' ') + result_text
+
+        self._order.append(alias)
         self.data['options'][alias] = result_text
         return self
 
@@ -167,48 +354,312 @@ class GitCommandRuleBuilder:
 
         return self
 
-    convenience_option = option
+    def convenience_option(self, alias, option, **keyword_arguments):
+        '''
+        An option typed exactly as written, e.g. several options at once or
+        shell syntax, instead of as one quoted argument.
+        '''
+        return self.option(
+            alias, git_commands.Verbatim(option), **keyword_arguments)
+
+    def shared_options(self, group):
+        '''
+        Lets the command use a group of options from
+        git_commands.shared_option_groups.
+        '''
+        if group not in self.data['shared_options']:
+            self.data['shared_options'].append(group)
+        return self
 
     def apply(self, function):
         function(self)
         return self
 
     def build(self):
-        return RuleRef(
-            name=self.data['name'],
-            rule=GitCommandRule(**self.data),
+        '''
+        Returns the arguments for a GitCommandRule. Options given as strings
+        stay strings, so the result can be cached (see grammar_cache).
+        ``option_order`` lists the options in the order they were added, which
+        git_usage.fit_budget breaks ties with.
+        '''
+        data = dict(self.data)
+        data['option_order'] = list(self._order)
+        return data
+
+
+def _build_command_data():
+    return {
+        'commands': git_commands.all_commands(GitCommandRuleBuilder),
+        'shared_options':
+            git_commands.shared_option_groups(GitCommandRuleBuilder),
+    }
+
+
+def command_data():
+    '''
+    Returns the builder data of every command and the shared option groups,
+    cached on disk.
+    '''
+    sources = [
+        grammar_cache.source_file(git_commands.__file__),
+        grammar_cache.source_file(__file__),
+    ] + grammar_cache.config_sources('git')
+    return grammar_cache.cached('git_commands', sources, _build_command_data)
+
+
+def with_generated_options(data):
+    '''
+    Returns the builder data of one command with every option git lists for
+    it in git_option_index.json added to those of git_commands.py. Only a
+    staged option grammar, which holds one command's options, has room for
+    them all.
+    '''
+    typed = set(option.strip() for option in data['options'].itervalues()
+                if isinstance(option, basestring))
+    generated = git_options.OptionIndex(OPTION_INDEX_PATH).options(data['name'])
+    return (
+        GitCommandRuleBuilder(**dict(data, options=dict(data['options'])))
+        .smart_options([option for option in generated if option not in typed])
+        .build()
+    )
+
+
+def fit_budget(commands, shared_options):
+    '''
+    Returns the commands of one grammar with the options that fit in
+    "option_budget" (see git_usage.fit_budget), or all of them without one.
+    '''
+    budget = conf.get('option_budget')
+    if budget is None:
+        return commands
+    return git_usage.fit_budget(commands, shared_options, budget, option_usage)
+
+
+def command_rules():
+    data = command_data()
+    shared_rules = shared_option_rules(data['shared_options'])
+    return [
+        RuleRef(
+            name=command['name'],
+            rule=GitCommandRule(shared_rules=shared_rules, **command),
         )
+        for command in fit_budget(data['commands'], data['shared_options'])
+    ]
+
+
+def _cancel_rule():
+    return RuleRef(name='cancel', rule=MappingRule(
+        name='cancel',
+        mapping={'cancel [last]': Key('c-c')},
+    ))
+
+
+def _enter_rule():
+    return RuleRef(name='enter', rule=MappingRule(
+        name='enter',
+        mapping={'enter': Key('enter')},
+    ))
 
 
 class GitRule(CompoundRule):
     def __init__(self):
-        commands = git_commands.all_commands(GitCommandRuleBuilder)
+        commands = command_rules()
         spec = '[<cancel>] git [<command_with_options>] [<enter>] [<cancel>]'
 
         super(GitRule, self).__init__(
             spec=spec,
-            exported=False,
             extras=[
-                RuleRef(name='cancel', rule=MappingRule(
-                    name='cancel',
-                    mapping={'cancel [last]': Key('c-c')},
-                )),
+                _cancel_rule(),
                 Alternative(
                     name='command_with_options',
                     children=commands,
                 ),
-                RuleRef(name='enter', rule=MappingRule(
-                    name='enter',
-                    mapping={'enter': Key('enter')},
-                )),
+                _enter_rule(),
             ],
         )
 
+    def _process_begin(self):
+        refresh_refs()
+
     def _process_recognition(self, node, extras):
+        batch = batch_executor.ActionBatch()
         for name in ['cancel', 'command_with_options', 'enter']:
             executable = extras.get(name)
             if executable:
-                executable.execute()
+                batch.add(executable)
+        batch.execute()
+
+
+
+class OptionDictationRule(CompoundRule):
+    spec = '<dictation>'
+    extras = [Dictation(name='dictation')]
+
+    def value(self, node):
+        return node.words()
+
+
+class GitCommandNameRule(CompoundRule):
+    '''
+    The top level rule in staged mode (``"staged_options": true`` in
+    grammar_config/git.json). Only the command is said with "git"; its options
+    are recognised by a separate StagedOptionGrammar in the next utterance.
+    Keeping each command's options out of this grammar keeps it small, and
+    lets the option lists be as long as needed.
+
+    With ``dictated_options`` (``"option_dictation": true``), the options are
+    dictated after the command instead, and resolved with git_options. The
+    grammar then stays the same size however many options there are. End the
+    utterance with "enter" to run the command.
+    '''
+    def __init__(self, dictated_options=False):
+        data = command_data()
+        self.commands = dict(
+            (command['name'], command) for command in data['commands']
+        )
+        self.shared_options = data['shared_options']
+        self.option_index = None
+
+        if dictated_options:
+            spec = '[<cancel>] git [<help>] <command> [<options>]'
+            last_extra = RuleRef(name='options', rule=OptionDictationRule())
+            self.option_index = git_options.OptionIndex(
+                OPTION_INDEX_PATH,
+                dict(
+                    (name, [
+                        option.strip()
+                        for option in command['options'].itervalues()
+                        if isinstance(option, basestring)
+                    ])
+                    for (name, command) in self.commands.iteritems()
+                ),
+            )
+        else:
+            spec = '[<cancel>] git [<help>] <command> [<enter>]'
+            last_extra = _enter_rule()
+
+        super(GitCommandNameRule, self).__init__(
+            spec=spec,
+            extras=[
+                _cancel_rule(),
+                RuleRef(name='help', rule=MappingRule(
+                    name='help',
+                    mapping={'help': 'help '},
+                )),
+                RuleRef(name='command', rule=MappingRule(
+                    name='command',
+                    mapping=dict(
+                        ('({})'.format(data.get('alias') or name), name)
+                        for (name, data) in self.commands.iteritems()
+                    ),
+                )),
+                last_extra,
+            ],
+        )
+
+    def _process_begin(self):
+        refresh_refs()
+
+    def _process_recognition(self, node, extras):
+        name = extras['command']
+        data = self.commands[name]
+        help = extras.get('help', '')
+
+        enter = extras.get('enter')
+        words = extras.get('options', [])
+        if words and words[-1].lower() == 'enter':
+            words = words[:-1]
+            enter = Key('enter')
+
+        parts = [git_commands.Verbatim('git {}{}'.format(help, name))]
+        if not help:
+            parts.extend(data.get('base_options', []))
+        if self.option_index is not None:
+            for option in self.option_index.resolve(name, words):
+                if option.startswith('-'):
+                    option_usage.record(name, option)
+                parts.append(' ' + option)
+
+        batch = batch_executor.ActionBatch()
+        batch.add(extras.get('cancel'))
+        batch.add(_command_line(parts))
+        batch.add(enter)
+        batch.execute()
+
+        if not help and enter is None and self.option_index is None:
+            self._expect_options(data)
+
+    def _expect_options(self, data):
+        grammar = staged_option_grammars.get(data['name'])
+        if grammar is None:
+            data = fit_budget(
+                [with_generated_options(data)], self.shared_options)[0]
+            grammar = StagedOptionGrammar(
+                data, self.shared_options, git_context)
+            grammar.load()
+            staged_option_grammars[data['name']] = grammar
+        grammar.expect_options()
+
+
+class GitOptionsRule(CompoundRule):
+    '''The options of one command, said after "git <command>".'''
+    def __init__(self, name, options, shared_options=[], shared_rules={},
+                 **ignored):
+        super(GitOptionsRule, self).__init__(
+            name=name + '_staged_options',
+            spec='<options> [<enter>]',
+            extras=[
+                Repetition(
+                    name='options',
+                    min=1,
+                    max=STAGED_MAX_OPTIONS,
+                    child=_option_element(
+                        name,
+                        name + '_staged_option',
+                        options,
+                        shared_options,
+                        shared_rules,
+                    ),
+                ),
+                _enter_rule(),
+            ],
+        )
+
+    def _process_recognition(self, node, extras):
+        self.disable()
+        batch = batch_executor.ActionBatch()
+        batch.add(_command_line(extras['options']))
+        batch.add(extras.get('enter'))
+        batch.execute()
+
+
+class StagedOptionGrammar(Grammar):
+    '''
+    Holds the GitOptionsRule of one command. It is loaded the first time the
+    command is said, and its rule is only enabled for the utterance after each
+    time the command is said.
+    '''
+    def __init__(self, data, shared_groups, context):
+        Grammar.__init__(
+            self, 'git_{}_options'.format(data['name']), context=context)
+        shared_rules = shared_option_rules(dict(
+            (group, shared_groups[group]) for group in data['shared_options']
+        ))
+        self.rule = GitOptionsRule(shared_rules=shared_rules, **data)
+        self.add_rule(self.rule)
+        self.rule.disable()
+        self._utterances_left = 0
+
+    def expect_options(self):
+        self.rule.enable()
+        self._utterances_left = 1
+
+    def process_begin(self, executable, title, handle):
+        if self._utterances_left:
+            self._utterances_left -= 1
+        else:
+            self.rule.disable()
+        Grammar.process_begin(self, executable, title, handle)
 
 
 load()
@@ -1,10 +1,12 @@
-from aenea import Text
-
 '''
 NOTE: Not all possible commands and options are available in this grammar.
 NatLink puts a limit on how complex the grammar can get, and some commands had
 to be removed. If you feel like there is something missing here, feel free to
-add stuff back and make a pull request.
+add stuff back and make a pull request. With "staged_options" enabled in
+grammar_config/git.json, each command's options are loaded as a separate small
+grammar after the command is said, so the limit applies to one command's
+options at a time. That grammar also offers every option git lists for the
+command, from git_option_index.json (see tools/build_git_option_index.py).
 
 NOTE 2: Lists of options were grepped from the Git help pages using a bash
 script. These have been marked with the comment 'Generated'. Some of these
@@ -15,8 +17,17 @@ when adding a new command, just add the options that are commonly used.
 '''
 
 
+class Verbatim(str):
+    '''
+    Option text typed exactly as written, for convenience options that hold
+    several arguments or shell syntax on purpose. Other options are typed as
+    one argument each, quoted where the shell needs it.
+    '''
+
+
 # Common refs for convenience. The user will still have to type out most branch
-# and remote names themselves
+# and remote names themselves, unless "repository" is set in git.json (see
+# git_refs.py)
 _COMMON_BRANCH_NAMES = ['master', 'develop', 'HEAD']
 _COMMON_REMOTE_NAMES = ['origin', 'upstream']
 
@@ -36,7 +47,19 @@ def _add_common_refs(rule_builder):
     # (If you install FZF (https://github.com/junegunn/fzf) in your terminal
     # and save the fbr command linked above in your `~/.fzf.bash`, this will
     # bring up a fuzzy finder where you can type in the name of a branch.)
-    rule_builder.option('select branch', '`fbr`')
+    rule_builder.convenience_option('select branch', '`fbr`')
+
+
+def shared_option_groups(GitCommandRuleBuilder):
+    '''
+    Options that many commands accept. Each group becomes one rule that every
+    command using it refers to, instead of a copy in each command's options.
+    '''
+    return {
+        'common_refs': GitCommandRuleBuilder(name='common_refs')
+        .apply(_add_common_refs)
+        .build()['options'],
+    }
 
 
 def all_commands(GitCommandRuleBuilder):
@@ -78,7 +101,7 @@ def common_commands(GitCommandRuleBuilder):
 
         GitCommandRuleBuilder(name='branch')
         .convenience_option('easy all', '--verbose --verbose --all')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--all',
             '--delete',  # the same as '-d'
@@ -91,7 +114,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='checkout')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .option('branch|be', '-b')
         .smart_options(['.', '-', '--'])
         .smart_options([
@@ -107,7 +130,7 @@ def common_commands(GitCommandRuleBuilder):
         ])
         .build(),
 
-        GitCommandRuleBuilder(name='commit', base_options=[Text(' -v')])
+        GitCommandRuleBuilder(name='commit', base_options=[' -v'])
         .smart_options(['.'])
         .smart_options([
             '--',
@@ -123,7 +146,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='diff')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--',
             '--cached',
@@ -135,7 +158,7 @@ def common_commands(GitCommandRuleBuilder):
 
         GitCommandRuleBuilder(name='fetch')
         .convenience_option('easy all', '--all --tags --prune')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--all',
             '--force',
@@ -165,7 +188,7 @@ def common_commands(GitCommandRuleBuilder):
             'easy oneline',
             '--graph --oneline --topo-order',
         )
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options(['.', '-', '--'])
         .smart_options([
             # Not generated because there are too many options
@@ -186,7 +209,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='merge')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .option('fast forward only', '--ff-only')
         .option('no fast forward', '--no-ff')
         .smart_options([
@@ -206,7 +229,7 @@ def common_commands(GitCommandRuleBuilder):
 
         GitCommandRuleBuilder(name='pull')
         .convenience_option('easy push', '--rebase && git push')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--force',
             '--rebase',
@@ -214,7 +237,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='push')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--all',
             '--delete',
@@ -225,7 +248,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='rebase')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options(['-'])
         .smart_options([
             # Generated (TODO remove unused options):
@@ -242,7 +265,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='reset')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--',
             '--hard',
@@ -261,7 +284,7 @@ def common_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='show')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             '--',
             '--stat',
@@ -312,7 +335,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='cherry-pick')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options(['-'])
         .smart_options([
             '--abort',
@@ -321,7 +344,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='clean')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .option('directories', '-d')
         .smart_options([
             '--dry-run',
@@ -342,7 +365,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='merge-base')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             # Generated (TODO remove unused options):
             '--all', '--fork-point', '--independent', '--is-ancestor',
@@ -365,7 +388,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='revert')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             # Generated (TODO remove unused options):
             '--abort', '--continue', '--edit', '--gpg-sign', '--mainline',
@@ -375,7 +398,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='shortlog')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             # Generated (TODO remove unused options):
             '--committer', '--email', '--format', '--numbered', '--pretty=',
@@ -412,7 +435,7 @@ def extra_commands(GitCommandRuleBuilder):
         .build(),
 
         GitCommandRuleBuilder(name='worktree')
-        .apply(_add_common_refs)
+        .shared_options('common_refs')
         .smart_options([
             'add', 'list', 'lock', 'move', 'prune', 'remove', 'unlock',
         ])
@@ -0,0 +1,181 @@
+'''
+Resolves dictated words to git options, so options don't have to be grammar
+literals.
+
+With "option_dictation" enabled in grammar_config/git.json, whatever is said
+after "git <command>" is free dictation. ``OptionIndex.resolve`` splits the
+words into the options of that command that they sound most like, e.g.
+['no', 'ff', 'quiet'] -> ['--no-ff', '--quiet']. Words that don't sound like
+any option are typed as they are, so arguments such as file names can be said
+in between.
+
+The options come from git_option_index.json (built offline by
+tools/build_git_option_index.py from ``git <command> -h``) and from
+git_commands.py. Each command's index is built the first time it is used: an
+exact lookup by the option's letters and a trigram index for near misses, so
+resolving an utterance takes well under a millisecond.
+'''
+
+import json
+import os
+import re
+
+# Options whose trigrams are less similar than this (Dice coefficient) to the
+# words said are not considered a match.
+MIN_SIMILARITY = 0.6
+# The most words one option can be said with.
+MAX_OPTION_WORDS = 6
+
+
+def _key(text):
+    '''The letters and digits of an option or phrase, e.g. 'noff'.'''
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def _trigrams(key):
+    padded = '^%s$' % key
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _inner_trigrams(key):
+    '''The trigrams of ``key`` wherever it appears in a longer name.'''
+    return set(key[i:i + 3] for i in range(len(key) - 2))
+
+
+class CommandOptions(object):
+    '''Looks up the options of one command.'''
+
+    def __init__(self, options):
+        self.options = []
+        self._exact = {}
+        self._sizes = []
+        # trigram -> indices of the options containing it
+        self._postings = {}
+        for option in options:
+            key = _key(option)
+            if not key or key in self._exact:
+                continue
+            index = len(self.options)
+            self.options.append(option)
+            self._exact[key] = option
+            trigrams = _trigrams(key)
+            self._sizes.append(len(trigrams))
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(index)
+
+    def match(self, words):
+        '''Returns (similarity, option) for the option most like ``words``.'''
+        key = _key(''.join(words))
+        if not key:
+            return 0.0, None
+        if key in self._exact:
+            return 1.0, self._exact[key]
+
+        trigrams = _trigrams(key)
+        shared = {}
+        for trigram in trigrams:
+            for index in self._postings.get(trigram, ()):
+                shared[index] = shared.get(index, 0) + 1
+        best, best_index = 0.0, None
+        for index, count in shared.iteritems():
+            similarity = 2.0 * count / (len(trigrams) + self._sizes[index])
+            if similarity > best:
+                best, best_index = similarity, index
+        if best < MIN_SIMILARITY:
+            return 0.0, None
+        return best, self.options[best_index]
+
+    def resolve(self, words):
+        '''
+        Returns what to type for ``words``: options, and any words that
+        matched no option, in the order they were said.
+
+        Each word said as part of an option scores how much it sounds like
+        that option, so a split only wins by matching more words, not by
+        making an option's window longer. An option is never matched with a
+        word that isn't part of its name ("set upstream origin" ->
+        ['--set-upstream', 'origin']), and "no <option>" says
+        ``--no-<option>`` when the index doesn't list it.
+        '''
+        count = len(words)
+        # best[i] = (score, items) for the first i words
+        best = [(0.0, [])] + [None] * count
+        for end in range(1, count + 1):
+            score, items = best[end - 1]
+            # Typing the word as it is scores nothing.
+            candidates = [(score, items + [words[end - 1]])]
+            for start in range(max(0, end - MAX_OPTION_WORDS), end):
+                option_score, option = self._option(words[start:end])
+                if option is not None:
+                    score, items = best[start]
+                    candidates.append((score + option_score, items + [option]))
+            best[end] = max(candidates, key=lambda candidate: candidate[0])
+        return best[count][1]
+
+    def _option(self, words):
+        '''
+        Returns (score, option) for the option ``words`` say, or (0, None).
+        '''
+        similarity, option = self.match(words)
+        if similarity < 1.0 and len(words) > 1 and words[0].lower() == 'no':
+            negated = self._option(words[1:])[1]
+            if (negated is not None and negated.startswith('--') and
+                    not negated.startswith('--no-')):
+                # Git takes --no-<option> for its boolean long options.
+                similarity, option = 1.0, '--no-' + negated[2:]
+        if option is None:
+            return 0.0, None
+        score = self._word_score(words, option, similarity)
+        if not score:
+            return 0.0, None
+        return score, option
+
+    def _word_score(self, words, option, similarity):
+        '''
+        The sum over ``words`` of how much each sounds like a part of
+        ``option``, at most ``similarity`` each, or 0 if any word is not a
+        part of it.
+        '''
+        option_key = _key(option)
+        option_trigrams = _inner_trigrams(option_key)
+        score = 0.0
+        for word in words:
+            key = _key(word)
+            if key and key in option_key:
+                part = 1.0
+            else:
+                trigrams = _inner_trigrams(key)
+                part = (float(len(trigrams & option_trigrams)) / len(trigrams)
+                        if trigrams else 0.0)
+            if part < MIN_SIMILARITY:
+                return 0.0
+            score += min(part, similarity)
+        return score
+
+
+class OptionIndex(object):
+    def __init__(self, path, extra_options=None):
+        '''
+        ``extra_options`` maps command names to more options, such as those
+        in git_commands.py.
+        '''
+        self._commands = {}
+        self._options = {}
+        if os.path.exists(path):
+            with open(path) as index_file:
+                self._options = json.load(index_file)['commands']
+        for command, options in (extra_options or {}).iteritems():
+            self._options[command] = (
+                list(self._options.get(command, [])) + list(options))
+
+    def options(self, name):
+        '''Returns every option of a command, in the order git lists them.'''
+        return list(self._options.get(name, []))
+
+    def command(self, name):
+        if name not in self._commands:
+            self._commands[name] = CommandOptions(self._options.get(name, []))
+        return self._commands[name]
+
+    def resolve(self, name, words):
+        return self.command(name).resolve(words)
@@ -0,0 +1,214 @@
+'''
+Branch, remote and tag names of a repository, read straight from its .git
+directory so they can be said like any other option.
+
+Set "repository" in grammar_config/git.json to the path of a working tree (or
+.git directory) that the machine running the grammars can read, e.g. through
+a shared folder. The names are parsed from refs/, packed-refs and config
+without running git. For a linked worktree these are read from the
+repository's common directory (named by the worktree's "commondir" file),
+where git keeps them for all its worktrees. Before each utterance the files are checked with one
+stat() per directory, and only directories whose mtime changed are listed
+again, so refreshing stays cheap even with tens of thousands of refs (most
+of which git keeps in packed-refs).
+'''
+
+import os
+import re
+
+from dragonfly import DictList
+
+# In order of precedence when two refs are said the same way.
+_REF_PREFIXES = ['refs/heads/', 'refs/remotes/', 'refs/tags/']
+_REMOTE_PATTERN = re.compile(r'^\s*\[\s*remote\s+"([^"]+)"\s*\]')
+
+
+def spoken_form(ref):
+    '''
+    Returns what to say for a ref, the same way git_commands spells options,
+    e.g. 'origin/feature-x' -> 'origin slash feature x'.
+    '''
+    spoken = re.sub(r'/', ' slash ', ref)
+    spoken = re.sub(r'[^a-zA-Z0-9]', ' ', spoken)
+    return ' '.join(spoken.lower().split())
+
+
+def find_git_directory(path):
+    '''Returns the .git directory for a working tree or .git path.'''
+    git_path = os.path.join(path, '.git')
+    if os.path.isfile(git_path):
+        # A worktree or submodule: ".git" says where the directory is.
+        with open(git_path) as git_file:
+            line = git_file.readline().strip()
+        if line.startswith('gitdir:'):
+            return os.path.normpath(
+                os.path.join(path, line[len('gitdir:'):].strip()))
+    if os.path.isdir(git_path):
+        return git_path
+    return path
+
+
+def find_common_directory(git_directory):
+    '''
+    Returns the directory holding the refs, packed-refs and config of a .git
+    directory: the main repository's for a linked worktree, whose own
+    directory only has its HEAD and a few other files.
+    '''
+    try:
+        with open(os.path.join(git_directory, 'commondir')) as commondir_file:
+            common = commondir_file.readline().strip()
+    except IOError:
+        return git_directory
+    if not common:
+        return git_directory
+    return os.path.normpath(os.path.join(git_directory, common))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class RefReader(object):
+    '''Reads ref names, re-reading only what changed since the last call.'''
+
+    def __init__(self, git_directory):
+        self.git_directory = git_directory
+        self.common_directory = find_common_directory(git_directory)
+        # directory -> (mtime, ref file names, subdirectory names)
+        self._directories = {}
+        self._packed = (None, [])
+        self._config = (None, [])
+        self._changed = True
+        self._names = []
+
+    def _scan_loose_refs(self, directory):
+        '''Lists the directories under refs/ whose mtime changed.'''
+        mtime = _mtime(directory)
+        cached = self._directories.get(directory)
+        if cached is None or cached[0] != mtime:
+            files, subdirectories = [], []
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                names = []
+            for name in names:
+                if os.path.isdir(os.path.join(directory, name)):
+                    subdirectories.append(name)
+                elif not name.endswith('.lock'):
+                    files.append(name)
+            cached = (mtime, files, subdirectories)
+            self._directories[directory] = cached
+            self._changed = True
+
+        for name in cached[2]:
+            self._scan_loose_refs(os.path.join(directory, name))
+
+    def _loose_refs(self, directory, prefix, refs):
+        mtime, files, subdirectories = self._directories[directory]
+        refs.extend(prefix + name for name in files)
+        for name in subdirectories:
+            self._loose_refs(
+                os.path.join(directory, name), prefix + name + '/', refs)
+
+    def _packed_refs(self):
+        path = os.path.join(self.common_directory, 'packed-refs')
+        mtime = _mtime(path)
+        if mtime != self._packed[0]:
+            refs = []
+            if mtime is not None:
+                with open(path) as packed:
+                    for line in packed:
+                        if line.startswith(('#', '^')):
+                            continue
+                        parts = line.split()
+                        if len(parts) == 2:
+                            refs.append(parts[1])
+            self._packed = (mtime, refs)
+            self._changed = True
+        return self._packed[1]
+
+    def remotes(self):
+        path = os.path.join(self.common_directory, 'config')
+        mtime = _mtime(path)
+        if mtime != self._config[0]:
+            remotes = []
+            if mtime is not None:
+                with open(path) as config:
+                    for line in config:
+                        match = _REMOTE_PATTERN.match(line)
+                        if match:
+                            remotes.append(match.group(1))
+            self._config = (mtime, remotes)
+            self._changed = True
+        return self._config[1]
+
+    def refs(self):
+        '''
+        Returns the short names of branches, remote branches and tags, in
+        that order of precedence, followed by the remote names, and whether
+        they changed since the last call.
+        '''
+        refs_directory = os.path.join(self.common_directory, 'refs')
+        self._scan_loose_refs(refs_directory)
+        packed_refs = self._packed_refs()
+        remotes = self.remotes()
+        if not self._changed:
+            return self._names, False
+
+        full_names = list(packed_refs)
+        self._loose_refs(refs_directory, 'refs/', full_names)
+        full_names = sorted(set(full_names))
+        names = []
+        for prefix in _REF_PREFIXES:
+            names.extend(
+                name[len(prefix):] for name in full_names
+                if name.startswith(prefix) and not name.endswith('/HEAD')
+            )
+        names.extend(remotes)
+        self._names = names
+        self._changed = False
+        return names, True
+
+
+class RefVocabulary(object):
+    '''
+    Keeps DictLists of spoken ref -> option text up to date with a
+    repository. Create one list per grammar with ``new_list``.
+    '''
+
+    def __init__(self, repository):
+        self.reader = RefReader(find_git_directory(repository))
+        self._lists = []
+        self._refs = None
+
+    def new_list(self, name):
+        dict_list = DictList(name)
+        self._lists.append(dict_list)
+        if self._refs is not None:
+            dict_list.set(self._actions())
+        return dict_list
+
+    def _actions(self):
+        return dict(
+            (spoken, ' ' + ref)
+            for (spoken, ref) in self._refs.iteritems()
+        )
+
+    def refresh(self):
+        names, changed = self.reader.refs()
+        if not changed and self._refs is not None:
+            return
+        refs = {}
+        for ref in names:
+            spoken = spoken_form(ref)
+            if spoken and spoken not in refs:
+                refs[spoken] = ref
+        if refs == self._refs:
+            return
+        self._refs = refs
+        actions = self._actions()
+        for dict_list in self._lists:
+            dict_list.set(actions)
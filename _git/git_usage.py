@@ -0,0 +1,122 @@
+'''
+Counts how often each git option is said, and keeps the grammar's options
+within a budget.
+
+When "option_budget" is set in grammar_config/git.json, it is the most
+options one git grammar may hold: the whole grammar by default, or one
+command's option grammar in staged mode. Each option is one alternative of
+the grammar, and a shared group such as the common refs is one rule however
+many commands use it, so its options count once. ``fit_budget`` keeps the
+options said most often, and gives a share of the budget to options that
+haven't been said yet, a different slice of them each time the counts
+change. An option that was left out therefore comes back from time to time
+and can start counting, instead of being dropped for good.
+
+The counts are kept in PROJECT_ROOT/grammar_usage/git.json, and saved at
+most every SAVE_INTERVAL seconds and when the grammar is unloaded.
+'''
+
+import json
+import os
+import time
+
+import aenea.config
+
+USAGE_PATH = os.path.join(
+    aenea.config.PROJECT_ROOT, 'grammar_usage', 'git.json')
+SAVE_INTERVAL = 60
+# The share of the budget kept for options that haven't been said yet.
+ROTATION_SHARE = 0.1
+
+
+class OptionUsage(object):
+    def __init__(self, path=None):
+        self.path = path or USAGE_PATH
+        self.counts = {}
+        self._dirty = False
+        self._saved = time.time()
+        try:
+            with open(self.path) as usage_file:
+                self.counts = json.load(usage_file)
+        except (IOError, ValueError):
+            pass
+
+    def count(self, command, option):
+        return self.counts.get(command, {}).get(option, 0)
+
+    def total(self):
+        return sum(sum(counts.itervalues())
+                   for counts in self.counts.itervalues())
+
+    def record(self, command, option):
+        command_counts = self.counts.setdefault(command, {})
+        command_counts[option] = command_counts.get(option, 0) + 1
+        self._dirty = True
+        if time.time() - self._saved > SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        if not self._dirty:
+            return
+        temporary_path = self.path + '.tmp'
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(temporary_path, 'w') as usage_file:
+                json.dump(self.counts, usage_file, indent=4, sort_keys=True,
+                          separators=(',', ': '))
+            if os.name == 'nt' and os.path.exists(self.path):
+                # Windows can't rename over an existing file.
+                os.remove(self.path)
+            os.rename(temporary_path, self.path)
+        except (IOError, OSError) as error:
+            print 'Could not save git option usage: %s' % error
+            return
+        self._dirty = False
+        self._saved = time.time()
+
+
+def fit_budget(commands, shared_options, budget, usage):
+    '''
+    Returns ``commands`` (GitCommandRuleBuilder data) with only as many
+    options as fit in ``budget``, with the options of the ``shared_options``
+    groups they use counted once. The same counts always keep the same
+    options: ties go to the command and option that come first.
+    '''
+    groups = set(group for command in commands
+                 for group in command['shared_options'])
+    available = max(
+        budget - sum(len(shared_options[group]) for group in groups), 0)
+    candidates = [
+        (command['name'], alias, command['options'][alias])
+        for command in commands
+        for alias in command.get('option_order') or sorted(command['options'])
+    ]
+    if len(candidates) <= available:
+        return commands
+
+    def count(candidate):
+        name, alias, option = candidate
+        if not isinstance(option, basestring):
+            return 0
+        return usage.count(name, option.strip())
+
+    used = sorted((candidate for candidate in candidates if count(candidate)),
+                  key=count, reverse=True)
+    unused = [candidate for candidate in candidates if not count(candidate)]
+    rotation = min(len(unused), int(available * ROTATION_SHARE))
+    kept = used[:available - rotation]
+    if unused:
+        start = usage.total() % len(unused)
+        kept.extend((unused[start:] + unused[:start])[:available - len(kept)])
+
+    kept = set((name, alias) for (name, alias, option) in kept)
+    return [
+        dict(command, options=dict(
+            (alias, option)
+            for (alias, option) in command['options'].iteritems()
+            if (command['name'], alias) in kept
+        ))
+        for command in commands
+    ]
@@ -8,24 +8,38 @@
 # Licensed under the LGPL, see <http://www.gnu.org/licenses/>
 #
 
+import imp
+import operator
+import os
+for _helper in ['batch_executor', 'command_chain', 'elements',
+                'formatting', 'lazy_grammar', 'vocabulary_index',
+                'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import batch_executor
+import command_chain
+import elements
+import formatting
+import lazy_grammar
+import vocabulary_index
+import window_state
+
 import aenea
-import aenea.misc
 import aenea.vocabulary
 import aenea.configuration
-import aenea.format
 
 from aenea import (
-    AeneaContext,
     AppContext,
     Alternative,
     CompoundRule,
     Dictation,
     DictList,
     DictListRef,
-    Grammar,
-    IntegerRef,
     Literal,
-    ProxyAppContext,
     MappingRule,
     NeverContext,
     Repetition,
@@ -40,6 +54,8 @@ from aenea import (
 
 # Multiedit wants to take over dynamic vocabulary management.
 MULTIEDIT_TAGS = ['multiedit', 'multiedit.count']
+# The most actions that can be chained in one utterance.
+MAX_CHAIN = 16
 aenea.vocabulary.inhibit_global_dynamic_vocabulary('multiedit', MULTIEDIT_TAGS)
 
 #---------------------------------------------------------------------------
@@ -96,24 +112,7 @@ class FormatRule(CompoundRule):
     extras = [Dictation(name='dictation')]
 
     def value(self, node):
-        words = node.words()
-
-        uppercase = words[0] == 'upper'
-        lowercase = words[0] != 'natural'
-
-        if lowercase:
-            words = [word.lower() for word in words]
-        if uppercase:
-            words = [word.upper() for word in words]
-
-        words = [word.split('\\', 1)[0].replace('-', '') for word in words]
-        if words[0].lower() in ('upper', 'natural'):
-            del words[0]
-
-        function = getattr(aenea.format, 'format_%s' % words[0].lower())
-        formatted = function(words[1:])
-
-        return Text(formatted)
+        return Text(formatting.format_words(node.words()))
 
 
 #---------------------------------------------------------------------------
@@ -137,7 +136,7 @@ class KeystrokeRule(MappingRule):
     exported = False
 
     extras = [
-        IntegerRef('n', 1, 100),
+        elements.integer_ref('n', 1, 100, 'multiedit'),
         Dictation('text'),
         Dictation('text2'),
         ]
@@ -153,7 +152,7 @@ class NumericDelegateRule(CompoundRule):
         delegates = node.children[0].children[0].children
         value = delegates[0].value()
         if delegates[-1].value() is not None:
-            return value * int(delegates[-1].value())
+            return batch_executor.repeated(value, delegates[-1].value())
         else:
             return value
 
@@ -162,12 +161,12 @@ class StaticCountRule(NumericDelegateRule):
     spec = '<static> [<n>]'
 
     extras = [
-        IntegerRef('n', 1, 100),
+        elements.integer_ref('n', 1, 100, 'multiedit'),
         DictListRef(
             'static',
             DictList(
                 'static multiedit.count',
-                aenea.vocabulary.get_static_vocabulary('multiedit.count')
+                vocabulary_index.static_vocabulary('multiedit.count')
                 )),
         ]
 
@@ -175,8 +174,8 @@ class DynamicCountRule(NumericDelegateRule):
     spec = '<dynamic> [<n>]'
 
     extras = [
-        IntegerRef('n', 1, 100),
-        DictListRef('dynamic', aenea.vocabulary.register_dynamic_vocabulary('multiedit.count')),
+        elements.integer_ref('n', 1, 100, 'multiedit'),
+        DictListRef('dynamic', vocabulary_index.dynamic_vocabulary('multiedit.count')),
         ]
 
     defaults = {
@@ -198,13 +197,13 @@ alternatives = [
     RuleRef(rule=KeystrokeRule(mapping=mapping, name='c')),
     DictListRef(
         'dynamic multiedit',
-        aenea.vocabulary.register_dynamic_vocabulary('multiedit')
+        vocabulary_index.dynamic_vocabulary('multiedit')
         ),
     DictListRef(
         'static multiedit',
         DictList(
             'static multiedit',
-            aenea.vocabulary.get_static_vocabulary('multiedit')
+            vocabulary_index.static_vocabulary('multiedit')
             ),
         ),
     RuleRef(rule=DynamicCountRule(name='aoeuazzzxt'), name='aouxxxazsemi'),
@@ -215,12 +214,9 @@ alternatives = [
 single_action = Alternative(alternatives)
 
 # Can only be used as the last element
-alphabet_mapping = dict((key, Text(value))
-                        for (key, value) in aenea.misc.LETTERS.iteritems())
-numbers_mapping = dict((key, Text(value))
-                        for (key, value) in aenea.misc.DIGITS.iteritems())
-alphanumeric_mapping = dict((key, Text(value))
-                            for (key, value) in aenea.misc.ALPHANUMERIC.iteritems())
+alphabet_mapping = elements.text_actions('LETTERS')
+numbers_mapping = elements.text_actions('DIGITS')
+alphanumeric_mapping = elements.text_actions('ALPHANUMERIC')
 
 alphabet_rule = Sequence([Literal('letters'), Repetition(RuleRef(name='x', rule=MappingRule(name='t', mapping=alphabet_mapping)), min=1, max=20)])
 numbers_rule = Sequence([Literal('digits'), Repetition(RuleRef(name='y', rule=MappingRule(name='u', mapping=numbers_mapping)), min=1, max=20)])
@@ -235,11 +231,11 @@ finishes = [alphabet_rule, numbers_rule, alphanumeric_rule]
 # Note: when processing a recognition, the *value* of this element
 #  will be a sequence of the contained elements: a sequence of
 #  actions.
-sequence = Repetition(single_action, min=1, max=16, name='sequence')
+sequence = command_chain.chain(single_action, max=MAX_CHAIN, name='sequence')
 
 extras = [
     sequence,  # Sequence of actions defined above.
-    IntegerRef('n', 1, 100),  # Times to repeat the sequence.
+    elements.integer_ref('n', 1, 100, 'multiedit'),  # Times to repeat the sequence.
     Alternative([Literal('hi')], name='finish'),
     ]
 
@@ -270,6 +266,9 @@ class RepeatRule(CompoundRule):
         'n': 1, # Default repeat count.
         }
 
+    def _process_begin(self):
+        vocabulary_index.refresh()
+
     # This method gets called when this rule is recognized.
     # Arguments:
     #  - node -- root node of the recognition parse tree.
@@ -277,16 +276,16 @@ class RepeatRule(CompoundRule):
     #   . extras['sequence'] gives the sequence of actions.
     #   . extras['n'] gives the repeat count.
     def _process_recognition(self, node, extras):
-        sequence = extras.get('sequence', [])
+        actions = list(extras.get('sequence', []))
         count = extras['n']
-        for i in range(count):
-            for action in sequence:
-                action.execute(extras)
-            if 'format_rule' in extras:
-                extras['format_rule'].execute(extras)
-            if 'finish' in extras:
-                for action in extras['finish'][1]:
-                    action.execute(extras)
+        if 'format_rule' in extras:
+            actions.append(extras['format_rule'])
+        if 'finish' in extras:
+            actions.extend(extras['finish'][1])
+        if actions:
+            actions = reduce(operator.add, actions)
+            batch_executor.execute_batched(
+                [batch_executor.repeated(actions, count)], extras)
 
 #---------------------------------------------------------------------------
 # Create and load this module's grammar.
@@ -310,20 +309,25 @@ if proxy_disable_setting is not None:
         d = {}
         for k, v in proxy_disable_setting.iteritems():
             d[str(k)] = str(v)
-        proxy_disable_context = ProxyAppContext(**d)
+        proxy_disable_context = window_state.ProxyAppContext(**d)
     else:
-        proxy_disable_context = ProxyAppContext(
+        proxy_disable_context = window_state.ProxyAppContext(
             title=str(proxy_disable_setting),
             match='substring'
             )
 
 
-context = AeneaContext(proxy_disable_context, local_disable_context)
+context = window_state.WindowContext(
+    proxy_disable_context, local_disable_context)
+
+
 
-grammar = Grammar('multiedit', context=~context)
-grammar.add_rule(RepeatRule(extras=extras + [format_rule, Alternative(finishes, name='finish')], name='a'))
-grammar.add_rule(LiteralRule())
+def build_grammar(grammar):
+    grammar.add_rule(RepeatRule(extras=extras + [format_rule, Alternative(finishes, name='finish')], name='a'))
+    grammar.add_rule(LiteralRule())
 
+grammar = lazy_grammar.LazyGrammar(
+    'multiedit', context=~context, build=build_grammar)
 grammar.load()
 
 
@@ -335,7 +339,8 @@ def unload():
         MULTIEDIT_TAGS
         )
     for tag in MULTIEDIT_TAGS:
-        aenea.vocabulary.unregister_dynamic_vocabulary(tag)
+        vocabulary_index.unregister_dynamic_vocabulary(tag)
     if grammar:
         grammar.unload()
     grammar = None
+    elements.release('multiedit')
@@ -3,9 +3,57 @@
 # keyboard.
 #
 
+# Your mapleader, as a key name of a Key spec (e.g. 'comma', 'backslash').
 LEADER = 'comma'
+# The most commands and insertions that can be chained in one utterance.
+MAX_CHAIN = 10
+
+import abc
+import imp
+import os
+for _helper in ['batch_executor', 'command_chain', 'elements',
+                'formatting', 'lazy_grammar', 'vocabulary_index',
+                'window_state']:
+    try:
+        imp.find_module(_helper)
+    except ImportError:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        raise ImportError(
+            'You need to copy the "shared/%s.py" file to %s' % (_helper, dir))
+import batch_executor
+import command_chain
+import elements
+import formatting
+import lazy_grammar
+import vocabulary_index
+import window_state
+try:
+    imp.find_module('vim_filetype')
+except ImportError:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    raise ImportError('You need to copy the "vim_filetype.py" file to ' + dir)
+import vim_filetype
+try:
+    imp.find_module('vim_modes')
+except ImportError:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    raise ImportError('You need to copy the "vim_modes.py" file to ' + dir)
+import vim_modes
+try:
+    imp.find_module('vim_peephole')
+except ImportError:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    raise ImportError('You need to copy the "vim_peephole.py" file to ' + dir)
+import vim_peephole
+try:
+    imp.find_module('nvim_backend')
+except ImportError:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    raise ImportError('You need to copy the "nvim_backend.py" file to ' + dir)
+import nvim_backend
 
 import aenea.config
+import aenea.configuration
 import aenea.misc
 import aenea.vocabulary
 
@@ -15,35 +63,65 @@ from aenea import (
     Text
     )
 
-from aenea.proxy_contexts import ProxyAppContext
+from window_state import (
+    ProxyAppContext,
+    WindowContext,
+    )
 
 from dragonfly import (
     Alternative,
     AppContext,
     CompoundRule,
     Dictation,
-    Grammar,
     MappingRule,
-    Repetition,
-    RuleRef
+    RuleRef,
+    Sequence,
     )
 
-vim_context = aenea.wrappers.AeneaContext(
+vim_context = WindowContext(
     ProxyAppContext(match='regex', title='(?i).*VIM.*'),
     AppContext(title='VIM')
     )
 
-command_t_context = aenea.wrappers.AeneaContext(
+command_t_context = WindowContext(
     ProxyAppContext(match='regex', title='^GoToFile.*$'),
     AppContext(title='GoToFile')
     ) & vim_context
 
-fugitive_index_context = aenea.wrappers.AeneaContext(
+fugitive_index_context = WindowContext(
     ProxyAppContext(match='regex', title='^index.*\.git.*$'),
     AppContext(title='index') & AppContext('.git')
     ) & vim_context
 
-grammar = Grammar('vim', context=vim_context)
+conf = aenea.configuration.ConfigWatcher(('grammar_config', 'vim')).conf
+mode_tracker = vim_modes.VimModeTracker(
+    lazy_escape=conf.get('lazy_escape', False),
+    timeout=conf.get('lazy_escape_timeout', 30),
+    )
+nvim_sender = nvim_backend.NvimSender.from_config(conf)
+filetype_extensions = dict(vim_filetype.EXTENSIONS)
+filetype_extensions.update(
+    (str(extension), str(language))
+    for (extension, language) in conf.get('filetype_extensions', {}).iteritems())
+
+# Commands are typed as text, so the LEADER key name (as in a Key spec) is
+# typed as the character it stands for.
+_KEY_CHARACTERS = {
+    'comma': ',', 'backslash': '\\', 'space': ' ', 'semicolon': ';',
+    'colon': ':', 'slash': '/', 'dot': '.', 'minus': '-', 'hyphen': '-',
+    'plus': '+', 'equal': '=', 'underscore': '_', 'backtick': '`',
+    'tilde': '~', 'bar': '|', 'squote': "'", 'apostrophe': "'",
+    'dquote': '"', 'quote': '"', 'exclamation': '!', 'bang': '!',
+    'at': '@', 'hash': '#', 'dollar': '$', 'percent': '%', 'caret': '^',
+    'and': '&', 'ampersand': '&', 'star': '*', 'asterisk': '*',
+    'question': '?', 'langle': '<', 'rangle': '>', 'lparen': '(',
+    'rparen': ')', 'lbracket': '[', 'rbracket': ']', 'lbrace': '{',
+    'rbrace': '}',
+    }
+leader = _KEY_CHARACTERS.get(LEADER, LEADER)
+if len(leader) != 1:
+    raise ValueError('LEADER must be a key name or a character, not %r'
+                     % LEADER)
 
 from dragonfly import DictListRef
 
@@ -51,46 +129,57 @@ VIM_TAGS = ['vim.insertions.code', 'vim.insertions']
 aenea.vocabulary.inhibit_global_dynamic_vocabulary('vim', VIM_TAGS, vim_context)
 
 
-# TODO: this can NOT be the right way to do this...
-class NumericDelegateRule(CompoundRule):
+class DelegateRule(CompoundRule):
+    '''
+    A CompoundRule whose value is built from the values of the top level
+    elements of its spec. Each element's value is computed exactly once and
+    passed to delegate_value() in spec order, so nested rules aren't
+    re-evaluated every time a parent looks at them.
+    '''
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, *args, **kwargs):
+        CompoundRule.__init__(self, *args, **kwargs)
+        # The spec compiles to a Sequence of its top level elements, or to
+        # the element itself if it has only one.
+        self._single_element = (
+            type(self.element.children[0]) is not Sequence)
+
     def value(self, node):
-        delegates = node.children[0].children[0].children
-        value = delegates[-1].value()
-        if delegates[0].value() is not None:
-            return Text('%s' % delegates[0].value()) + value
+        spec_node = node.children[0].children[0]
+        if self._single_element:
+            delegates = [spec_node]
         else:
-            return value
+            delegates = spec_node.children
+        return self.delegate_value(
+            *[delegate.value() for delegate in delegates])
 
+    @abc.abstractmethod
+    def delegate_value(self, *values):
+        '''Returns the rule's value from those of its spec's elements.'''
 
-class _DigitalIntegerFetcher(object):
-    def __init__(self):
-        self.cached = {}
 
-    def __getitem__(self, length):
-        if length not in self.cached:
-            self.cached[length] = aenea.misc.DigitalInteger('count', 1, length)
-        return self.cached[length]
-ruleDigitalInteger = _DigitalIntegerFetcher()
+class NumericDelegateRule(DelegateRule):
+    def delegate_value(self, count, value):
+        if count is not None:
+            return '%s%s' % (count, value)
+        else:
+            return value
 
 
-class LetterMapping(MappingRule):
-    mapping = aenea.misc.LETTERS
-ruleLetterMapping = RuleRef(LetterMapping(), name='LetterMapping')
+ruleDigitalInteger = elements.digital_integer('count', 1, 3)
+ruleLetterMapping = elements.letter_ref('LetterMapping', 'vim')
 
 
-def execute_insertion_buffer(insertion_buffer):
+def execute_insertion_buffer(insertion_buffer, batch, modes):
     if not insertion_buffer:
         return
 
-    if insertion_buffer[0][0] is not None:
-        insertion_buffer[0][0].execute()
-    else:
-        Key('a').execute()
+    batch.extend(modes.insert(insertion_buffer[0][0]))
 
     for insertion in insertion_buffer:
-        insertion[1].execute()
-
-    Key('escape:2').execute()
+        batch.add(insertion[1])
 
 # ****************************************************************************
 # IDENTIFIERS
@@ -107,85 +196,15 @@ class InsertModeEntry(MappingRule):
 ruleInsertModeEntry = RuleRef(InsertModeEntry(), name='InsertModeEntry')
 
 
-def format_snakeword(text):
-    formatted = text[0][0].upper()
-    formatted += text[0][1:]
-    formatted += ('_' if len(text) > 1 else '')
-    formatted += format_score(text[1:])
-    return formatted
-
-
-def format_score(text):
-    return '_'.join(text)
-
-
-def format_camel(text):
-    return text[0] + ''.join([word[0].upper() + word[1:] for word in text[1:]])
-
-
-def format_proper(text):
-    return ''.join(word.capitalize() for word in text)
-
-
-def format_relpath(text):
-    return '/'.join(text)
-
-
-def format_abspath(text):
-    return '/' + format_relpath(text)
-
-
-def format_scoperesolve(text):
-    return '::'.join(text)
-
-
-def format_jumble(text):
-    return ''.join(text)
-
-
-def format_dotword(text):
-    return '.'.join(text)
-
-
-def format_dashword(text):
-    return '-'.join(text)
-
-
-def format_natword(text):
-    return ' '.join(text)
-
-
-def format_broodingnarrative(text):
-    return ''
-
-
-def format_sentence(text):
-    return ' '.join([text[0].capitalize()] + text[1:])
-
-
 class IdentifierInsertion(CompoundRule):
     spec = ('[upper | natural] ( proper | camel | rel-path | abs-path | score | sentence |'
             'scope-resolve | jumble | dotword | dashword | natword | snakeword | brooding-narrative) [<dictation>]')
     extras = [Dictation(name='dictation')]
 
     def value(self, node):
-        words = node.words()
-
-        uppercase = words[0] == 'upper'
-        lowercase = words[0] != 'natural'
-
-        if lowercase:
-            words = [word.lower() for word in words]
-        if uppercase:
-            words = [word.upper() for word in words]
-
-        words = [word.split('\\', 1)[0].replace('-', '') for word in words]
-        if words[0].lower() in ('upper', 'natural'):
-            del words[0]
-
-        function = globals()['format_%s' % words[0].lower()]
-        formatted = function(words[1:])
-
+        formatted = formatting.format_words(node.words())
+        if not formatted:
+            return NoAction()
         return Text(formatted)
 ruleIdentifierInsertion = RuleRef(
     IdentifierInsertion(),
@@ -193,13 +212,12 @@ ruleIdentifierInsertion = RuleRef(
     )
 
 
-class LiteralIdentifierInsertion(CompoundRule):
+class LiteralIdentifierInsertion(DelegateRule):
     spec = '[<InsertModeEntry>] literal <IdentifierInsertion>'
     extras = [ruleIdentifierInsertion, ruleInsertModeEntry]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        return [('i', (children[0].value(), children[2].value()))]
+    def delegate_value(self, entry, literal, identifier):
+        return [('i', (entry, identifier))]
 ruleLiteralIdentifierInsertion = RuleRef(
     LiteralIdentifierInsertion(),
     name='LiteralIdentifierInsertion'
@@ -219,7 +237,7 @@ class KeyInsertion(MappingRule):
         'scratch [<count>]':    Key('backspace:%(count)d'),
         'ack':                  Key('escape'),
         }
-    extras = [ruleDigitalInteger[3]]
+    extras = [ruleDigitalInteger]
     defaults = {'count': 1}
 ruleKeyInsertion = RuleRef(KeyInsertion(), name='KeyInsertion')
 
@@ -266,26 +284,26 @@ primitive_insertions = [
     ruleIdentifierInsertion,
     DictListRef(
         'dynamic vim.insertions.code',
-        aenea.vocabulary.register_dynamic_vocabulary('vim.insertions.code')
+        vocabulary_index.dynamic_vocabulary('vim.insertions.code')
         ),
     DictListRef(
         'dynamic vim.insertions',
-        aenea.vocabulary.register_dynamic_vocabulary('vim.insertions')
+        vocabulary_index.dynamic_vocabulary('vim.insertions')
         ),
     ruleArithmeticInsertion,
     ruleSpellingInsertion,
     ]
 
 
-static_code_insertions = aenea.vocabulary.get_static_vocabulary('vim.insertions.code')
-static_insertions = aenea.vocabulary.get_static_vocabulary('vim.insertions')
+static_code_insertions = vocabulary_index.static_vocabulary('vim.insertions.code')
+static_insertions = vocabulary_index.static_vocabulary('vim.insertions')
 
 if static_code_insertions:
     primitive_insertions.append(
         RuleRef(
             MappingRule(
                 'static vim.insertions,code mapping',
-                mapping=aenea.vocabulary.get_static_vocabulary('vim.insertions.code')
+                mapping=static_code_insertions
                 ),
             'static vim.insertions.code'
             )
@@ -296,48 +314,44 @@ if static_insertions:
         RuleRef(
             MappingRule(
                 'static vim.insertions mapping',
-                mapping=aenea.vocabulary.get_static_vocabulary('vim.insertions')
+                mapping=static_insertions
                 ),
             'static vim.insertions'
             )
         )
 
 
-class PrimitiveInsertion(CompoundRule):
+class PrimitiveInsertion(DelegateRule):
     spec = '<insertion>'
     extras = [Alternative(primitive_insertions, name='insertion')]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        return children[0].value()
+    def delegate_value(self, insertion):
+        return insertion
 rulePrimitiveInsertion = RuleRef(
     PrimitiveInsertion(),
     name='PrimitiveInsertion'
     )
 
 
-class PrimitiveInsertionRepetition(CompoundRule):
+class PrimitiveInsertionRepetition(DelegateRule):
     spec = '<PrimitiveInsertion> [ parrot <count> ]'
-    extras = [rulePrimitiveInsertion, ruleDigitalInteger[3]]
+    extras = [rulePrimitiveInsertion, ruleDigitalInteger]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        holder = children[1].value()[1] if children[1].value() else 1
-        value = children[0].value() * holder
-        return value
+    def delegate_value(self, insertion, repetition):
+        holder = repetition[1] if repetition else 1
+        return batch_executor.repeated(insertion, holder)
 rulePrimitiveInsertionRepetition = RuleRef(
     PrimitiveInsertionRepetition(),
     name='PrimitiveInsertionRepetition'
     )
 
 
-class Insertion(CompoundRule):
+class Insertion(DelegateRule):
     spec = '[<InsertModeEntry>] <PrimitiveInsertionRepetition>'
     extras = [rulePrimitiveInsertionRepetition, ruleInsertModeEntry]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        return [('i', (children[0].value(), children[1].value()))]
+    def delegate_value(self, entry, insertion):
+        return [('i', (entry, insertion))]
 ruleInsertion = RuleRef(Insertion(), name='Insertion')
 
 
@@ -348,74 +362,74 @@ ruleInsertion = RuleRef(Insertion(), name='Insertion')
 
 class PrimitiveMotion(MappingRule):
     mapping = {
-        'up': Text('k'),
-        'down': Text('j'),
-        'left': Text('h'),
-        'right': Text('l'),
+        'up': 'k',
+        'down': 'j',
+        'left': 'h',
+        'right': 'l',
 
-        'lope': Text('b'),
-        'yope': Text('w'),
-        'elope': Text('ge'),
-        'iyope': Text('e'),
+        'lope': 'b',
+        'yope': 'w',
+        'elope': 'ge',
+        'iyope': 'e',
 
-        'lopert': Text('B'),
-        'yopert': Text('W'),
-        'elopert': Text('gE'),
-        'eyopert': Text('E'),
+        'lopert': 'B',
+        'yopert': 'W',
+        'elopert': 'gE',
+        'eyopert': 'E',
 
-        'apla': Text('{'),
-        'anla': Text('}'),
-        'sapla': Text('('),
-        'sanla': Text(')'),
+        'apla': '{',
+        'anla': '}',
+        'sapla': '(',
+        'sanla': ')',
 
-        'care': Text('^'),
-        'hard care': Text('0'),
-        'doll': Text('$'),
+        'care': '^',
+        'hard care': '0',
+        'doll': '$',
 
-        'screecare': Text('g^'),
-        'screedoll': Text('g$'),
+        'screecare': 'g^',
+        'screedoll': 'g$',
 
-        'scree up': Text('gk'),
-        'scree down': Text('gj'),
+        'scree up': 'gk',
+        'scree down': 'gj',
 
-        'wynac': Text('G'),
+        'wynac': 'G',
 
-        'wynac top': Text('H'),
-        'wynac toe': Text('L'),
+        'wynac top': 'H',
+        'wynac toe': 'L',
 
         # CamelCaseMotion plugin
-        'calalope': Text(',b'),
-        'calayope': Text(',w'),
-        'end calayope': Text(',e'),
-        'inner calalope': Text('i,b'),
-        'inner calayope': Text('i,w'),
-        'inner end calayope': Text('i,e'),
+        'calalope': ',b',
+        'calayope': ',w',
+        'end calayope': ',e',
+        'inner calalope': 'i,b',
+        'inner calayope': 'i,w',
+        'inner end calayope': 'i,e',
 
         # EasyMotion
-        'easy lope': Key('%s:2, b' % LEADER),
-        'easy yope': Key('%s:2, w' % LEADER),
-        'easy elope': Key('%s:2, g, e' % LEADER),
-        'easy iyope': Key('%s:2, e' % LEADER),
-
-        'easy lopert': Key('%s:2, B' % LEADER),
-        'easy yopert': Key('%s:2, W' % LEADER),
-        'easy elopert': Key('%s:2, g, E' % LEADER),
-        'easy eyopert': Key('%s:2, E' % LEADER),
+        'easy lope': leader * 2 + 'b',
+        'easy yope': leader * 2 + 'w',
+        'easy elope': leader * 2 + 'ge',
+        'easy iyope': leader * 2 + 'e',
+
+        'easy lopert': leader * 2 + 'B',
+        'easy yopert': leader * 2 + 'W',
+        'easy elopert': leader * 2 + 'gE',
+        'easy eyopert': leader * 2 + 'E',
         }
 
     for (spoken_object, command_object) in (('(lope | yope)', 'w'),
                                             ('(lopert | yopert)', 'W')):
         for (spoken_modifier, command_modifier) in (('inner', 'i'),
                                                     ('outer', 'a')):
-            map_action = Text(command_modifier + command_object)
+            map_action = command_modifier + command_object
             mapping['%s %s' % (spoken_modifier, spoken_object)] = map_action
 rulePrimitiveMotion = RuleRef(PrimitiveMotion(), name='PrimitiveMotion')
 
 
 class UncountedMotion(MappingRule):
     mapping = {
-        'tect': Text('%%'),
-        'matu': Text('M'),
+        'tect': '%',
+        'matu': 'M',
         }
 ruleUncountedMotion = RuleRef(UncountedMotion(), name='UncountedMotion')
 
@@ -433,13 +447,12 @@ ruleMotionParameterMotion = RuleRef(
     )
 
 
-class ParameterizedMotion(CompoundRule):
+class ParameterizedMotion(DelegateRule):
     spec = '<MotionParameterMotion> <LetterMapping>'
     extras = [ruleLetterMapping, ruleMotionParameterMotion]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        return Text(children[0].value() + children[1].value())
+    def delegate_value(self, motion, letter):
+        return motion + letter
 ruleParameterizedMotion = RuleRef(
     ParameterizedMotion(),
     name='ParameterizedMotion'
@@ -448,22 +461,22 @@ ruleParameterizedMotion = RuleRef(
 
 class CountedMotion(NumericDelegateRule):
     spec = '[<count>] <motion>'
-    extras = [ruleDigitalInteger[3],
+    extras = [ruleDigitalInteger,
               Alternative([
                   rulePrimitiveMotion,
                   ruleParameterizedMotion], name='motion')]
 ruleCountedMotion = RuleRef(CountedMotion(), name='CountedMotion')
 
 
-class Motion(CompoundRule):
+class Motion(DelegateRule):
     spec = '<motion>'
     extras = [Alternative(
         [ruleCountedMotion, ruleUncountedMotion],
         name='motion'
         )]
 
-    def value(self, node):
-        return node.children[0].children[0].children[0].value()
+    def delegate_value(self, motion):
+        return motion
 
 ruleMotion = RuleRef(Motion(), name='Motion')
 
@@ -491,29 +504,27 @@ _OPERATORS = {
 
 
 class PrimitiveOperator(MappingRule):
-    mapping = dict((key, Text(val)) for (key, val) in _OPERATORS.iteritems())
+    mapping = dict(_OPERATORS)
     # tComment
-    mapping['comm nop'] = Text('gc')
+    mapping['comm nop'] = 'gc'
 rulePrimitiveOperator = RuleRef(PrimitiveOperator(), name='PrimitiveOperator')
 
 
 class Operator(NumericDelegateRule):
     spec = '[<count>] <PrimitiveOperator>'
-    extras = [ruleDigitalInteger[3],
+    extras = [ruleDigitalInteger,
               rulePrimitiveOperator]
 ruleOperator = RuleRef(Operator(), name='Operator')
 
 
-class OperatorApplicationMotion(CompoundRule):
+class OperatorApplicationMotion(DelegateRule):
     spec = '[<Operator>] <Motion>'
     extras = [ruleOperator, ruleMotion]
 
-    def value(self, node):
-        children = node.children[0].children[0].children
-        return_value = children[1].value()
-        if children[0].value() is not None:
-            return_value = children[0].value() + return_value
-        return return_value
+    def delegate_value(self, operator, motion):
+        if operator is not None:
+            return operator + motion
+        return motion
 ruleOperatorApplicationMotion = RuleRef(
     OperatorApplicationMotion(),
     name='OperatorApplicationMotion'
@@ -521,25 +532,26 @@ ruleOperatorApplicationMotion = RuleRef(
 
 
 class OperatorSelfApplication(MappingRule):
-    mapping = dict(('%s [<count>] %s' % (key, key), Text('%s%%(count)d%s' % (value, value)))
+    mapping = dict(('%s [<count>] %s' % (key, key), '%s%%(count)d%s' % (value, value))
                    for (key, value) in _OPERATORS.iteritems())
     # tComment
     # string not action intentional dirty hack.
     mapping['comm nop [<count>] comm nop'] = 'tcomment'
-    extras = [ruleDigitalInteger[3]]
+    extras = [ruleDigitalInteger]
     defaults = {'count': 1}
 
     def value(self, node):
         value = MappingRule.value(self, node)
+        count = node.children[0].children[0].children[0].children[1].value()
+        count = int(count) if count is not None else 1
         if value == 'tcomment':
             # ugly hack to get around tComment's not allowing ranges with gcc.
-            value = node.children[0].children[0].children[0].children[1].value()
-            if value in (1, '1', None):
-                return Text('gcc')
+            if count == 1:
+                return 'gcc'
             else:
-                return Text('gc%dj' % (int(value) - 1))
+                return 'gc%dj' % (count - 1)
         else:
-            return value
+            return value % {'count': count}
 
 ruleOperatorSelfApplication = RuleRef(
     OperatorSelfApplication(),
@@ -558,49 +570,53 @@ ruleOperatorApplication = Alternative([ruleOperatorApplicationMotion,
 
 class PrimitiveCommand(MappingRule):
     mapping = {
-        'vim scratch': Key('X'),
-        'vim chuck': Key('x'),
-        'vim undo': Key('u'),
-        'plap': Key('P'),
-        'plop': Key('p'),
-        'ditto': Text('.'),
+        'vim scratch': 'X',
+        'vim chuck': 'x',
+        'vim undo': 'u',
+        'plap': 'P',
+        'plop': 'p',
+        'ditto': '.',
         'ripple': 'macro',
         }
 rulePrimitiveCommand = RuleRef(PrimitiveCommand(), name='PrimitiveCommand')
 
 
-class Command(CompoundRule):
+class Command(DelegateRule):
     spec = '[<count>] [reg <LetterMapping>] <command>'
     extras = [Alternative([ruleOperatorApplication,
                            rulePrimitiveCommand,
                            ], name='command'),
-              ruleDigitalInteger[3],
+              ruleDigitalInteger,
               ruleLetterMapping]
 
+    # Spoken operators that leave vim in insert mode.
+    insert_mode_words = frozenset(
+        key for (key, value) in _OPERATORS.iteritems() if value == 'c'
+        )
+
     def value(self, node):
-        delegates = node.children[0].children[0].children
-        value = delegates[-1].value()
+        commands = DelegateRule.value(self, node)
+        # TODO: ugly hack; should fix the grammar or generalize.
+        if not self.insert_mode_words.isdisjoint(node.words()):
+            commands.append(('i', (NoAction(),) * 2))
+        return commands
+
+    def delegate_value(self, count, register, value):
         prefix = ''
-        if delegates[0].value() is not None:
-            prefix += str(delegates[0].value())
-        if delegates[1].value() is not None:
+        if count is not None:
+            prefix += str(count)
+        if register is not None:
             # Hack for macros
-            reg = delegates[1].value()[1]
+            reg = register[1]
             if value == 'macro':
                 prefix += '@' + reg
-                value = None
+                value = ''
             else:
                 prefix += "'" + reg
-        if prefix:
-            if value is not None:
-                value = Text(prefix) + value
-            else:
-                value = Text(prefix)
-        # TODO: ugly hack; should fix the grammar or generalize.
-        if 'chaos' in zip(*node.results)[0]:
-            return [('c', value), ('i', (NoAction(),) * 2)]
-        else:
-            return [('c', value)]
+        if value == 'macro':
+            # No register to play back.
+            value = ''
+        return [('c', prefix + value)]
 ruleCommand = RuleRef(Command(), name='Command')
 
 
@@ -609,10 +625,18 @@ ruleCommand = RuleRef(Command(), name='Command')
 
 class VimCommand(CompoundRule):
     spec = ('[<app>] [<literal>]')
-    extras = [Repetition(Alternative([ruleCommand, RuleRef(Insertion())]), max=10, name='app'),
+    extras = [command_chain.chain(Alternative([ruleCommand, RuleRef(Insertion())]), max=MAX_CHAIN, name='app'),
               RuleRef(LiteralIdentifierInsertion(), name='literal')]
 
+    def _process_begin(self):
+        vocabulary_index.refresh()
+        # Only the code vocabulary of the language being edited is active.
+        vocabulary_index.set_language('vim.insertions.code', vim_filetype.language(
+            window_state.state.title(), filetype_extensions))
+
     def _process_recognition(self, node, extras):
+        batch = batch_executor.ActionBatch(nvim_sender)
+        modes = mode_tracker.session()
         insertion_buffer = []
         commands = []
         if 'app' in extras:
@@ -620,26 +644,36 @@ class VimCommand(CompoundRule):
                 commands.extend(chunk)
         if 'literal' in extras:
             commands.extend(extras['literal'])
-        for command in commands:
+        for command in vim_peephole.optimize(commands):
             mode, command = command
             if mode == 'i':
                 insertion_buffer.append(command)
             else:
-                execute_insertion_buffer(insertion_buffer)
+                execute_insertion_buffer(insertion_buffer, batch, modes)
                 insertion_buffer = []
-                command.execute(extras)
-        execute_insertion_buffer(insertion_buffer)
+                batch.extend(modes.normal())
+                batch.add(Text(command.replace('%', '%%')), extras)
+        execute_insertion_buffer(insertion_buffer, batch, modes)
+        batch.extend(modes.finish())
+        batch.execute()
+
 
-grammar.add_rule(VimCommand())
+def build_grammar(grammar):
+    grammar.add_rule(VimCommand())
 
+grammar = lazy_grammar.LazyGrammar(
+    'vim', context=vim_context, build=build_grammar)
 grammar.load()
 
 
 def unload():
     aenea.vocabulary.uninhibit_global_dynamic_vocabulary('vim', VIM_TAGS)
     for tag in VIM_TAGS:
-        aenea.vocabulary.unregister_dynamic_vocabulary(tag)
+        vocabulary_index.unregister_dynamic_vocabulary(tag)
     global grammar
     if grammar:
         grammar.unload()
     grammar = None
+    elements.release('vim')
+    if nvim_sender is not None:
+        nvim_sender.close()
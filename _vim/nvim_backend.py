@@ -0,0 +1,270 @@
+'''
+Optional backend that types vim keys through Neovim's msgpack-RPC socket.
+
+Instead of synthesizing every keystroke through the proxy, the whole
+utterance is translated into vim key notation and sent to the editor as one
+``nvim_input`` notification. Anyone who can reach the socket can run any
+command in Neovim, so only listen on an address the grammar's host alone can
+reach: the host-only network of the VM Aenea runs in, or ``127.0.0.1`` with
+the port forwarded to the VM, for example::
+
+    nvim --listen 192.168.56.1:6666
+
+and set ``nvim_address`` in ``grammar_config/vim.json`` to ``host:port`` (or a
+Unix socket path). Without an address the ``NVIM`` and
+``NVIM_LISTEN_ADDRESS`` environment variables are tried.
+
+The socket doesn't tell which window Neovim is in, so keys are only sent to
+it while the focused window's title matches ``nvim_title`` (by default
+"NVIM", which Neovim's default title ends with). In any other vim window, if
+the connection fails, or if the utterance contains something that can't be
+expressed as vim keys, the events are sent as keystrokes as usual.
+
+Only the little of msgpack that the request needs is implemented, so no
+extra package has to be installed.
+'''
+
+import os
+import re
+import select
+import socket
+import struct
+
+import aenea.communications
+
+import window_state
+
+# Names used by Aenea's Key specs -> vim key notation.
+_KEY_NAMES = {
+    'escape': '<Esc>',
+    'enter': '<CR>',
+    'return': '<CR>',
+    'space': '<Space>',
+    'tab': '<Tab>',
+    'backspace': '<BS>',
+    'del': '<Del>',
+    'delete': '<Del>',
+    'insert': '<Insert>',
+    'up': '<Up>',
+    'down': '<Down>',
+    'left': '<Left>',
+    'right': '<Right>',
+    'home': '<Home>',
+    'end': '<End>',
+    'pgup': '<PageUp>',
+    'pgdown': '<PageDown>',
+    'ampersand': '&',
+    'apostrophe': "'",
+    'asterisk': '*',
+    'at': '@',
+    'backslash': '\\',
+    'backtick': '`',
+    'bar': '|',
+    'caret': '^',
+    'colon': ':',
+    'comma': ',',
+    'dollar': '$',
+    'dot': '.',
+    'dquote': '"',
+    'equal': '=',
+    'exclamation': '!',
+    'hash': '#',
+    'hyphen': '-',
+    'langle': '<lt>',
+    'lbrace': '{',
+    'lbracket': '[',
+    'lparen': '(',
+    'minus': '-',
+    'percent': '%',
+    'plus': '+',
+    'question': '?',
+    'rangle': '>',
+    'rbrace': '}',
+    'rbracket': ']',
+    'rparen': ')',
+    'semicolon': ';',
+    'slash': '/',
+    'squote': "'",
+    'tilde': '~',
+    'underscore': '_',
+    }
+_KEY_NAMES.update(('f%d' % n, '<F%d>' % n) for n in range(1, 13))
+
+_MODIFIERS = {
+    'c': 'C', 'control': 'C', 'ctrl': 'C',
+    's': 'S', 'shift': 'S',
+    'a': 'A', 'alt': 'A',
+    'w': 'D', 'super': 'D',
+    }
+
+_TEXT_CHARACTERS = {
+    '<': '<lt>',
+    '\n': '<CR>',
+    '\t': '<Tab>',
+    }
+
+
+class UntranslatableError(ValueError):
+    pass
+
+
+def _key_notation(key, modifiers):
+    if len(key) == 1:
+        notation = _TEXT_CHARACTERS.get(key, key)
+    elif key in _KEY_NAMES:
+        notation = _KEY_NAMES[key]
+    else:
+        raise UntranslatableError('No vim notation for key %r' % key)
+    if not modifiers:
+        return notation
+
+    try:
+        prefix = ''.join(_MODIFIERS[modifier] + '-' for modifier in modifiers)
+    except KeyError:
+        raise UntranslatableError('Unknown modifiers %r' % (modifiers,))
+    if notation.startswith('<') and len(notation) > 1:
+        notation = notation[1:-1]
+    return '<%s%s>' % (prefix, notation)
+
+
+def to_vim_keys(commands):
+    '''
+    Translates merged proxy events into one string of vim key notation, e.g.
+    ``[('write_text', (), {'text': 'd5j'}), ('key_press', (), {'key':
+    'escape', 'count': 2})]`` becomes ``'d5j<Esc><Esc>'``.
+    '''
+    keys = []
+    for command in commands:
+        name, args, kwargs = command
+        if args:
+            raise UntranslatableError('Unexpected arguments in %r' % (command,))
+        if name == 'write_text':
+            keys.extend(_TEXT_CHARACTERS.get(character, character)
+                        for character in kwargs['text'])
+        elif name == 'key_press':
+            if kwargs.get('direction', 'press') != 'press':
+                raise UntranslatableError('Only key presses can be translated')
+            notation = _key_notation(kwargs['key'], kwargs.get('modifiers') or [])
+            keys.append(notation * kwargs.get('count', 1))
+        else:
+            raise UntranslatableError('Cannot translate %r' % name)
+    return ''.join(keys)
+
+
+def _pack(value):
+    '''Encodes the msgpack subset used by requests: ints, strings, arrays.'''
+    if isinstance(value, bool) or value is None:
+        raise TypeError('Unsupported msgpack value %r' % (value,))
+    if isinstance(value, (int, long)):
+        if 0 <= value < 0x80:
+            return struct.pack('B', value)
+        return '\xce' + struct.pack('>I', value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    if isinstance(value, str):
+        length = len(value)
+        if length < 32:
+            return struct.pack('B', 0xa0 | length) + value
+        if length < 0x100:
+            return '\xd9' + struct.pack('B', length) + value
+        if length < 0x10000:
+            return '\xda' + struct.pack('>H', length) + value
+        return '\xdb' + struct.pack('>I', length) + value
+    if isinstance(value, (list, tuple)):
+        length = len(value)
+        if length < 16:
+            header = struct.pack('B', 0x90 | length)
+        else:
+            header = '\xdc' + struct.pack('>H', length)
+        return header + ''.join(_pack(item) for item in value)
+    raise TypeError('Unsupported msgpack value %r' % (value,))
+
+
+def _parse_address(address):
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        if not port.isdigit():
+            raise socket.error('Invalid Neovim address %r' % address)
+        return socket.AF_INET, (host, int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise socket.error('Unix sockets are not supported on this platform')
+    return socket.AF_UNIX, address
+
+
+class NvimSender(object):
+    '''
+    Batch sender (see batch_executor.ActionBatch) that delivers an utterance to
+    Neovim, falling back to keystrokes through the proxy.
+    '''
+
+    def __init__(self, address, timeout=0.5, title='(?i)nvim'):
+        self.address = address
+        self.timeout = timeout
+        self.title = re.compile(title)
+        self._socket = None
+
+    @classmethod
+    def from_config(cls, conf):
+        address = (conf.get('nvim_address') or
+                   os.environ.get('NVIM') or
+                   os.environ.get('NVIM_LISTEN_ADDRESS'))
+        if not address:
+            return None
+        return cls(str(address), conf.get('nvim_timeout', 0.5),
+                   conf.get('nvim_title', '(?i)nvim'))
+
+    def _connect(self):
+        family, address = _parse_address(self.address)
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        connection.connect(address)
+        return connection
+
+    def _stale(self):
+        '''
+        Whether Neovim closed the connection. It never writes to it otherwise,
+        and writing to a closed connection can succeed and lose the keys.
+        '''
+        try:
+            readable = select.select([self._socket], [], [], 0)[0]
+            return bool(readable) and not self._socket.recv(1, socket.MSG_PEEK)
+        except (socket.error, select.error, OSError):
+            return True
+
+    def send_keys(self, keys):
+        '''Sends ``keys`` (in vim notation) in one notification message.'''
+        message = _pack([2, 'nvim_input', [keys]])
+        if self._socket is not None and self._stale():
+            self.close()
+        for attempt in range(2):
+            try:
+                if self._socket is None:
+                    self._socket = self._connect()
+                self._socket.sendall(message)
+                return
+            except (socket.error, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except (socket.error, OSError):
+                pass
+        self._socket = None
+
+    def focused(self):
+        '''Whether the focused window looks like the Neovim at the socket.'''
+        return bool(self.title.search(window_state.state.title()))
+
+    def __call__(self, commands):
+        if not self.focused():
+            aenea.communications.server.execute_batch(commands)
+            return
+        try:
+            self.send_keys(to_vim_keys(commands))
+        except (UntranslatableError, socket.error, OSError) as error:
+            print 'Neovim backend unavailable (%s), sending keystrokes' % error
+            aenea.communications.server.execute_batch(commands)
@@ -0,0 +1,64 @@
+r'''
+Works out the language of the file being edited in VIM from its window
+title, so the grammar only offers that language's vocabulary.
+
+VIM's default title starts with the file name, e.g. "views.py + (~/project) -
+VIM", and the language is looked up from its extension. A filetype hint in
+the title wins over the extension, and also covers files without one: add
+``ft=%{&filetype}`` to 'titlestring', e.g.::
+
+    set title titlestring=%t%(\ %M%)\ ft=%{&filetype}\ -\ VIM
+
+Languages are named as VIM names filetypes ("python", "cpp", ...), which is
+what vocabularies list under "languages".
+'''
+
+import re
+
+# Extension -> language.
+EXTENSIONS = {
+    'c': 'c',
+    'h': 'c',
+    'cc': 'cpp',
+    'cpp': 'cpp',
+    'cxx': 'cpp',
+    'hh': 'cpp',
+    'hpp': 'cpp',
+    'cs': 'cs',
+    'go': 'go',
+    'hs': 'haskell',
+    'java': 'java',
+    'js': 'javascript',
+    'lua': 'lua',
+    'pl': 'perl',
+    'php': 'php',
+    'py': 'python',
+    'pyw': 'python',
+    'rb': 'ruby',
+    'rs': 'rust',
+    'scala': 'scala',
+    'sh': 'sh',
+    'bash': 'sh',
+    'tex': 'tex',
+    'ts': 'typescript',
+    'vim': 'vim',
+}
+
+_HINT = re.compile(r'\bft=(\w+)')
+# The extension of the file name the title starts with, which VIM may
+# precede with a path.
+_FILE_NAME = re.compile(r'^\s*(?:\S*/)?[^\s/]*\.(\w+)(?:\s|$)')
+
+
+def language(title, extensions=EXTENSIONS):
+    '''
+    Returns the language of the file in a VIM window's title, or None if it
+    can't be told.
+    '''
+    hint = _HINT.search(title)
+    if hint is not None:
+        return hint.group(1).lower()
+    match = _FILE_NAME.match(title)
+    if match is not None:
+        return extensions.get(match.group(1).lower())
+    return None
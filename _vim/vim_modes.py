@@ -0,0 +1,90 @@
+'''
+Tracks which mode each vim window was left in, so the vim grammar only
+toggles modes when it has to.
+
+By default every utterance starts and ends in normal mode (see
+KNOWN_PROBLEMS). With ``lazy_escape`` enabled in ``grammar_config/vim.json``,
+an utterance that ends with an insertion leaves the window in insert mode, and
+the next insertion into the same window carries on typing instead of paying
+for ``escape:2`` followed by ``a``. Any normal mode command still escapes
+first.
+
+If you press escape on the keyboard in between, the grammar can't know about
+it, so insert mode is only reused for ``lazy_escape_timeout`` seconds after the
+last utterance.
+'''
+
+import time
+
+import window_state
+
+from aenea import Key
+
+NORMAL = 'normal'
+INSERT = 'insert'
+
+
+def current_window():
+    '''Returns something that identifies the focused (possibly remote) window.'''
+    return window_state.state.window_id()
+
+
+class VimModeTracker(object):
+    def __init__(self, lazy_escape=False, timeout=30):
+        self.lazy_escape = lazy_escape
+        self.timeout = timeout
+        # window -> (mode, time the mode was recorded)
+        self._windows = {}
+
+    def session(self):
+        '''Starts tracking the mode for one utterance in the focused window.'''
+        window = current_window() if self.lazy_escape else None
+        mode, recorded = self._windows.pop(window, (NORMAL, None))
+        fresh = recorded is not None and time.time() - recorded < self.timeout
+        return VimModeSession(self, window, mode, fresh)
+
+    def _finish(self, window, mode):
+        if mode == INSERT:
+            self._windows[window] = (mode, time.time())
+
+
+class VimModeSession(object):
+    '''
+    Emits only the mode changes one utterance needs. Each method returns the
+    actions to add to the batch before the caller's own actions.
+    '''
+
+    leave_insert = Key('escape:2')
+    default_entry = Key('a')
+
+    def __init__(self, tracker, window, mode, fresh):
+        self._tracker = tracker
+        self._window = window
+        self.mode = mode
+        self._fresh = fresh
+
+    def insert(self, entry=None):
+        '''
+        Enters insert mode with ``entry`` (an InsertModeEntry action), or with
+        ``a`` if it is None.
+        '''
+        if self.mode == INSERT and entry is None and self._fresh:
+            return []
+        actions = self.normal()
+        actions.append(entry if entry is not None else self.default_entry)
+        self.mode = INSERT
+        self._fresh = True
+        return actions
+
+    def normal(self):
+        if self.mode == NORMAL:
+            return []
+        self.mode = NORMAL
+        return [self.leave_insert]
+
+    def finish(self):
+        '''Ends the utterance, leaving insert mode unless lazy escape is on.'''
+        if self._tracker.lazy_escape and self.mode == INSERT:
+            self._tracker._finish(self._window, self.mode)
+            return []
+        return self.normal()
@@ -0,0 +1,136 @@
+'''
+Peephole optimizer for the commands one vim utterance produces.
+
+The vim grammar turns each spoken command into a ``('c', keys)`` item, where
+``keys`` is the string of normal mode keys to type, and each insertion into an
+``('i', (entry, action))`` item. ``optimize`` rewrites that list so fewer keys
+are sent, without changing what vim does:
+
+- Counts on both sides of one of vim's own operators are multiplied, as vim
+  does itself: ``2d3w`` becomes ``6dw`` and ``d1d`` becomes ``dd``.
+- A count of one is dropped where vim treats it like no count: ``1j`` is ``j``
+  but ``1G`` stays as it is.
+- Consecutive counted moves in the same direction are added up: ``3j`` then
+  ``2j`` becomes ``5j``. Opposite moves such as ``5j5k`` are kept, because
+  vim clamps them at the edges of the buffer and they don't always cancel.
+- Commands that type nothing are dropped, as is an insertion that types nothing
+  and would only enter and leave insert mode.
+- Adjacent commands are joined into one string of keys.
+
+Anything that doesn't match these patterns is passed through untouched.
+'''
+
+import re
+
+from aenea import NoAction
+
+# vim's own operators. Operators mapped by plugins are left out: tComment's gc,
+# for one, goes through :<c-u> and drops a count typed before it, so 2gcj
+# doesn't do what gc2j does.
+_OPERATORS = ['g~', 'gU', 'gu', 'gq', 'g?', 'zf',
+              'd', 'c', 'y', '!', '=', '<', '>']
+
+# Motions for which a count of one differs from no count at all, e.g. 1G goes
+# to the first line but G to the last. Their count is always kept.
+_COUNT_SENSITIVE_MOTIONS = set(['G', 'H', 'L', '%', '|', 'gg', 'go'])
+
+# Motions that stop at the edge of the line or buffer instead of failing, so
+# two counted moves in the same direction can be made one.
+_ADDITIVE_MOTIONS = set(['h', 'j', 'k', 'l', 'gj', 'gk'])
+
+
+def _alternatives(keys):
+    # Longest first, so gj isn't read as g.
+    return '|'.join(
+        re.escape(key) for key in sorted(keys, key=len, reverse=True))
+
+
+_COMMAND_PATTERN = re.compile(
+    r'^([1-9]\d*)?(%s)([1-9]\d*)?(.+)$' % _alternatives(_OPERATORS))
+_MOTION_PATTERN = re.compile(
+    r'^([1-9]\d*)?(%s)$' % _alternatives(_ADDITIVE_MOTIONS))
+
+
+def _with_count(count, keys):
+    if count == 1 and keys not in _COUNT_SENSITIVE_MOTIONS:
+        return keys
+    return '%d%s' % (count, keys)
+
+
+def fold_counts(keys):
+    '''Folds the counts of a single operator command into one.'''
+    match = _COMMAND_PATTERN.match(keys)
+    if match is not None:
+        before, operator, after, motion = match.groups()
+        if not (before or after):
+            return keys
+        count = int(before or 1) * int(after or 1)
+        if motion in _COUNT_SENSITIVE_MOTIONS:
+            return '%d%s%s' % (count, operator, motion)
+        return _with_count(count, operator + motion)
+
+    match = _MOTION_PATTERN.match(keys)
+    if match is not None and match.group(1) == '1':
+        return match.group(2)
+    return keys
+
+
+def _merge_motions(first, second):
+    '''Returns one command for two counted moves in the same direction.'''
+    first_match = _MOTION_PATTERN.match(first)
+    second_match = _MOTION_PATTERN.match(second)
+    if first_match is None or second_match is None:
+        return None
+    if first_match.group(2) != second_match.group(2):
+        return None
+    count = int(first_match.group(1) or 1) + int(second_match.group(1) or 1)
+    return _with_count(count, first_match.group(2))
+
+
+def _is_empty_insertion(insertions):
+    return insertions[0][0] is None and all(
+        isinstance(action, NoAction) for (entry, action) in insertions
+        )
+
+
+def optimize(commands):
+    '''
+    Returns an equivalent list of ``('c', keys)`` and
+    ``('i', (entry, action))`` items that sends fewer keys.
+    '''
+    optimized = []
+    insertions = []
+
+    def flush_insertions():
+        if insertions and not _is_empty_insertion(insertions):
+            optimized.extend(('i', insertion) for insertion in insertions)
+        del insertions[:]
+
+    for mode, value in commands:
+        if mode == 'i':
+            insertions.append(value)
+            continue
+
+        flush_insertions()
+        keys = fold_counts(value)
+        if not keys:
+            continue
+        if optimized and optimized[-1][0] == 'c':
+            merged = _merge_motions(optimized[-1][1], keys)
+            if merged is not None:
+                optimized[-1] = ('c', merged)
+                continue
+        optimized.append(('c', keys))
+    flush_insertions()
+
+    return _join_commands(optimized)
+
+
+def _join_commands(commands):
+    joined = []
+    for mode, value in commands:
+        if mode == 'c' and joined and joined[-1][0] == 'c':
+            joined[-1] = ('c', joined[-1][1] + value)
+        else:
+            joined.append((mode, value))
+    return joined
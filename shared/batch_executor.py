@@ -0,0 +1,247 @@
+'''
+Executes every action produced by one recognition as a single proxy call.
+
+Aenea's proxy actions hand their events to ``aenea.communications.server``.
+While a batch executes, that server is swapped for a recorder, so each
+``Key``/``Text`` only appends its events to one ordered payload. Adjacent
+text and keystroke events are merged, and the payload is sent with a single
+``execute_batch`` call instead of one RPC per action.
+
+Actions whose side effects must stay in order with the keystrokes (pauses and
+arbitrary functions) flush the pending payload and then run directly. When
+the proxy is not in use, actions execute locally exactly as before.
+
+Repeats are represented as ``RepeatedAction(action, count)`` rather than by
+multiplying actions. In a batch the action is recorded once, also when it is
+nested in a series of actions (e.g. "up 5 right 3" repeated 10 times), and
+its events are scaled: a single text or key press event becomes one longer
+text or one key press with a larger count. Big counts therefore don't build
+long action chains or run the action once per repeat.
+
+The Aenea server has no way to repeat a mix of events, so a repeat whose
+events don't merge into one (e.g. a key press and some text) still sends one
+copy of its merged events per repeat: the payload grows linearly with the
+count, though only by the number of events the action records once.
+
+Copy this file next to the grammars that use it.
+'''
+
+import aenea.communications
+
+from dragonfly import (
+    ActionBase,
+    Function,
+    Pause,
+)
+from dragonfly.actions.action_base import ActionSeries
+
+_BARRIER_TYPES = (Function, Pause)
+
+
+class RepeatedAction(ActionBase):
+    '''Executes ``action`` ``count`` times.'''
+
+    def __init__(self, action, count):
+        ActionBase.__init__(self)
+        self._action = action
+        self.count = count
+
+    def _execute(self, data=None):
+        for i in xrange(self.count):
+            self._action.execute(data)
+
+    def __str__(self):
+        return '%s * %d' % (self._action, self.count)
+
+
+def repeated(action, count):
+    '''Returns ``action`` repeated ``count`` times, without copying it.'''
+    count = int(count)
+    if count == 1:
+        return action
+    return RepeatedAction(action, count)
+
+
+def _scale(command, count):
+    '''Returns one command that does what ``command`` does ``count`` times.'''
+    if isinstance(command, tuple) and len(command) == 3 and not command[1]:
+        name, args, kwargs = command
+        if name == 'write_text' and set(kwargs) == {'text'}:
+            return (name, (), {'text': kwargs['text'] * count})
+        if name == 'key_press' and kwargs.get('direction', 'press') == 'press':
+            kwargs = dict(kwargs)
+            kwargs['count'] = kwargs.get('count', 1) * count
+            return (name, (), kwargs)
+    return None
+
+
+class _RecordingServer(object):
+    '''Stands in for the proxy server and collects what would be sent.'''
+
+    def __init__(self):
+        self.commands = []
+
+    def execute_batch(self, commands):
+        self.commands.extend(commands)
+
+    def repeat_since(self, start, count):
+        '''Repeats the commands recorded since ``start`` ``count`` times.'''
+        recorded = merge_commands(self.commands[start:])
+        if len(recorded) == 1:
+            scaled = _scale(recorded[0], count)
+            if scaled is not None:
+                self.commands[start:] = [scaled]
+                return
+        self.commands[start:] = recorded * count
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return record
+
+
+def _has_barrier(action):
+    if isinstance(action, _BARRIER_TYPES):
+        return True
+    children = list(getattr(action, '_actions', None) or [])
+    child = getattr(action, '_action', None)
+    if child is not None:
+        children.append(child)
+    return any(_has_barrier(child) for child in children)
+
+
+def _record(action, data, recorder):
+    '''
+    Executes ``action`` into ``recorder``, recording every repeated action in
+    it once however deeply it is nested in series of actions.
+    '''
+    if isinstance(action, ActionSeries):
+        for child in action._actions:
+            _record(child, data, recorder)
+    elif isinstance(action, RepeatedAction):
+        if action.count < 1:
+            return
+        start = len(recorder.commands)
+        _record(action._action, data, recorder)
+        if len(recorder.commands) > start:
+            recorder.repeat_since(start, action.count)
+        else:
+            # It ran locally rather than through the proxy.
+            for i in xrange(action.count - 1):
+                action._action.execute(data)
+    else:
+        action.execute(data)
+
+
+def _combine(first, second):
+    '''
+    Returns a single command equivalent to running ``first`` then ``second``,
+    or None if they can't be merged.
+    '''
+    if not (isinstance(first, tuple) and isinstance(second, tuple)):
+        return None
+    if len(first) != 3 or len(second) != 3:
+        return None
+    (name, args, kwargs), (other_name, other_args, other_kwargs) = first, second
+    if name != other_name or args or other_args:
+        return None
+
+    if name == 'write_text' and set(kwargs) == set(other_kwargs) == {'text'}:
+        return (name, (), {'text': kwargs['text'] + other_kwargs['text']})
+
+    if name == 'key_press':
+        if kwargs.get('direction', 'press') != 'press':
+            return None
+        rest = dict((k, v) for (k, v) in kwargs.iteritems() if k != 'count')
+        other_rest = dict(
+            (k, v) for (k, v) in other_kwargs.iteritems() if k != 'count'
+        )
+        if rest != other_rest:
+            return None
+        rest['count'] = kwargs.get('count', 1) + other_kwargs.get('count', 1)
+        return (name, (), rest)
+
+    return None
+
+
+def merge_commands(commands):
+    '''Merges adjacent text and identical key press events, keeping order.'''
+    merged = []
+    for command in commands:
+        if merged:
+            combined = _combine(merged[-1], command)
+            if combined is not None:
+                merged[-1] = combined
+                continue
+        merged.append(command)
+    return merged
+
+
+class ActionBatch(object):
+    '''
+    Collects the actions of one utterance and executes them in one go.
+
+    Example::
+
+        batch = ActionBatch()
+        batch.add(Text('5j'))
+        batch.add(Key('escape:2'))
+        batch.execute()
+
+    ``sender`` is called with the merged events instead of passing them to the
+    proxy server, so a grammar can deliver them some other way. It is
+    responsible for falling back to the server if it can't.
+    '''
+
+    def __init__(self, sender=None):
+        self._pending = []
+        self._sender = sender
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, action, data=None):
+        if action is not None:
+            self._pending.append((action, data))
+        return self
+
+    def extend(self, actions, data=None):
+        for action in actions:
+            self.add(action, data)
+        return self
+
+    def execute(self):
+        pending, self._pending = self._pending, []
+        recorder = _RecordingServer()
+
+        for action, data in pending:
+            if _has_barrier(action):
+                self._send(recorder)
+                action.execute(data)
+                continue
+
+            server = aenea.communications.server
+            aenea.communications.server = recorder
+            try:
+                _record(action, data, recorder)
+            finally:
+                aenea.communications.server = server
+
+        self._send(recorder)
+
+    def _send(self, recorder):
+        if not recorder.commands:
+            return
+        commands = merge_commands(recorder.commands)
+        recorder.commands = []
+        if self._sender is not None:
+            self._sender(commands)
+        else:
+            aenea.communications.server.execute_batch(commands)
+
+
+def execute_batched(actions, data=None, sender=None):
+    ActionBatch(sender).extend(actions, data).execute()
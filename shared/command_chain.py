@@ -0,0 +1,35 @@
+'''
+Chains of commands said in one utterance, e.g. "up five down three slap".
+
+``Repetition(child, max=N)`` is a nested chain of N optional copies of
+``child``. ``chain`` moves the child into one private rule first, so every
+copy is a single rule reference instead of the whole child. That only makes
+the grammar a little smaller (multiedit 794 -> 705 nodes, charwise vim
+787 -> 731, vim 2489 -> 2472, with tools/grammar_complexity.py): the nesting
+depth and the number of paths through a chain are the same as before, and
+they are what limits its length. It doesn't make longer chains possible.
+
+The value of a chain is the list of its links' values, as with Repetition.
+
+Copy this file next to the grammars that use it.
+'''
+
+from dragonfly import (
+    Repetition,
+    Rule,
+    RuleRef,
+)
+
+
+def chain(child, max, name, min=1):
+    '''
+    Returns an element matching ``min`` to ``max - 1`` of ``child`` in a row
+    (``max`` is exclusive, as in Repetition), named ``name``.
+    '''
+    if not isinstance(child, RuleRef):
+        child = RuleRef(Rule(
+            name=name + '_link',
+            element=child,
+            exported=False,
+        ))
+    return Repetition(child, min=min, max=max, name=name)
@@ -0,0 +1,170 @@
+'''
+Letters, digits and counts for the grammars to share.
+
+Several grammars need the same building blocks. Each function here returns
+the same object whenever it is called with the same arguments, so a table or
+element is built once per process. A grammar that uses one in several rules
+also compiles it only once.
+
+Plain elements and tables (``digital_integer``, ``text_actions``) can be
+shared between grammars. Elements backed by a rule (``integer_ref``,
+``letter_ref``) can't, because dragonfly ties a rule to one grammar. Those
+take a ``scope``, normally the grammar's name, and are only shared within it.
+A module must ``release(scope)`` when it unloads, so that the grammar it
+builds when it is loaded again gets new rules instead of the unloaded
+grammar's.
+
+Counts are CompactInteger elements where the range allows it. They accept
+the same words as dragonfly's Integer ("twenty three", "too" for two...)
+with far fewer elements, because they are built from the ranges actually
+needed instead of general builders for numbers up to the millions. Run
+tools/number_benchmark.py to compare them.
+
+Copy this file next to the grammars that use it.
+'''
+
+import aenea.misc
+
+from aenea import Text
+
+from dragonfly import (
+    Alternative,
+    IntegerRef,
+    Literal,
+    MappingRule,
+    Optional,
+    RuleRef,
+    RuleWrap,
+    Sequence,
+)
+
+_memo = {}
+# scope -> the keys of _memo of the rule-backed elements built for it
+_scoped = {}
+
+# The words for 0 to 19 and their values, as dragonfly's English Integer has
+# them.
+_UNITS = [
+    ('zero', 0), ('oh', 0), ('one', 1), ('two', 2), ('too', 2), ('to', 2),
+    ('three', 3), ('four', 4), ('five', 5), ('six', 6), ('seven', 7),
+    ('eight', 8), ('nine', 9), ('ten', 10), ('eleven', 11), ('twelve', 12),
+    ('thirteen', 13), ('fourteen', 14), ('fifteen', 15), ('sixteen', 16),
+    ('seventeen', 17), ('eighteen', 18), ('nineteen', 19),
+]
+_TENS = [
+    ('twenty', 2), ('thirty', 3), ('forty', 4), ('fifty', 5), ('sixty', 6),
+    ('seventy', 7), ('eighty', 8), ('ninety', 9),
+]
+
+
+def _words(words, values):
+    '''Matches one of ``words`` whose value is in ``values``.'''
+    return Alternative([
+        Literal(word, value=value) for (word, value) in words
+        if value in values
+    ])
+
+
+class _TensAndUnits(Sequence):
+    '''"twenty [three]": tens, then units if they were said.'''
+
+    def value(self, node):
+        values = Sequence.value(self, node)
+        tens = values[0] * 10
+        if len(values) > 1 and values[1]:
+            return tens + values[1]
+        return tens
+
+
+class CompactInteger(Alternative):
+    '''
+    An integer from ``min`` to ``max - 1`` said as a number, for ranges
+    within 0 to 99. Tens that can be followed by the same units share one
+    element, so 1 to 99 is three small word lists.
+    '''
+
+    def __init__(self, name, min, max, default=None):
+        if not 0 <= min < max <= 100:
+            raise ValueError('CompactInteger only covers 0 to 99, not '
+                             '%d to %d' % (min, max - 1))
+        numbers = set(range(min, max))
+        children = []
+        units = numbers & set(range(20))
+        if units:
+            children.append(_words(_UNITS, units))
+
+        # units after the tens -> the tens they can follow
+        tens_by_units = {}
+        for tens in range(2, 10):
+            following = frozenset(
+                number - tens * 10 for number in numbers
+                if number // 10 == tens)
+            if following:
+                tens_by_units.setdefault(following, []).append(tens)
+        for following, tens in sorted(
+                tens_by_units.items(), key=lambda item: item[1]):
+            sequence = [_words(_TENS, tens)]
+            if following - set([0]):
+                units_element = _words(_UNITS, following - set([0]))
+                if 0 in following:
+                    units_element = Optional(units_element)
+                sequence.append(units_element)
+            children.append(_TensAndUnits(sequence))
+
+        Alternative.__init__(self, children, name=name, default=default)
+
+
+def _memoized(key, build, scope=None):
+    if key not in _memo:
+        _memo[key] = build()
+        if scope is not None:
+            _scoped.setdefault(scope, []).append(key)
+    return _memo[key]
+
+
+def release(scope):
+    '''Forgets the rule-backed elements built for ``scope``.'''
+    for key in _scoped.pop(scope, []):
+        del _memo[key]
+
+
+def digital_integer(name, min, max):
+    '''
+    An integer said digit by digit, e.g. "one two" -> 12, with ``min`` to
+    ``max - 1`` digits (see aenea.misc.DigitalInteger).
+    '''
+    return _memoized(
+        ('digital_integer', name, min, max),
+        lambda: aenea.misc.DigitalInteger(name, min, max),
+    )
+
+
+def integer_ref(name, min, max, scope):
+    '''An integer from ``min`` to ``max - 1``, said as a number.'''
+    def build():
+        if 0 <= min < max <= 100:
+            return RuleWrap(name, CompactInteger(None, min, max))
+        return IntegerRef(name, min, max)
+    return _memoized(('integer_ref', name, min, max, scope), build, scope)
+
+
+def letter_ref(name, scope):
+    '''One letter of aenea.misc.LETTERS. Its value is the letter.'''
+    rule = _memoized(('letters', scope), lambda: MappingRule(
+        name='letter_mapping',
+        mapping=aenea.misc.LETTERS,
+        exported=False,
+    ), scope)
+    return _memoized(('letter_ref', name, scope),
+                     lambda: RuleRef(rule, name=name), scope)
+
+
+def text_actions(table):
+    '''
+    Maps what is said to a Text action typing it, for a table of aenea.misc:
+    'LETTERS', 'DIGITS' or 'ALPHANUMERIC'.
+    '''
+    return _memoized(('text_actions', table), lambda: dict(
+        (spoken, Text(value))
+        for (spoken, value) in getattr(aenea.misc, table).iteritems()
+    ))
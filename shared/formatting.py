@@ -0,0 +1,200 @@
+'''
+Formats dictated words as identifiers, paths and sentences, e.g. "camel my
+variable name" -> "myVariableName".
+
+The vim, multiedit and charwise vim grammars all say a format and then
+dictate: "[upper | natural] <format> [<dictation>]". ``format_words`` takes
+the words of such an utterance and returns the text to type:
+
+- Words are lower case, or upper case after "upper", or left as they were
+  said after "natural".
+- Dragon's "written\\spoken" tokens keep their written form, and dashes are
+  dropped ("rel-path" -> "relpath").
+- Tokens holding several words ("control panel") are split, and punctuation
+  tokens (commas, dashes) are skipped.
+
+All of that happens in one pass over the words, and the formatter is looked
+up in ``FORMATTERS``, which has every format name the grammars use. The last
+CACHE_SIZE results are kept, since the same identifiers tend to be dictated
+again and again.
+
+Copy this file next to the grammars that use it.
+'''
+
+import collections
+import re
+
+CACHE_SIZE = 256
+
+# Titles keep these in lower case, except as the first word.
+_TITLE_LOWER_CASE_WORDS = frozenset(
+    'a,an,the,at,by,for,in,of,on,to,up,and,as,but,or,nor'.split(','))
+# Dragon's punctuation tokens, e.g. '\x96\\dash\\dash'.
+_PUNCTUATION = re.compile(r'^[,\x96\x97]')
+
+
+def format_snakeword(text):
+    if not text:
+        return ''
+    formatted = text[0][0].upper() + text[0][1:]
+    if len(text) > 1:
+        formatted += '_' + format_score(text[1:])
+    return formatted
+
+
+def format_score(text):
+    return '_'.join(text)
+
+
+def format_params(text):
+    return ', '.join(text)
+
+
+def format_camel(text):
+    if not text:
+        return ''
+    return text[0] + ''.join(word[0].upper() + word[1:] for word in text[1:])
+
+
+def format_proper(text):
+    return ''.join(word.capitalize() for word in text)
+
+
+def format_relpath(text):
+    return '/'.join(text)
+
+
+def format_abspath(text):
+    return '/' + format_relpath(text)
+
+
+def format_scoperesolve(text):
+    return '::'.join(text)
+
+
+def format_jumble(text):
+    return ''.join(text)
+
+
+def format_dotword(text):
+    return '.'.join(text)
+
+
+def format_dashword(text):
+    return '-'.join(text)
+
+
+def format_natword(text):
+    return ' '.join(text)
+
+
+def format_spaceword(text):
+    if not text:
+        return ''
+    return ' '.join(text) + ' '
+
+
+def format_broodingnarrative(text):
+    return ''
+
+
+def format_sentence(text):
+    if not text:
+        return ''
+    return ' '.join([text[0].capitalize()] + text[1:])
+
+
+def format_spacesentence(text):
+    if not text:
+        return ''
+    return format_sentence(text) + ' '
+
+
+def format_title(text):
+    return ' '.join(
+        word if index and word in _TITLE_LOWER_CASE_WORDS
+        else word.capitalize()
+        for (index, word) in enumerate(text)
+    )
+
+
+# Format name, as said without dashes -> formatter.
+FORMATTERS = {
+    'abspath': format_abspath,
+    'broodingnarrative': format_broodingnarrative,
+    'camel': format_camel,
+    'dashword': format_dashword,
+    'dotword': format_dotword,
+    'jumble': format_jumble,
+    'natword': format_natword,
+    'params': format_params,
+    'proper': format_proper,
+    'relpath': format_relpath,
+    'scoperesolve': format_scoperesolve,
+    'score': format_score,
+    'sentence': format_sentence,
+    'snakeword': format_snakeword,
+    'spaceword': format_spaceword,
+    'title': format_title,
+}
+# The names charwise vim uses.
+FORMATTERS.update({
+    'dotway': format_dotword,
+    'natway': format_natword,
+    'snakeway': format_snakeword,
+    'spaceway': format_spaceword,
+    'spaytince': format_spacesentence,
+    'spayway': format_spaceword,
+    'spineway': format_dashword,
+})
+
+_cache = collections.OrderedDict()
+
+
+def normalize(words, case=None):
+    '''
+    Returns the written form of dictated ``words``, split into single words,
+    in upper or lower case if ``case`` is 'upper' or 'lower'.
+    '''
+    normalized = []
+    for word in words:
+        if not word or _PUNCTUATION.match(word):
+            continue
+        word = word.split('\\', 1)[0].replace('-', '')
+        if case == 'lower':
+            word = word.lower()
+        elif case == 'upper':
+            word = word.upper()
+        if ' ' in word:
+            normalized.extend(part for part in word.split(' ') if part)
+        elif word:
+            normalized.append(word)
+    return normalized
+
+
+def format_words(words):
+    '''
+    Returns the text for the words of "[upper | natural] <format>
+    [<dictation>]".
+    '''
+    key = tuple(words)
+    if key in _cache:
+        formatted = _cache.pop(key)
+    else:
+        formatted = _format(words)
+        if len(_cache) >= CACHE_SIZE:
+            _cache.popitem(last=False)
+    _cache[key] = formatted
+    return formatted
+
+
+def _format(words):
+    case = 'lower'
+    if words[0].lower() in ('upper', 'natural'):
+        if words[0].lower() == 'upper':
+            case = 'upper'
+        else:
+            case = None
+        words = words[1:]
+    formatter = FORMATTERS[words[0].replace('-', '').lower()]
+    return formatter(normalize(words[1:], case))
@@ -0,0 +1,99 @@
+'''
+On-disk cache for the data a grammar is built from.
+
+Some grammars spend most of their startup turning tables into specs, e.g. the
+git grammar derives a spoken form for every option with regexes. ``cached``
+runs such a build step once and pickles its result under
+``PROJECT_ROOT/grammar_cache``. Later starts load the pickle instead, as long
+as none of the source files that went into it (the grammar's modules and its
+``grammar_config`` JSON) have changed: the cache is keyed by a hash of their
+contents. List only the files the build step reads; any other file in the key
+throws the cache away for nothing when it changes.
+
+Only plain data (strings, numbers, lists, dicts) should be cached. Build the
+rules and actions from it afterwards. A result that can't be pickled is
+simply not cached.
+
+Copy this file next to the grammars that use it.
+'''
+
+import cPickle as pickle
+import hashlib
+import os
+
+import aenea.config
+
+CACHE_DIRECTORY = os.path.join(aenea.config.PROJECT_ROOT, 'grammar_cache')
+
+# Change this to discard every cache written by an older version of this file.
+FORMAT_VERSION = 1
+
+
+def source_file(path):
+    '''Returns the .py file for a module's ``__file__``, which may be a .pyc.'''
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path
+
+
+def config_sources(grammar, root=aenea.config.PROJECT_ROOT):
+    '''Returns the configuration files of a grammar: its ``grammar_config`` JSON.'''
+    return [os.path.join(root, 'grammar_config', grammar + '.json')]
+
+
+def fingerprint(sources):
+    '''Hashes the paths and contents of ``sources``, noting missing files.'''
+    digest = hashlib.sha1('version %d' % FORMAT_VERSION)
+    for path in sources:
+        digest.update('\0%s\0' % path)
+        try:
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+        except IOError:
+            digest.update('missing')
+    return digest.hexdigest()
+
+
+def cached(name, sources, build):
+    '''
+    Returns what ``build()`` returned on an earlier run if none of the files
+    in ``sources`` changed since, or calls it and caches the result.
+    '''
+    key = fingerprint(sources)
+    path = os.path.join(CACHE_DIRECTORY, name + '.pickle')
+
+    try:
+        with open(path, 'rb') as cache:
+            cached_key, value = pickle.load(cache)
+        if cached_key == key:
+            return value
+    except IOError:
+        pass
+    except Exception as error:
+        # A truncated or otherwise corrupt cache file; it is rewritten below.
+        print 'Ignoring the %s grammar cache: %s' % (name, error)
+
+    value = build()
+    _store(name, path, key, value)
+    return value
+
+
+def _store(name, path, key, value):
+    try:
+        data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError) as error:
+        print 'Not caching the %s grammar: %s' % (name, error)
+        return
+
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        if not os.path.isdir(CACHE_DIRECTORY):
+            os.makedirs(CACHE_DIRECTORY)
+        with open(temporary_path, 'wb') as cache:
+            cache.write(data)
+        if os.name == 'nt' and os.path.exists(path):
+            # Windows can't rename over an existing file.
+            os.remove(path)
+        os.rename(temporary_path, path)
+    except (IOError, OSError) as error:
+        print 'Could not write the %s grammar cache: %s' % (name, error)
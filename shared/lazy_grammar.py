@@ -0,0 +1,186 @@
+'''
+Builds and loads a grammar the first time its context matches.
+
+Building the rules of a big grammar and loading it into the speech engine is
+most of what a grammar module does at startup, and it is wasted for the
+grammars whose application you don't use that session. A ``LazyGrammar``
+only loads a stub: an empty grammar with the same context and a disabled
+placeholder rule, and calls ``build(grammar)`` to add the real rules and load
+the grammar once its context matches.
+
+A grammar loaded while Dragon recognises an utterance only takes part in the
+next one, so the grammars are built ahead of time: an engine timer looks at
+the local foreground window every ``WATCH_INTERVAL`` seconds, and when it
+changed, builds the grammars whose context matches the new window. Only then
+is the Aenea server asked about the remote window (see window_state.py), so
+the timer adds no calls to the server while you stay in one window. It stops
+once every grammar is built.
+
+Switching windows on the Aenea server doesn't change the local window (the
+one showing the server's screen), so a grammar for a remote application is
+built by its stub at the start of the first utterance said in it. So is the
+grammar of a window you speak to within ``WATCH_INTERVAL`` of switching to it.
+Dragon doesn't recognise that utterance with the new grammar, and it has to
+be said again.
+
+Example::
+
+    def build(grammar):
+        grammar.add_rule(ExpensiveRule())
+
+    grammar = LazyGrammar('example', context=example_context, build=build)
+    grammar.load()
+
+With ``DEBUG`` set, each build is reported with the time it took, i.e. the
+time kept out of startup.
+
+Copy this file next to the grammars that use it.
+'''
+
+import time
+
+from dragonfly import (
+    Grammar,
+    Literal,
+    Rule,
+    Window,
+    get_engine,
+)
+
+# How often (in seconds) the foreground window is checked for grammars to
+# build. 0 turns the timer off, e.g. where the engine's timers run in another
+# thread.
+WATCH_INTERVAL = 1.0
+# Print how long each grammar took to build.
+DEBUG = False
+
+_lazy_grammars = []
+_timer = None
+# The local foreground window the timer last checked.
+_watched_window = None
+
+
+def build_all():
+    '''Builds every grammar that is still waiting for its context.'''
+    for lazy_grammar in list(_lazy_grammars):
+        lazy_grammar.build()
+
+
+def build_matching(executable=None, title=None, handle=None):
+    '''
+    Builds the grammars still waiting whose context matches the window
+    (the foreground window by default), and returns how many still wait.
+    '''
+    waiting = [lazy_grammar for lazy_grammar in _lazy_grammars
+               if lazy_grammar.grammar is None]
+    if waiting and handle is None:
+        window = Window.get_foreground()
+        executable, title, handle = (
+            window.executable, window.title, window.handle)
+    for lazy_grammar in waiting:
+        if lazy_grammar.matches(executable, title, handle):
+            lazy_grammar.build()
+    return len([lazy_grammar for lazy_grammar in waiting
+                if lazy_grammar.grammar is None])
+
+
+def _watch():
+    global _watched_window
+    window = Window.get_foreground()
+    current = (window.executable, window.title, window.handle)
+    if current == _watched_window:
+        return
+    _watched_window = current
+    if not build_matching(*current):
+        _stop_watching()
+
+
+def _start_watching():
+    global _timer
+    if _timer is None and WATCH_INTERVAL:
+        _timer = get_engine().create_timer(_watch, WATCH_INTERVAL)
+
+
+def _stop_watching():
+    global _timer, _watched_window
+    _watched_window = None
+    if _timer is not None:
+        _timer.stop()
+        _timer = None
+
+
+def deferred_time():
+    '''Returns the seconds spent building grammars after startup.'''
+    return sum(lazy_grammar.build_time or 0 for lazy_grammar in _lazy_grammars)
+
+
+class _StubGrammar(Grammar):
+    def __init__(self, lazy_grammar):
+        Grammar.__init__(self, lazy_grammar.name + '_stub',
+                         context=lazy_grammar.context)
+        self._lazy_grammar = lazy_grammar
+        placeholder = Rule(
+            name='placeholder',
+            element=Literal('%s grammar placeholder' % lazy_grammar.name),
+            exported=True,
+        )
+        self.add_rule(placeholder)
+        placeholder.disable()
+
+    def process_begin(self, executable, title, handle):
+        # Too late for this utterance, which Dragon has already started
+        # recognising without the real grammar, but not for the next one.
+        lazy_grammar = self._lazy_grammar
+        if (lazy_grammar.grammar is None and
+                lazy_grammar.matches(executable, title, handle)):
+            lazy_grammar.build()
+
+
+class LazyGrammar(object):
+    def __init__(self, name, context=None, build=None):
+        self.name = name
+        self.context = context
+        self.grammar = None
+        self.build_time = None
+        self._build = build
+        self._stub = None
+
+    def load(self):
+        if self.grammar is not None or self._stub is not None:
+            return
+        self._stub = _StubGrammar(self)
+        self._stub.load()
+        _lazy_grammars.append(self)
+        _start_watching()
+
+    def matches(self, executable, title, handle):
+        return (self.context is None or
+                self.context.matches(executable, title, handle))
+
+    def build(self):
+        '''Builds and loads the real grammar now, if it hasn't been yet.'''
+        if self.grammar is not None:
+            return self.grammar
+
+        start = time.time()
+        grammar = Grammar(self.name, context=self.context)
+        self._build(grammar)
+        grammar.load()
+        self.grammar = grammar
+        self.build_time = time.time() - start
+
+        if DEBUG:
+            print 'Built the %s grammar on first use in %.0f ms (%.0f ms in all)' % (
+                self.name, self.build_time * 1000, deferred_time() * 1000)
+        return grammar
+
+    def unload(self):
+        for grammar in (self.grammar, self._stub):
+            if grammar is not None:
+                grammar.unload()
+        self.grammar = None
+        self._stub = None
+        if self in _lazy_grammars:
+            _lazy_grammars.remove(self)
+        if not _lazy_grammars:
+            _stop_watching()
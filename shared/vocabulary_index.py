@@ -0,0 +1,583 @@
+'''
+The vocabularies of ``vocabulary_config``, compiled into one file indexed by
+tag.
+
+Aenea parses every JSON file under ``vocabulary_config/static`` and
+``vocabulary_config/dynamic`` at startup, and again for every grammar that
+asks for a tag. With tens of thousands of entries that is most of the
+startup time. This module compiles all of them once into
+``grammar_cache/vocabulary.index``:
+
+- a header with the modification time and size of every source file, and
+  for each kind (static or dynamic) and tag, where the entries of the
+  vocabularies with that tag are
+- the entries of each vocabulary, with their action specs already parsed
+  and unescaped, marshalled
+
+The index is memory mapped and a tag's entries are only unmarshalled when a
+grammar asks for that tag. It is rebuilt whenever a vocabulary file is
+added, removed or changed, so there is no build step to remember (although
+``tools/build_vocabulary_index.py`` runs it and reports timings). Only the
+files that changed are parsed again, and only their entries are compared
+with the DictLists of the grammars, so the cost of a reload grows with the
+size of the edited files rather than with the whole vocabulary. It doesn't
+shrink to the size of the edit: an edited file is parsed and compared in
+full, so a one entry edit of a file of 10,000 entries still takes about half
+as long as reloading everything (``tools/vocabulary_refresh_benchmark.py``).
+Split big vocabularies over several files to keep reloads quick.
+
+- ``static_vocabulary(tag)`` replaces ``aenea.vocabulary.get_static_vocabulary``.
+- ``dynamic_vocabulary(tag)`` replaces
+  ``aenea.vocabulary.register_dynamic_vocabulary``: it returns a DictList that
+  ``refresh()`` updates when the dynamic vocabularies change. Call it at the
+  start of each utterance, e.g. from a rule's ``_process_begin``; it looks at
+  the vocabulary files at most every ``REFRESH_INTERVAL`` seconds.
+- ``set_language(tag, language)`` limits a tag's DictList to the
+  vocabularies without "languages" and those that list ``language``, e.g.
+  "languages": ["python"].
+
+Copy this file next to the grammars that use it.
+'''
+
+import glob
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import struct
+import time
+
+import aenea
+import aenea.config
+
+from dragonfly import DictList
+
+VOCABULARY_DIRECTORY = os.path.join(
+    aenea.config.PROJECT_ROOT, 'vocabulary_config')
+INDEX_PATH = os.path.join(
+    aenea.config.PROJECT_ROOT, 'grammar_cache', 'vocabulary.index')
+KINDS = ['static', 'dynamic']
+
+# Change this to discard every index written by an older version of this file.
+FORMAT_VERSION = 4
+# How often refresh() looks for edited vocabulary files, in seconds. Looking
+# lists and stats every vocabulary file.
+REFRESH_INTERVAL = 2.0
+_MAGIC = 'vocabulary index %d\n' % FORMAT_VERSION
+_HEADER_LENGTH = struct.Struct('<I')
+
+# The sections of a vocabulary file and what a plain string means in each.
+# Shortcuts win over vocabulary said the same way.
+_SECTIONS = [('vocabulary', 'Text'), ('shortcuts', 'Key')]
+# The action types that are created static, and what joins two of their
+# specs.
+_STATIC_TYPES = {'Key': ',', 'Text': ''}
+
+
+def source_files(directory=VOCABULARY_DIRECTORY):
+    '''Returns (kind, path) for every vocabulary file, in loading order.'''
+    return [
+        (kind, path) for kind in KINDS
+        for path in sorted(glob.glob(os.path.join(directory, kind, '*.json')))
+    ]
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def _string(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _spec(kind, args):
+    '''
+    Returns (type, args, static) for one action. A Key or Text spec without
+    "%(name)s" fields is unescaped ("%%" -> "%") so that the action can be
+    created static: dragonfly then parses its spec once, when it is created,
+    rather than formatting and parsing it every time it is executed.
+    '''
+    if (kind in _STATIC_TYPES and len(args) == 1 and
+            '%' not in args[0].replace('%%', '')):
+        return (kind, (args[0].replace('%%', '%'),), True)
+    return (kind, args, False)
+
+
+def parse_specs(value, default_type):
+    '''
+    Returns the actions of a vocabulary value as a tuple of (type, args,
+    static), e.g. [{"type": "Text", "args": ["()"]}, {"type": "Key", "args":
+    ["left"]}] -> (('Text', ('()',), True), ('Key', ('left',), True)). A
+    plain string is one action of ``default_type``. Adjacent static actions
+    of the same type are joined into one.
+    '''
+    if isinstance(value, basestring):
+        return (_spec(default_type, (_string(value),)),)
+    specs = []
+    for item in value:
+        if isinstance(item, basestring):
+            spec = _spec(default_type, (_string(item),))
+        else:
+            spec = _spec(
+                _string(item['type']),
+                tuple(_string(argument) for argument in item.get('args', [])),
+            )
+        if specs and spec[2] and specs[-1][2] and specs[-1][0] == spec[0]:
+            joined = _STATIC_TYPES[spec[0]].join([specs[-1][1][0], spec[1][0]])
+            specs[-1] = (spec[0], (joined,), True)
+        else:
+            specs.append(spec)
+    return tuple(specs)
+
+
+def parse_file(path):
+    '''
+    Parses one vocabulary file. Returns [(vocabulary name, tags, languages,
+    {spoken: specs})] in the order of the file.
+    '''
+    with open(path) as vocabulary_file:
+        vocabularies = json.load(vocabulary_file)
+    if isinstance(vocabularies, dict):
+        vocabularies = [vocabularies]
+    parsed = []
+    for vocabulary in vocabularies:
+        entries = {}
+        for section, default_type in _SECTIONS:
+            for spoken, value in vocabulary.get(section, {}).iteritems():
+                if isinstance(value, basestring) and '%' not in value:
+                    # Most entries; parse_specs, inlined.
+                    specs = ((default_type, (_string(value),), True),)
+                else:
+                    specs = parse_specs(value, default_type)
+                entries[_string(spoken)] = specs
+        parsed.append((
+            _string(vocabulary.get('name', '')),
+            [_string(tag) for tag in vocabulary.get('tags', [])],
+            tuple(_string(language)
+                  for language in vocabulary.get('languages', [])),
+            entries,
+        ))
+    return parsed
+
+
+def compile_vocabularies(directory=VOCABULARY_DIRECTORY):
+    '''
+    Parses every vocabulary file. Returns {kind: {tag: [(vocabulary name,
+    {spoken: specs})]}}, with the vocabularies of a tag in loading order.
+    '''
+    compiled = dict((kind, {}) for kind in KINDS)
+    for kind, path in source_files(directory):
+        for name, tags, languages, entries in parse_file(path):
+            for tag in tags:
+                compiled[kind].setdefault(tag, []).append((name, entries))
+    return compiled
+
+
+def build_index(directory=VOCABULARY_DIRECTORY, previous=None, parsed=None):
+    '''
+    Compiles the vocabularies in ``directory`` and returns the index as a
+    list of strings to write out. Files that haven't changed since
+    ``previous`` (an open VocabularyIndex) are copied from it instead of
+    being parsed again. The entries of the vocabularies that were parsed are
+    added to ``parsed``, if given, by digest.
+    '''
+    sources = {}
+    # (kind, tag, source, vocabulary name, digest, blob, position in the
+    # file, languages), in loading order
+    segments = []
+    for kind, source in source_files(directory):
+        stat = _stat(source)
+        sources[source] = stat
+        if previous is not None and previous.sources.get(source) == stat:
+            segments.extend(previous.file_segments(source))
+            continue
+        for position, (name, tags, languages, entries) in enumerate(
+                parse_file(source)):
+            blob = marshal.dumps(entries)
+            digest = hashlib.sha1(blob).digest()
+            if parsed is not None:
+                parsed[digest] = entries
+            segments.extend(
+                (kind, tag, source, name, digest, blob, position, languages)
+                for tag in tags)
+
+    # Vocabularies with several tags, or identical ones, are stored once.
+    blobs = []
+    offsets = {}
+    offset = 0
+    tags = dict((kind, {}) for kind in KINDS)
+    for kind, tag, source, name, digest, blob, position, languages in segments:
+        if digest not in offsets:
+            offsets[digest] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+        tags[kind].setdefault(tag, []).append(
+            (source, name, digest) + offsets[digest] + (position, languages))
+    header = marshal.dumps({'sources': sources, 'tags': tags})
+    return [_MAGIC, _HEADER_LENGTH.pack(len(header)), header] + blobs
+
+
+def write_index(path=INDEX_PATH, data=None):
+    '''
+    Writes an index built by ``build_index`` (by default, of
+    VOCABULARY_DIRECTORY) to ``path``.
+    '''
+    if data is None:
+        data = build_index()
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(temporary_path, 'wb') as index_file:
+        for part in data:
+            index_file.write(part)
+    if os.name == 'nt' and os.path.exists(path):
+        # Windows can't rename over an existing file.
+        os.remove(path)
+    os.rename(temporary_path, path)
+
+
+class VocabularyIndex(object):
+    '''
+    A compiled index, opened read only. The entries of each tag are stored as
+    segments, one per vocabulary with that tag: (source file, vocabulary
+    name, digest, offset, length, position in the file, languages).
+    '''
+
+    def __init__(self, path=INDEX_PATH):
+        with open(path, 'rb') as index_file:
+            self._map = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(_MAGIC) + _HEADER_LENGTH.size
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError('%s is not a version %d vocabulary index' % (
+                path, FORMAT_VERSION))
+        (length,) = _HEADER_LENGTH.unpack(self._map[len(_MAGIC):start])
+        header = marshal.loads(self._map[start:start + length])
+        self.sources = header['sources']
+        self._tags = header['tags']
+        self._data = start + length
+
+    def close(self):
+        self._map.close()
+
+    def stale(self, directory=VOCABULARY_DIRECTORY):
+        '''Whether a vocabulary file was added, removed or changed since.'''
+        paths = [path for (kind, path) in source_files(directory)]
+        if sorted(paths) != sorted(self.sources):
+            return True
+        return any(_stat(path) != self.sources[path] for path in paths)
+
+    def tags(self, kind):
+        return sorted(self._tags[kind])
+
+    def segments(self, kind, tag):
+        return self._tags[kind].get(tag, [])
+
+    def _blob(self, segment):
+        start = self._data + segment[3]
+        return self._map[start:start + segment[4]]
+
+    def load(self, segment):
+        '''Returns {spoken: specs} for one segment.'''
+        return marshal.loads(self._blob(segment))
+
+    def file_segments(self, source):
+        '''
+        Returns the segments of one source file as ``build_index`` lists
+        them, with their data.
+        '''
+        return [
+            (kind, tag, source, segment[1], segment[2], self._blob(segment),
+             segment[5], segment[6])
+            for kind in KINDS
+            for (tag, segments) in sorted(self._tags[kind].iteritems())
+            for segment in segments
+            if segment[0] == source
+        ]
+
+    def vocabularies(self, kind, tag):
+        '''Returns [(vocabulary name, {spoken: specs})] for a tag.'''
+        return [(segment[1], self.load(segment))
+                for segment in self.segments(kind, tag)]
+
+    def entries(self, kind, tag):
+        '''Returns {spoken: specs} for a tag; later vocabularies win.'''
+        entries = {}
+        for name, vocabulary in self.vocabularies(kind, tag):
+            entries.update(vocabulary)
+        return entries
+
+
+def open_index(path=INDEX_PATH, directory=VOCABULARY_DIRECTORY):
+    '''Opens the index at ``path``, building it first if it is out of date.'''
+    index = None
+    try:
+        index = VocabularyIndex(path)
+    except (IOError, OSError):
+        pass
+    except Exception as error:
+        # A truncated or otherwise corrupt index; it is rebuilt below.
+        print 'Ignoring the vocabulary index: %s' % error
+    if index is not None and not index.stale(directory):
+        return index
+    data = build_index(directory, previous=index)
+    if index is not None:
+        # Windows can't replace a file that is still mapped.
+        index.close()
+    write_index(path, data)
+    return VocabularyIndex(path)
+
+
+def action(specs):
+    '''Returns the Aenea action for parsed specs, e.g. Text('()') + Key('left').'''
+    actions = [
+        getattr(aenea, kind)(*args, static=True) if static
+        else getattr(aenea, kind)(*args)
+        for (kind, args, static) in specs
+    ]
+    return reduce(lambda first, second: first + second, actions)
+
+
+def _winner(segments, spoken):
+    '''Returns the specs of ``spoken`` in the last segment that has it.'''
+    for segment, entries in reversed(segments):
+        if spoken in entries:
+            return entries[spoken]
+    return None
+
+
+def _key(segment):
+    '''Identifies the vocabulary of a segment: its file and position.'''
+    return (segment[0], segment[5])
+
+
+def _keys(segments):
+    '''Returns the keys of a list of (segment, entries), in order.'''
+    return [_key(segment) for (segment, entries) in segments]
+
+
+class Vocabularies(object):
+    '''
+    The vocabularies of one directory, loaded from its index, and the
+    DictLists handed out for its dynamic tags.
+
+    When a dynamic vocabulary file changes, ``refresh`` only parses that
+    file, and only compares the entries of the vocabularies in it with what
+    each DictList holds (all of them, however little of the file changed). Entries that were added, removed or changed are
+    applied to the DictList, which tells the engine about the change once,
+    and only if the words it can recognise changed. A changed action doesn't
+    concern the engine at all.
+
+    A vocabulary can list the ``languages`` it is for, e.g. "languages":
+    ["python"]. ``set_language`` limits the DictList of a tag to the
+    vocabularies for one language and those without languages; switching
+    languages only applies the entries of the vocabularies switched on or
+    off.
+    '''
+
+    def __init__(self, directory=VOCABULARY_DIRECTORY, path=INDEX_PATH):
+        self.directory = directory
+        self.path = path
+        self._index = None
+        # tag -> DictList handed out by dynamic_vocabulary
+        self._lists = {}
+        # tag -> [(segment, {spoken: specs})] the DictList was built from
+        self._segments = {}
+        # tag -> {spoken: specs} of what the DictList holds
+        self._entries = {}
+        # tag -> language its DictList is limited to
+        self._languages = {}
+
+    def index(self):
+        if self._index is None:
+            self._index = open_index(self.path, self.directory)
+        return self._index
+
+    def static_vocabulary(self, tag):
+        return dict(
+            (spoken, action(specs))
+            for (spoken, specs) in self.index().entries('static', tag).iteritems()
+        )
+
+    def _active_segments(self, index, tag):
+        segments = index.segments('dynamic', tag)
+        language = self._languages.get(tag)
+        if language is None:
+            return segments
+        return [segment for segment in segments
+                if not segment[6] or language in segment[6]]
+
+    def dynamic_vocabulary(self, tag):
+        if tag not in self._lists:
+            index = self.index()
+            segments = [(segment, index.load(segment))
+                        for segment in self._active_segments(index, tag)]
+            entries = {}
+            for segment, vocabulary in segments:
+                entries.update(vocabulary)
+            self._segments[tag] = segments
+            self._entries[tag] = entries
+            self._lists[tag] = DictList('dynamic %s' % tag, (
+                (spoken, action(specs))
+                for (spoken, specs) in entries.iteritems()
+            ))
+        return self._lists[tag]
+
+    def unregister_dynamic_vocabulary(self, tag):
+        for tag_map in (self._lists, self._segments, self._entries,
+                        self._languages):
+            tag_map.pop(tag, None)
+
+    def set_language(self, tag, language):
+        '''
+        Limits the DictList of ``tag`` to the vocabularies for ``language``
+        and those for any language, or lifts the limit if ``language`` is
+        None. Returns the number of entries that were added, removed or
+        changed.
+        '''
+        if self._languages.get(tag) == language:
+            return 0
+        self._languages[tag] = language
+        if tag not in self._lists:
+            return 0
+        return self._update_list(self.index(), tag, {})
+
+    def refresh(self):
+        '''
+        Recompiles the index if a vocabulary file changed, and updates the
+        DictLists of the dynamic vocabularies. Returns the number of entries
+        that were added, removed or changed, or None if nothing was
+        recompiled.
+        '''
+        index = self.index()
+        if not index.stale(self.directory):
+            return None
+        parsed = {}
+        data = build_index(self.directory, previous=index, parsed=parsed)
+        index.close()
+        self._index = None
+        write_index(self.path, data)
+        index = self.index()
+        return sum(self._update_list(index, tag, parsed) for tag in self._lists)
+
+    def _load(self, index, segment, parsed):
+        entries = parsed.get(segment[2])
+        if entries is None:
+            entries = index.load(segment)
+        return entries
+
+    def _update_list(self, index, tag, parsed):
+        current = self._entries[tag]
+        old_segments = self._segments[tag]
+        old = dict((_key(segment), (segment, entries))
+                   for (segment, entries) in old_segments)
+        segments = []
+        # The words whose entry may have changed: those of the vocabularies
+        # that changed, appeared or disappeared.
+        candidates = set()
+        for segment in self._active_segments(index, tag):
+            if _key(segment) in old:
+                old_segment, old_entries = old.pop(_key(segment))
+                if old_segment[2] == segment[2]:
+                    segments.append((segment, old_entries))
+                    continue
+                entries = self._load(index, segment, parsed)
+                candidates.update(
+                    spoken for (spoken, specs) in entries.iteritems()
+                    if old_entries.get(spoken) != specs)
+                candidates.update(set(old_entries).difference(entries))
+            else:
+                entries = self._load(index, segment, parsed)
+                candidates.update(entries)
+            segments.append((segment, entries))
+        for old_segment, old_entries in old.itervalues():
+            candidates.update(old_entries)
+
+        old_keys, keys = _keys(old_segments), _keys(segments)
+        kept = set(old_keys).intersection(keys)
+        if ([key for key in keys if key in kept] !=
+                [key for key in old_keys if key in kept]):
+            # Vocabularies were reordered, which can change which one wins
+            # for any word.
+            candidates.update(current)
+            for segment, entries in segments:
+                candidates.update(entries)
+
+        changed = {}
+        removed = []
+        for spoken in candidates:
+            specs = _winner(segments, spoken)
+            if specs is None:
+                if spoken in current:
+                    removed.append(spoken)
+            elif current.get(spoken) != specs:
+                changed[spoken] = specs
+        self._segments[tag] = segments
+
+        # The DictList is changed through dict's methods, which don't tell
+        # the engine, and then the engine is told once (it is sent the whole
+        # list every time).
+        dict_list = self._lists[tag]
+        words_changed = bool(removed) or any(
+            spoken not in current for spoken in changed)
+        for spoken in removed:
+            del current[spoken]
+            dict.__delitem__(dict_list, spoken)
+        for spoken, specs in changed.iteritems():
+            current[spoken] = specs
+            dict.__setitem__(dict_list, spoken, action(specs))
+        if words_changed:
+            dict_list._update()
+        return len(changed) + len(removed)
+
+
+_vocabularies = Vocabularies()
+_last_refresh = None
+
+
+def static_vocabulary(tag):
+    '''Returns {spoken: action} for the static vocabularies with this tag.'''
+    return _vocabularies.static_vocabulary(tag)
+
+
+def dynamic_vocabulary(tag):
+    '''
+    Returns a DictList of spoken -> action for the dynamic vocabularies with
+    this tag, kept up to date by ``refresh``.
+    '''
+    return _vocabularies.dynamic_vocabulary(tag)
+
+
+def unregister_dynamic_vocabulary(tag):
+    _vocabularies.unregister_dynamic_vocabulary(tag)
+
+
+def set_language(tag, language):
+    '''
+    Limits the DictList of ``tag`` to the vocabularies for ``language`` (and
+    those for any language); None lifts the limit.
+    '''
+    return _vocabularies.set_language(tag, language)
+
+
+def refresh():
+    '''
+    Recompiles the index if a vocabulary file changed, and applies the
+    changes to the DictLists of the dynamic vocabularies. Does nothing if it
+    last looked less than ``REFRESH_INTERVAL`` seconds ago.
+    '''
+    global _last_refresh
+    now = time.time()
+    if (_last_refresh is not None and
+            0 <= now - _last_refresh < REFRESH_INTERVAL):
+        return None
+    _last_refresh = now
+    return _vocabularies.refresh()
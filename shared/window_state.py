@@ -0,0 +1,199 @@
+'''
+Foreground window state shared by the contexts of all grammars.
+
+Before every utterance dragonfly asks each loaded grammar whether its context
+matches. Aenea's proxy contexts answer by asking the server for the remote
+window, so with several grammars loaded one utterance costs several round
+trips and as many regex compilations. The contexts here share one copy of the
+window state instead. It is refreshed when the local foreground window
+changes or when a new utterance begins (any query more than
+``REFRESH_INTERVAL`` seconds after the last refresh), and every context
+remembers its answer until the next refresh.
+
+- ``ProxyAppContext`` takes the same arguments as Aenea's, but its patterns are
+  compiled once and matched against the shared state.
+- ``WindowContext(proxy_context, local_context)`` replaces
+  ``aenea.wrappers.AeneaContext``.
+- ``CachedContext(context)`` remembers the answer of any other context, such as
+  ``aenea.ProxyPlatformContext``, until the next refresh.
+
+Copy this file next to the grammars that use it.
+'''
+
+import re
+import time
+
+import aenea.config
+import aenea.proxy_contexts
+
+from dragonfly import (
+    Context,
+    Window,
+)
+
+REFRESH_INTERVAL = 0.25
+
+
+class WindowState(object):
+    '''The focused window, as seen locally and (when proxied) remotely.'''
+
+    def __init__(self):
+        self.generation = 0
+        self.proxy = False
+        self.properties = {}
+        self._local = None
+        self._refreshed = None
+
+    def refresh(self, executable, title, handle):
+        '''
+        Updates the state if the local window changed or it is out of date,
+        and returns the generation, which changes whenever the state does.
+        '''
+        local = (executable, title, handle)
+        now = time.time()
+        if (local == self._local and self._refreshed is not None and
+                now - self._refreshed < REFRESH_INTERVAL):
+            return self.generation
+
+        self._local = local
+        self._refreshed = now
+        self.proxy = aenea.config.proxy_active()
+        if self.proxy:
+            self.properties = aenea.proxy_contexts._get_context() or {}
+        else:
+            self.properties = {}
+        self.generation += 1
+        return self.generation
+
+    def invalidate(self):
+        self._refreshed = None
+
+    def window_id(self):
+        '''
+        Returns something that identifies the focused (possibly remote)
+        window, using the state of the current utterance if there is one.
+        '''
+        if self._local is None:
+            window = Window.get_foreground()
+            self.refresh(window.executable, window.title, window.handle)
+        if self.proxy:
+            return ('proxy',
+                    self.properties.get('id') or self.properties.get('title'))
+        return ('local', self._local[2])
+
+    def title(self):
+        '''
+        Returns the title of the focused (possibly remote) window, using the
+        state of the current utterance if there is one.
+        '''
+        if self._local is None:
+            window = Window.get_foreground()
+            self.refresh(window.executable, window.title, window.handle)
+        if self.proxy:
+            return self.properties.get('title') or ''
+        return self._local[1] or ''
+
+    def executable(self):
+        '''
+        Returns the application of the focused (possibly remote) window: its
+        app_id or executable remotely, its executable path locally.
+        '''
+        if self._local is None:
+            window = Window.get_foreground()
+            self.refresh(window.executable, window.title, window.handle)
+        if self.proxy:
+            return (self.properties.get('app_id') or
+                    self.properties.get('executable') or '')
+        return self._local[0] or ''
+
+
+state = WindowState()
+
+
+class CachedContext(Context):
+    '''Remembers whether ``context`` matches until the window state changes.'''
+
+    def __init__(self, context):
+        Context.__init__(self)
+        self._context = context
+        self._generation = None
+        self._matched = False
+        self._str = str(context)
+
+    def _evaluate(self, executable, title, handle):
+        return self._context.matches(executable, title, handle)
+
+    def matches(self, executable, title, handle):
+        generation = state.refresh(executable, title, handle)
+        if generation != self._generation:
+            self._matched = bool(self._evaluate(executable, title, handle))
+            self._generation = generation
+        return self._matched
+
+
+class WindowContext(CachedContext):
+    '''
+    Matches ``proxy_context`` while the proxy is in use and ``local_context``
+    otherwise, like ``aenea.wrappers.AeneaContext``.
+    '''
+
+    def __init__(self, proxy_context, local_context):
+        CachedContext.__init__(self, None)
+        self._proxy_context = proxy_context
+        self._local_context = local_context
+        self._str = '%s, %s' % (proxy_context, local_context)
+
+    def _evaluate(self, executable, title, handle):
+        context = self._proxy_context if state.proxy else self._local_context
+        return context.matches(executable, title, handle)
+
+
+class ProxyAppContext(CachedContext):
+    '''
+    Matches the remote window's properties (``title``, ``app_id``, ``cls``,
+    ...) by ``substring``, ``exact`` comparison or ``regex``, requiring all
+    of them to match (``logic='and'``) or any one (``logic='or'``).
+    '''
+
+    def __init__(self, match='substring', case_sensitive=False, logic='and',
+                 **properties):
+        CachedContext.__init__(self, None)
+        if match not in ('substring', 'exact', 'regex'):
+            raise ValueError('Unknown match type %r' % match)
+        if logic not in ('and', 'or'):
+            raise ValueError('Unknown logic %r' % logic)
+        self._combine = all if logic == 'and' else any
+        self._matchers = [
+            (name, _compile(match, pattern, case_sensitive))
+            for (name, pattern) in sorted(properties.iteritems())
+            if pattern is not None
+            ]
+        self._str = ', '.join(
+            '%s=%r' % (name, pattern)
+            for (name, pattern) in sorted(properties.iteritems())
+            )
+
+    def _evaluate(self, executable, title, handle):
+        properties = state.properties
+        return self._combine(
+            matcher(properties.get(name) or '')
+            for (name, matcher) in self._matchers
+            )
+
+
+def _compile(match, pattern, case_sensitive):
+    '''Returns a function that tells whether a property matches ``pattern``.'''
+    if match == 'regex':
+        flags = 0 if case_sensitive else re.IGNORECASE
+        regex = re.compile(pattern, flags)
+        return lambda value: regex.match(value) is not None
+
+    if not case_sensitive:
+        pattern = pattern.lower()
+    if match == 'exact':
+        if case_sensitive:
+            return lambda value: value == pattern
+        return lambda value: value.lower() == pattern
+    if case_sensitive:
+        return lambda value: pattern in value
+    return lambda value: pattern in value.lower()
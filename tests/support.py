@@ -0,0 +1,70 @@
+'''
+Sets up the tests that need dragonfly the way the replay harness does: its
+text engine recognises mimicked words, and the stand-in aenea package in
+tools/replay records the keystrokes the grammars send.
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'tools', 'replay'))
+import replay_bench
+
+replay_bench.setup_paths()
+
+
+def engine():
+    '''Returns dragonfly's text engine, or skips the test without dragonfly.'''
+    try:
+        from dragonfly import get_engine
+    except ImportError:
+        raise unittest.SkipTest('needs dragonfly: pip install dragonfly2')
+    import lazy_grammar
+    # The text engine runs timers in another thread.
+    lazy_grammar.WATCH_INTERVAL = 0
+    return get_engine('text')
+
+
+def temporary_data():
+    '''
+    Points the grammar cache, the vocabulary index and the git option usage
+    at a new temporary directory instead of PROJECT_ROOT, and returns a
+    function that points them back and removes it.
+    '''
+    import git_usage
+    import grammar_cache
+    import vocabulary_index
+    directory = tempfile.mkdtemp()
+    saved = (grammar_cache.CACHE_DIRECTORY, git_usage.USAGE_PATH,
+             vocabulary_index._vocabularies)
+    grammar_cache.CACHE_DIRECTORY = os.path.join(directory, 'grammar_cache')
+    git_usage.USAGE_PATH = os.path.join(directory, 'grammar_usage', 'git.json')
+    vocabulary_index._vocabularies = vocabulary_index.Vocabularies(
+        path=os.path.join(directory, 'grammar_cache', 'vocabulary.index'))
+
+    def restore():
+        (grammar_cache.CACHE_DIRECTORY, git_usage.USAGE_PATH,
+         vocabulary_index._vocabularies) = saved
+        shutil.rmtree(directory)
+    return restore
+
+
+def set_window(**properties):
+    '''Makes the stand-in Aenea server report a window with ``properties``.'''
+    import aenea.proxy_contexts
+    import window_state
+    window = aenea.proxy_contexts.window
+    window.clear()
+    window.update(replay_bench.EMPTY_WINDOW)
+    window.update(properties)
+    window_state.state.invalidate()
+
+
+def corpus():
+    with open(os.path.join(ROOT, 'tools', 'replay', 'corpus.json')) as corpus_file:
+        import json
+        return json.load(corpus_file)
@@ -0,0 +1,85 @@
+'''Batching the actions of one utterance, and scaling the repeats in it.'''
+
+import operator
+import unittest
+
+import support
+
+
+class BatchExecutorTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import aenea.communications
+        import batch_executor
+        from aenea import Key, Text
+        self.server = aenea.communications.server
+        self.server.take()
+        self.batch_executor = batch_executor
+        self.Key, self.Text = Key, Text
+
+    def execute(self, action):
+        self.batch_executor.execute_batched([action])
+        return self.server.take()
+
+    def keys(self, commands):
+        return [(kwargs.get('key'), kwargs.get('count', 1))
+                if name == 'key_press' else kwargs['text']
+                for (name, args, kwargs) in commands]
+
+    def counted(self, action):
+        '''Returns ``action`` and a list that grows each time it executes.'''
+        executions = []
+        original = action.execute
+
+        def execute(data=None):
+            executions.append(data)
+            return original(data)
+        action.execute = execute
+        return action, executions
+
+    def test_repeat_is_one_event(self):
+        commands, calls = self.execute(
+            self.batch_executor.repeated(self.Key('up'), 1000))
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.keys(commands), [('up', 1000)])
+
+    def test_nested_repeats_execute_once(self):
+        up, ups = self.counted(self.Key('up'))
+        right, rights = self.counted(self.Key('right'))
+        repeated = self.batch_executor.repeated
+        # What multiedit's RepeatRule executes for "up 5 right 3 repeat 10
+        # times".
+        sequence = reduce(operator.add, [repeated(up, 5), repeated(right, 3)])
+        commands, calls = self.execute(repeated(sequence, 10))
+        self.assertEqual((len(ups), len(rights)), (1, 1))
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.keys(commands), [('up', 5), ('right', 3)] * 10)
+
+    def test_nested_repeats_of_one_event_scale(self):
+        up, ups = self.counted(self.Key('up'))
+        repeated = self.batch_executor.repeated
+        commands, calls = self.execute(repeated(repeated(up, 5), 200))
+        self.assertEqual(len(ups), 1)
+        self.assertEqual(self.keys(commands), [('up', 1000)])
+
+    def test_mixed_repeat_grows_by_its_merged_events(self):
+        # The server can't repeat a mix of events: each repeat sends the
+        # merged events of one execution.
+        escape, escapes = self.counted(self.Key('escape'))
+        action = self.Text('a') + self.Text('b') + escape
+        commands, calls = self.execute(
+            self.batch_executor.repeated(action, 50))
+        self.assertEqual(len(escapes), 1)
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(commands), 2 * 50)
+        self.assertEqual(self.keys(commands[:3]),
+                         ['ab', ('escape', 1), 'ab'])
+
+    def test_zero_repeats_do_nothing(self):
+        commands, calls = self.execute(
+            self.batch_executor.repeated(self.Key('up'), 0))
+        self.assertEqual((commands, calls), ([], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
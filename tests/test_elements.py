@@ -0,0 +1,67 @@
+'''Sharing elements between rules, and reloading the grammars using them.'''
+
+import unittest
+
+import support
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = support.engine()
+        self.addCleanup(support.temporary_data())
+
+    def reload(self, name, window):
+        '''
+        Loads, builds and unloads a grammar module twice, as NatLink would, and
+        checks the second grammar has none of the first one's rules: older
+        versions of dragonfly refuse to move a rule to another grammar.
+        '''
+        import lazy_grammar
+        import replay_bench
+        support.set_window(**window)
+        rules = []
+        for attempt in range(2):
+            module = replay_bench.load_module(name)
+            try:
+                lazy_grammar.build_all()
+                rules.append(set(
+                    rule for lazy in lazy_grammar._lazy_grammars
+                    for rule in lazy.grammar.rules))
+            finally:
+                module.unload()
+        self.assertTrue(rules[1])
+        self.assertEqual(rules[0] & rules[1], set())
+
+    def test_reload_chromium(self):
+        self.reload('_chromium', support.corpus()['_chromium']['window'])
+
+    def test_reload_multiedit(self):
+        self.reload('_multiedit', support.corpus()['_multiedit']['window'])
+
+    def test_reload_vim(self):
+        self.reload('_vim', support.corpus()['_vim']['window'])
+
+
+class ScopeTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+
+    def test_shared_within_a_scope(self):
+        import elements
+        self.assertIs(elements.integer_ref('n', 1, 10, 'scope test'),
+                      elements.integer_ref('n', 1, 10, 'scope test'))
+        self.assertIsNot(elements.integer_ref('n', 1, 10, 'scope test'),
+                         elements.integer_ref('n', 1, 10, 'other scope'))
+
+    def test_release(self):
+        import elements
+        before = elements.letter_ref('letter', 'scope test')
+        elements.release('scope test')
+        self.assertIsNot(elements.letter_ref('letter', 'scope test'), before)
+        # Grammar independent elements are kept.
+        self.assertIs(elements.text_actions('DIGITS'),
+                      elements.text_actions('DIGITS'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+'''Typing git command lines, quoted for the shell of the focused terminal.'''
+
+import unittest
+
+import support
+
+
+class CommandLineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        support.engine()
+        cls.restore_data = staticmethod(support.temporary_data())
+        import aenea.communications
+        import replay_bench
+        cls.server = aenea.communications.server
+        cls.git = replay_bench.load_module('_git')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.git.unload()
+        cls.restore_data()
+
+    def typed(self, app_id, parts):
+        support.set_window(title='~/src', app_id=app_id)
+        self.server.take()
+        self.git._command_line(parts).execute()
+        return ''.join(kwargs['text'] for (name, args, kwargs)
+                       in self.server.take()[0] if name == 'write_text')
+
+    def options(self, command):
+        '''The option texts of ``command``, by what is said.'''
+        data = self.git.command_data()
+        if command == 'common_refs':
+            return data['shared_options'][command]
+        for command_data in data['commands']:
+            if command_data['name'] == command:
+                return command_data['options']
+
+    def command_line(self, app_id, command, *spoken):
+        options = self.options(command)
+        refs = self.options('common_refs')
+        import git_commands
+        return self.typed(app_id, [git_commands.Verbatim('git ' + command)] + [
+            options[said] if said in options else refs[said]
+            for said in spoken])
+
+    def test_posix_shell_quotes_single_arguments(self):
+        self.assertEqual(
+            self.command_line('gnome-terminal', 'stash', 'stash at [zero]'),
+            "git stash 'stash@{0}'")
+        self.assertEqual(
+            self.typed('gnome-terminal', [' feature(x)', ' --all']),
+            " 'feature(x)' --all")
+
+    def test_convenience_options_are_typed_as_written(self):
+        self.assertEqual(
+            self.command_line('gnome-terminal', 'pull', 'easy push'),
+            'git pull --rebase && git push')
+        self.assertEqual(
+            self.command_line('gnome-terminal', 'checkout', 'select branch'),
+            'git checkout `fbr`')
+
+    def test_cmd_is_not_quoted(self):
+        for app_id in ['cmd', 'C:\\Windows\\System32\\cmd.exe', 'DOS prompt']:
+            self.assertEqual(
+                self.command_line(app_id, 'stash', 'stash at [zero]'),
+                'git stash stash@{0}')
+
+    def test_recognised_command_is_one_payload(self):
+        import lazy_grammar
+        lazy_grammar.build_all()
+        support.set_window(title='~/src', app_id='gnome-terminal')
+        self.server.take()
+        support.engine().mimic('cancel git checkout stash at zero enter'.split())
+        commands, calls = self.server.take()
+        self.assertEqual(calls, 1)
+        self.assertEqual(
+            [(name, kwargs.get('text') or kwargs.get('key'))
+             for (name, args, kwargs) in commands],
+            [('key_press', 'c'),
+             ('write_text', "git checkout 'stash@{0}'"),
+             ('key_press', 'enter')])
+
+    def test_options_survive_the_cache(self):
+        import git_commands
+        options = self.options('pull')
+        self.assertIsInstance(options['easy push'], git_commands.Verbatim)
+
+
+if __name__ == '__main__':
+    unittest.main()
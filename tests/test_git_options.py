@@ -0,0 +1,51 @@
+'''Resolving dictated words to the options in git_option_index.json.'''
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, '_git'))
+import git_options
+
+INDEX_PATH = os.path.join(ROOT, '_git', 'git_option_index.json')
+
+
+class ResolveTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = git_options.OptionIndex(INDEX_PATH)
+
+    def assertResolves(self, utterance, expected):
+        words = utterance.split()
+        self.assertEqual(
+            self.index.resolve(words[0], words[1:]), expected)
+
+    def test_options_and_arguments(self):
+        self.assertResolves('push force with lease', ['--force-with-lease'])
+        self.assertResolves('merge squash develop', ['--squash', 'develop'])
+        self.assertResolves('push dry run origin', ['--dry-run', 'origin'])
+
+    def test_options_keep_the_words_after_them(self):
+        self.assertResolves('push set upstream origin main',
+                            ['--set-upstream', 'origin', 'main'])
+        self.assertResolves('rebase interactive head',
+                            ['--interactive', 'head'])
+        self.assertResolves('merge ff only develop', ['--ff-only', 'develop'])
+
+    def test_near_misses(self):
+        self.assertResolves('rebase interact', ['--interactive'])
+
+    def test_negated_options(self):
+        self.assertResolves('commit amend no edit', ['--amend', '--no-edit'])
+        self.assertResolves('merge no ff', ['--no-ff'])
+        self.assertResolves('merge no ff quiet', ['--no-ff', '--quiet'])
+        # Listed in the index as it is.
+        self.assertResolves('commit no verify', ['--no-verify'])
+
+    def test_unknown_words_are_typed(self):
+        self.assertResolves('push origin master', ['origin', 'master'])
+
+
+if __name__ == '__main__':
+    unittest.main()
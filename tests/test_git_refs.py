@@ -0,0 +1,66 @@
+'''Reading ref names from a repository's .git directory.'''
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import support
+
+
+def git(directory, *arguments):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+             '-c', 'init.defaultBranch=master'] + list(arguments),
+            cwd=directory, stdout=devnull, stderr=devnull)
+
+
+class RefReaderTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        self.directory = tempfile.mkdtemp()
+        self.repository = os.path.join(self.directory, 'repository')
+        os.mkdir(self.repository)
+        try:
+            git(self.repository, 'init')
+        except OSError:
+            shutil.rmtree(self.directory)
+            raise unittest.SkipTest('needs git')
+        git(self.repository, 'commit', '--allow-empty', '-m', 'first')
+        git(self.repository, 'branch', 'feature-x')
+        git(self.repository, 'tag', 'v1.0')
+        git(self.repository, 'remote', 'add', 'origin', self.repository)
+        git(self.repository, 'pack-refs', '--all')
+        git(self.repository, 'branch', 'loose')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def refs(self, path):
+        import git_refs
+        reader = git_refs.RefReader(git_refs.find_git_directory(path))
+        return reader.refs()[0]
+
+    def test_repository(self):
+        self.assertEqual(self.refs(self.repository),
+                         ['feature-x', 'loose', 'master', 'v1.0', 'origin'])
+
+    def test_linked_worktree(self):
+        worktree = os.path.join(self.directory, 'worktree')
+        git(self.repository, 'worktree', 'add', worktree, '-b', 'worked')
+        import git_refs
+        git_directory = git_refs.find_git_directory(worktree)
+        # The worktree's own directory, which has its HEAD...
+        self.assertTrue(os.path.isfile(os.path.join(git_directory, 'HEAD')))
+        self.assertNotEqual(git_directory,
+                            os.path.join(self.repository, '.git'))
+        # ...but the refs are the repository's.
+        self.assertEqual(
+            self.refs(worktree),
+            ['feature-x', 'loose', 'master', 'worked', 'v1.0', 'origin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+'''Saying a git command, then its options in the next utterance.'''
+
+import unittest
+
+import support
+
+
+class StagedOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = support.engine()
+        self.addCleanup(support.temporary_data())
+        import aenea.communications
+        import lazy_grammar
+        import replay_bench
+        self.server = aenea.communications.server
+        self.git = replay_bench.load_module('_git')
+        self.addCleanup(self.git.unload)
+        self.git.conf['staged_options'] = True
+        self.addCleanup(self.git.conf.pop, 'staged_options')
+        support.set_window(title='~/src', app_id='gnome-terminal')
+        lazy_grammar.build_all()
+
+    def say(self, utterance):
+        self.server.take()
+        self.engine.mimic(utterance.split())
+        return ''.join(kwargs['text'] for (name, args, kwargs)
+                       in self.server.take()[0] if name == 'write_text')
+
+    def test_generated_options_are_offered(self):
+        self.assertEqual(self.say('git add'), 'git add')
+        # --ignore-errors is only in git_option_index.json, --all is also
+        # in git_commands.py.
+        self.assertEqual(self.say('ignore errors all'),
+                         ' --ignore-errors --all')
+
+    def test_hand_picked_options_are_kept(self):
+        data = self.git.with_generated_options(dict(
+            name='add', options={'everything': ' --all'}, shared_options=[]))
+        self.assertEqual(data['options']['everything'], ' --all')
+        self.assertNotIn('all', data['options'])
+        self.assertEqual(data['options']['dry run'], ' --dry-run')
+        self.assertEqual(data['option_order'][0], 'everything')
+
+
+if __name__ == '__main__':
+    unittest.main()
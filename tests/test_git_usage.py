@@ -0,0 +1,78 @@
+'''Keeping the most used git options within a budget.'''
+
+import unittest
+
+import support
+
+
+class Usage(object):
+    def __init__(self, counts):
+        self.counts = counts
+
+    def count(self, command, option):
+        return self.counts.get(command, {}).get(option, 0)
+
+    def total(self):
+        return sum(sum(counts.values()) for counts in self.counts.values())
+
+
+def command(name, count, shared_options=()):
+    aliases = ['%s %d' % (name, number) for number in range(count)]
+    return {
+        'name': name,
+        'options': dict((alias, ' --' + alias.replace(' ', '-'))
+                        for alias in aliases),
+        'option_order': aliases,
+        'shared_options': list(shared_options),
+    }
+
+
+class FitBudgetTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import git_usage
+        self.fit_budget = git_usage.fit_budget
+        self.commands = [command('add', 30, ['refs']), command('log', 30)]
+        self.shared = {'refs': dict(('ref %d' % number, ' ref%d' % number)
+                                    for number in range(10))}
+
+    def kept(self, budget, counts):
+        commands = self.fit_budget(
+            self.commands, self.shared, budget, Usage(counts))
+        return sorted(alias for data in commands for alias in data['options'])
+
+    def test_under_budget(self):
+        self.assertEqual(len(self.kept(100, {})), 60)
+
+    def test_shared_groups_count_once(self):
+        # 50 = 10 shared options + 40 of the commands' own.
+        self.assertEqual(len(self.kept(50, {})), 40)
+        alone = self.fit_budget(
+            self.commands[1:], self.shared, 50, Usage({}))
+        self.assertEqual(len(alone[0]['options']), 30)
+
+    def test_most_used_are_kept(self):
+        counts = {'log': dict(('--log-%d' % number, number + 1)
+                              for number in range(30))}
+        kept = self.kept(30, counts)
+        # 18 of the 20 places go to the most used options, 2 to the
+        # rotation of the options never said.
+        self.assertEqual(len(kept), 20)
+        self.assertEqual(
+            len([alias for alias in kept if alias.startswith('log')]), 18)
+        self.assertIn('log 29', kept)
+        self.assertNotIn('log 11', kept)
+
+    def test_unused_options_take_turns(self):
+        seen = set()
+        for total in range(59):
+            counts = {'log': {'--log-0': total + 1}}
+            kept = self.kept(12, counts)
+            self.assertIn('log 0', kept)
+            self.assertEqual(self.kept(12, counts), kept)
+            seen.update(kept)
+        self.assertEqual(len(seen), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
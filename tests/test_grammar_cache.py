@@ -0,0 +1,59 @@
+'''Rebuilding cached grammar tables when their sources change.'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+
+class CachedTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import grammar_cache
+        self.grammar_cache = grammar_cache
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.saved = grammar_cache.CACHE_DIRECTORY
+        grammar_cache.CACHE_DIRECTORY = os.path.join(self.root, 'cache')
+        self.builds = 0
+
+    def tearDown(self):
+        self.grammar_cache.CACHE_DIRECTORY = self.saved
+
+    def write(self, path, text):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output:
+            output.write(text)
+
+    def build(self):
+        self.builds += 1
+        return {'built': self.builds}
+
+    def cached(self):
+        sources = self.grammar_cache.config_sources('git', self.root)
+        return self.grammar_cache.cached('git', sources, self.build)
+
+    def test_config_is_a_source(self):
+        self.write('grammar_config/git.json', '{}')
+        self.assertEqual(self.cached(), {'built': 1})
+        self.assertEqual(self.cached(), {'built': 1})
+
+        self.write('grammar_config/git.json', '{"staged_options": true}')
+        self.assertEqual(self.cached(), {'built': 2})
+        self.assertEqual(self.cached(), {'built': 2})
+
+    def test_vocabularies_are_not_sources(self):
+        self.write('grammar_config/git.json', '{}')
+        self.assertEqual(self.cached(), {'built': 1})
+
+        self.write('vocabulary_config/static/names.json', '{"a": "b"}')
+        self.write('vocabulary_config/dynamic/python.json', '{}')
+        self.assertEqual(self.cached(), {'built': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
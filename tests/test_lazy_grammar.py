@@ -0,0 +1,108 @@
+'''Building grammars through lazy_grammar's stub and window check.'''
+
+import unittest
+
+import support
+
+
+class LazyGrammarTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = support.engine()
+        self.addCleanup(support.temporary_data())
+        import aenea.communications
+        import lazy_grammar
+        from aenea import Key, MappingRule
+        from window_state import ProxyAppContext
+
+        self.server = aenea.communications.server
+        self.server.take()
+        support.set_window(title='other')
+        self.lazy = lazy_grammar.LazyGrammar(
+            'lazy_test',
+            context=ProxyAppContext(title='lazy test window'),
+            build=lambda grammar: grammar.add_rule(MappingRule(
+                name='lazy_test', mapping={'lazy test key': Key('a')})),
+        )
+        self.lazy.load()
+
+    def tearDown(self):
+        self.lazy.unload()
+
+    def mimic(self, words):
+        self.engine.mimic(words.split())
+        return self.server.take()[0]
+
+    def test_stub_builds_at_the_first_utterance(self):
+        from dragonfly import MimicFailure
+        support.set_window(title='lazy test window')
+        # Dragon doesn't recognise this utterance with the grammar the stub
+        # builds at its start (the text engine happens to).
+        try:
+            self.mimic('lazy test key')
+        except MimicFailure:
+            pass
+        self.assertIsNotNone(self.lazy.grammar)
+        self.assertEqual(len(self.mimic('lazy test key')), 1)
+
+    def test_window_check_builds_before_the_utterance(self):
+        import lazy_grammar
+        lazy_grammar.build_matching()
+        self.assertIsNone(self.lazy.grammar)
+
+        support.set_window(title='lazy test window')
+        lazy_grammar.build_matching()
+        self.assertIsNotNone(self.lazy.grammar)
+        self.assertEqual(len(self.mimic('lazy test key')), 1)
+
+    def test_window_check_asks_the_server_only_on_a_window_change(self):
+        import aenea.proxy_contexts
+        import lazy_grammar
+        import window_state
+
+        class ForegroundWindow(object):
+            executable = 'vbox'
+            title = 'vm'
+            handle = 1
+
+            @classmethod
+            def get_foreground(cls):
+                return cls
+
+        calls = []
+        get_context = aenea.proxy_contexts._get_context
+
+        def counting_get_context():
+            calls.append(1)
+            return get_context()
+
+        real_window = lazy_grammar.Window
+        lazy_grammar.Window = ForegroundWindow
+        aenea.proxy_contexts._get_context = counting_get_context
+        try:
+            for tick in range(5):
+                window_state.state.invalidate()
+                lazy_grammar._watch()
+            self.assertEqual(len(calls), 1)
+            self.assertIsNone(self.lazy.grammar)
+
+            support.set_window(title='lazy test window')
+            ForegroundWindow.handle = 2
+            lazy_grammar._watch()
+            self.assertEqual(len(calls), 2)
+            self.assertIsNotNone(self.lazy.grammar)
+        finally:
+            lazy_grammar.Window = real_window
+            aenea.proxy_contexts._get_context = get_context
+            lazy_grammar._watched_window = None
+
+    def test_replay_lazily(self):
+        import replay_bench
+        recording = support.corpus()['_chromium']
+        result, failures = replay_bench.replay_module(
+            self.engine, '_chromium', recording, 1, False, lazy=True)
+        self.assertEqual(failures, [])
+        self.assertEqual(result['utterances'], len(recording['utterances']))
+
+
+if __name__ == '__main__':
+    unittest.main()
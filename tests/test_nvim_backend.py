@@ -0,0 +1,122 @@
+'''Sending vim keys to Neovim's msgpack-RPC socket.'''
+
+import socket
+import struct
+import unittest
+
+import support
+
+
+def unpack(data):
+    '''Decodes the msgpack NvimSender writes; returns (value, rest).'''
+    first = ord(data[0])
+    if first < 0x80:
+        return first, data[1:]
+    if first & 0xf0 == 0x90:
+        return unpack_array(first & 0x0f, data[1:])
+    if first == 0xdc:
+        return unpack_array(struct.unpack('>H', data[1:3])[0], data[3:])
+    if first & 0xe0 == 0xa0:
+        length, data = first & 0x1f, data[1:]
+    elif first == 0xd9:
+        length, data = ord(data[1]), data[2:]
+    elif first == 0xda:
+        length, data = struct.unpack('>H', data[1:3])[0], data[3:]
+    else:
+        raise ValueError('unexpected msgpack type %#x' % first)
+    return data[:length], data[length:]
+
+
+def unpack_array(length, data):
+    items = []
+    for i in range(length):
+        item, data = unpack(data)
+        items.append(item)
+    return items, data
+
+
+class NvimSenderTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import aenea.communications
+        import nvim_backend
+        self.server = aenea.communications.server
+        self.server.take()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(self.listener.close)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.listener.settimeout(2)
+        self.sender = nvim_backend.NvimSender(
+            '127.0.0.1:%d' % self.listener.getsockname()[1])
+        self.addCleanup(self.sender.close)
+        self.connection = None
+
+    def received(self):
+        '''Returns the messages Neovim would have received so far.'''
+        if self.connection is None:
+            self.connection, address = self.listener.accept()
+            self.addCleanup(self.connection.close)
+            self.connection.settimeout(1)
+        data = self.connection.recv(65536)
+        messages = []
+        while data:
+            message, data = unpack(data)
+            messages.append(message)
+        return messages
+
+    def test_sends_one_input_notification(self):
+        support.set_window(title='main.py (~/src) - NVIM')
+        self.sender([
+            ('write_text', (), {'text': 'd5j'}),
+            ('key_press', (), {'key': 'escape', 'count': 2}),
+            ('write_text', (), {'text': 'a<b'}),
+        ])
+        self.assertEqual(self.received(),
+                         [[2, 'nvim_input', ['d5j<Esc><Esc>a<lt>b']]])
+        self.assertEqual(self.server.take(), ([], 0))
+
+    def test_long_input(self):
+        support.set_window(title='main.py - NVIM')
+        self.sender([('write_text', (), {'text': 'x' * 300})])
+        self.assertEqual(self.received(), [[2, 'nvim_input', ['x' * 300]]])
+
+    def test_other_vim_windows_get_keystrokes(self):
+        support.set_window(title='main.py (~/src) - VIM')
+        commands = [('write_text', (), {'text': 'dd'})]
+        self.sender(commands)
+        self.assertEqual(self.server.take(), (commands, 1))
+        self.assertIsNone(self.sender._socket)
+
+    def test_refused_connection_falls_back_to_keystrokes(self):
+        support.set_window(title='main.py - NVIM')
+        self.listener.close()
+        commands = [('write_text', (), {'text': 'dd'})]
+        self.sender(commands)
+        self.assertEqual(self.server.take(), (commands, 1))
+
+    def test_closed_connection_is_reopened(self):
+        support.set_window(title='main.py - NVIM')
+        self.sender([('write_text', (), {'text': 'dd'})])
+        self.assertEqual(self.received(), [[2, 'nvim_input', ['dd']]])
+        # Neovim restarts: the old connection is closed.
+        self.connection.close()
+        self.connection = None
+        self.sender([('write_text', (), {'text': 'yy'})])
+        self.assertEqual(self.received(), [[2, 'nvim_input', ['yy']]])
+        self.assertEqual(self.server.take(), ([], 0))
+
+    def test_closed_connection_falls_back_to_keystrokes(self):
+        support.set_window(title='main.py - NVIM')
+        self.sender([('write_text', (), {'text': 'dd'})])
+        self.received()
+        # Neovim exits: nothing listens any more.
+        self.connection.close()
+        self.listener.close()
+        commands = [('write_text', (), {'text': 'yy'})]
+        self.sender(commands)
+        self.assertEqual(self.server.take(), (commands, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
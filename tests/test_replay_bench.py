@@ -0,0 +1,38 @@
+'''The replay harness's verdict on the grammars it measures.'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+
+class ReplayBenchTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        self.addCleanup(support.temporary_data())
+        import replay_bench
+        self.replay_bench = replay_bench
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def replay(self, recording):
+        path = os.path.join(self.directory, 'corpus.json')
+        with open(path, 'w') as corpus_file:
+            json.dump({'_chromium': recording}, corpus_file)
+        return self.replay_bench.main(
+            ['--corpus', path, '--repeat', '1', '_chromium'])
+
+    def test_recognised_utterances_pass(self):
+        self.assertEqual(self.replay(support.corpus()['_chromium']), 0)
+
+    def test_a_module_that_recognises_nothing_fails(self):
+        recording = dict(support.corpus()['_chromium'],
+                         utterances=['no such words'])
+        self.assertEqual(self.replay(recording), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
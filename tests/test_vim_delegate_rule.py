@@ -0,0 +1,64 @@
+'''Passing the values of a vim rule's spec elements to delegate_value.'''
+
+import unittest
+
+import support
+
+
+class DelegateRuleTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = support.engine()
+        self.addCleanup(support.temporary_data())
+        import replay_bench
+        support.set_window(**support.corpus()['_vim']['window'])
+        self.vim = replay_bench.load_module('_vim')
+        self.addCleanup(self.vim.unload)
+
+    def recognised(self, rule, words):
+        '''Returns the value ``rule`` gives the recognition of ``words``.'''
+        from dragonfly import Grammar
+        values = []
+        rule.process_recognition = lambda node: values.append(rule.value(node))
+        grammar = Grammar('delegate_test')
+        grammar.add_rule(rule)
+        grammar.load()
+        try:
+            self.engine.mimic(words.split())
+        finally:
+            grammar.unload()
+        return values[0]
+
+    def test_delegate_value_is_abstract(self):
+        class Incomplete(self.vim.DelegateRule):
+            spec = 'incomplete'
+        self.assertRaises(TypeError, Incomplete)
+
+    def test_single_element_spec(self):
+        from dragonfly import Alternative, Literal
+
+        class Single(self.vim.DelegateRule):
+            spec = '<choice>'
+            extras = [Alternative([Literal('first', value='1'),
+                                   Literal('second', value='2')],
+                                  name='choice')]
+
+            def delegate_value(self, choice):
+                return choice
+        self.assertEqual(self.recognised(Single(), 'second'), '2')
+
+    def test_elements_in_spec_order(self):
+        from dragonfly import Alternative, Literal
+
+        class Pair(self.vim.DelegateRule):
+            spec = '[<left>] middle <right>'
+            extras = [Alternative([Literal('ay', value='a')], name='right'),
+                      Alternative([Literal('bee', value='b')], name='left')]
+
+            def delegate_value(self, left, middle, right):
+                return left, right
+        self.assertEqual(self.recognised(Pair(), 'bee middle ay'), ('b', 'a'))
+        self.assertEqual(self.recognised(Pair(), 'middle ay'), (None, 'a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
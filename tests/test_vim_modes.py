@@ -0,0 +1,104 @@
+'''When the vim grammar leaves insert mode, with and without lazy_escape.'''
+
+import unittest
+
+import support
+
+VIM = {'id': 1, 'title': 'main.py (~/src) - VIM', 'app_id': 'gvim'}
+OTHER_VIM = {'id': 2, 'title': 'other.py (~/src) - VIM', 'app_id': 'gvim'}
+
+
+def sent(commands):
+    '''Returns the keys and text of ``commands``, e.g. ['escape:2', 'a', 'text'].'''
+    events = []
+    for name, args, kwargs in commands:
+        if name == 'key_press':
+            key = kwargs['key']
+            if kwargs['count'] != 1:
+                key += ':%d' % kwargs['count']
+            events.append(key)
+        elif name == 'write_text':
+            events.append(kwargs['text'])
+    return events
+
+
+class ModeTest(unittest.TestCase):
+    lazy_escape = False
+
+    def setUp(self):
+        self.engine = support.engine()
+        self.addCleanup(support.temporary_data())
+        import aenea.communications
+        import lazy_grammar
+        import replay_bench
+        import vim_modes
+        support.set_window(**VIM)
+        self.server = aenea.communications.server
+        self.module = replay_bench.load_module('_vim')
+        self.addCleanup(self.module.unload)
+        self.tracker = vim_modes.VimModeTracker(lazy_escape=self.lazy_escape)
+        self.module.mode_tracker = self.tracker
+        lazy_grammar.build_all()
+        self.server.take()
+
+    def say(self, utterance):
+        self.engine.mimic(utterance.split())
+        return sent(self.server.take()[0])
+
+
+class EagerEscapeTest(ModeTest):
+    def test_insertion_escapes_at_the_end(self):
+        self.assertEqual(self.say('syn camel HELLO WORLD'),
+                         ['a', 'helloWorld', 'escape:2'])
+        self.assertEqual(self.say('score MORE WORDS'),
+                         ['a', 'more_words', 'escape:2'])
+
+    def test_normal_commands_never_escape(self):
+        self.assertEqual(self.say('up up up left'), ['3kh'])
+        self.assertEqual(self.say('dell three yope'), ['3dw'])
+
+    def test_insertion_entry_escapes_at_the_end(self):
+        self.assertEqual(self.say('inns ace three'),
+                         ['i', 'space:3', 'escape:2'])
+
+
+class LazyEscapeTest(ModeTest):
+    lazy_escape = True
+
+    def test_insertion_stays_in_insert_mode(self):
+        self.assertEqual(self.say('syn camel HELLO WORLD'), ['a', 'helloWorld'])
+        self.assertEqual(self.say('score MORE WORDS'), ['more_words'])
+
+    def test_normal_command_escapes_first(self):
+        self.say('syn camel HELLO WORLD')
+        self.assertEqual(self.say('up up up left'), ['escape:2', '3kh'])
+        self.assertEqual(self.say('up up up left'), ['3kh'])
+
+    def test_normal_commands_never_escape(self):
+        self.assertEqual(self.say('up up up left'), ['3kh'])
+        self.assertEqual(self.say('inns ace three'), ['i', 'space:3'])
+
+    def test_escaped_after_the_timeout(self):
+        self.say('syn camel HELLO WORLD')
+        self.tracker.timeout = 0
+        # Escape might have been pressed on the keyboard since, so insert mode
+        # is entered again instead of reused.
+        self.assertEqual(self.say('score MORE WORDS'),
+                         ['escape:2', 'a', 'more_words'])
+
+    def test_focus_change(self):
+        self.say('syn camel HELLO WORLD')
+        # The other window is in normal mode: it gets no escape.
+        support.set_window(**OTHER_VIM)
+        self.assertEqual(self.say('up up up left'), ['3kh'])
+        self.assertEqual(self.say('score MORE WORDS'), ['a', 'more_words'])
+        # Back in the first window, which was left in insert mode.
+        support.set_window(**VIM)
+        self.assertEqual(self.say('up up up left'), ['escape:2', '3kh'])
+        # The other window was left in insert mode in turn.
+        support.set_window(**OTHER_VIM)
+        self.assertEqual(self.say('dell three yope'), ['escape:2', '3dw'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+'''
+The vim peephole pass: what it rewrites, and that vim ends up in the same
+state with the rewritten keys as with the original ones.
+'''
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import support
+
+BUFFER = [
+    'def main(args):',
+    '    first second third fourth fifth sixth',
+    '    (one [two] three) four five',
+    '    alpha beta gamma delta epsilon',
+    '',
+    '    zeta eta theta iota kappa lambda',
+    '    mu nu xi omicron pi rho sigma',
+    '    tau upsilon phi chi psi omega',
+    '    return args',
+]
+
+# Commands the grammar can produce, each with what the pass makes of them.
+CORPUS = [
+    ([('c', '2d3w')], [('c', '6dw')]),
+    ([('c', 'd1d')], [('c', 'dd')]),
+    ([('c', '2y1G')], [('c', '2yG')]),
+    ([('c', '2>1j')], [('c', '2>j')]),
+    ([('c', '3c1w')], [('c', '3cw')]),
+    ([('c', '1j')], [('c', 'j')]),
+    ([('c', '1G'), ('c', 'x')], [('c', '1Gx')]),
+    ([('c', '1%'), ('c', 'x')], [('c', '1%x')]),
+    ([('c', '3j'), ('c', '2j')], [('c', '5j')]),
+    ([('c', '4j'), ('c', '9j'), ('c', 'x')], [('c', '13jx')]),
+    ([('c', '3l'), ('c', 'l')], [('c', '4l')]),
+    ([('c', '2gj'), ('c', '1gj')], [('c', '3gj')]),
+    ([('c', '5j'), ('c', '5k')], [('c', '5j5k')]),
+    ([('c', 'G'), ('c', '5j'), ('c', '5k'), ('c', 'x')],
+     [('c', 'G5j5kx')]),
+    ([('c', ''), ('c', 'x'), ('c', ''), ('c', 'x')], [('c', 'xx')]),
+    ([('c', '3dd'), ('c', '1j'), ('c', '2p')], [('c', '3ddj2p')]),
+    ([('c', 'w'), ('i', 'empty'), ('c', 'x')], [('c', 'wx')]),
+    ([('c', '2w'), ('i', 'text'), ('c', '2k')],
+     [('c', '2w'), ('i', 'text'), ('c', '2k')]),
+    # Plugin operators such as tComment's gc handle counts themselves.
+    ([('c', 'gc2j')], [('c', 'gc2j')]),
+    ([('c', '3gcc')], [('c', '3gcc')]),
+]
+
+
+def vim_available():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['vim', '--version'], stdout=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+class PeepholeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        support.engine()
+        from aenea import NoAction, Text
+        # Insertions as the grammar makes them: (entry, action).
+        cls.insertions = {
+            'empty': (None, NoAction()),
+            'text': (None, Text('inserted')),
+        }
+
+    def commands(self, items):
+        return [(mode, self.insertions[value] if mode == 'i' else value)
+                for (mode, value) in items]
+
+    def keys(self, items):
+        '''The keys vim is sent for ``items``, as vim_modes would send them.'''
+        keys = ''
+        for mode, value in items:
+            if mode == 'c':
+                keys += value
+            elif value != 'empty':
+                keys += 'a' + value + 'ed\x1b'
+            else:
+                keys += 'a\x1b'
+        return keys
+
+    def optimized(self, items):
+        import vim_peephole
+        names = dict((id(insertion), name)
+                     for (name, insertion) in self.insertions.iteritems())
+        return [
+            (mode, names[id(value)] if mode == 'i' else value)
+            for (mode, value) in vim_peephole.optimize(self.commands(items))]
+
+    def test_rewrites(self):
+        for before, after in CORPUS:
+            self.assertEqual(self.optimized(before), after)
+            self.assertLessEqual(len(self.keys(after)), len(self.keys(before)))
+
+    def test_equivalent_in_vim(self):
+        if not vim_available():
+            raise unittest.SkipTest('needs vim')
+        directory = tempfile.mkdtemp()
+        try:
+            for before, after in CORPUS:
+                for line, column in [(1, 1), (3, 9), (8, 20), (9, 5)]:
+                    self.assertEqual(
+                        self.run_vim(directory, self.keys(before), line, column),
+                        self.run_vim(directory, self.keys(after), line, column),
+                        '%r and %r differ from %d,%d' % (
+                            before, after, line, column))
+        finally:
+            shutil.rmtree(directory)
+
+    def run_vim(self, directory, keys, line, column):
+        '''
+        Types ``keys`` in vim from ``line`` and ``column`` of BUFFER, and
+        returns the text, cursor and unnamed register afterwards. The keys
+        are fed as if typed, like the ones Aenea sends: a motion that fails
+        at the edge of the buffer doesn't stop the keys after it.
+        '''
+        paths = dict((name, os.path.join(directory, name))
+                     for name in ['buffer', 'keys', 'state'])
+        with open(paths['buffer'], 'w') as buffer_file:
+            buffer_file.write('\n'.join(BUFFER) + '\n')
+        with open(paths['keys'], 'w') as keys_file:
+            keys_file.write(keys)
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call([
+                'vim', '-u', 'NONE', '-i', 'NONE', '-N', '-n', '-es',
+                '-c', 'call cursor(%d, %d)' % (line, column),
+                '-c', 'call feedkeys(readfile("%s", "b")[0], "tx")'
+                      % paths['keys'],
+                '-c', 'call writefile([line("."), col("."), getreg(\'"\')]'
+                      ' + getline(1, "$"), "%s")' % paths['state'],
+                '-c', 'qa!', paths['buffer'],
+            ], stdout=devnull, stderr=devnull)
+        with open(paths['state']) as state_file:
+            return state_file.read()
+
+
+if __name__ == '__main__':
+    unittest.main()
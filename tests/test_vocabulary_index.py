@@ -0,0 +1,348 @@
+'''
+The compiled vocabulary index, and looking for edited vocabulary files at the
+start of utterances.
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+
+class VocabularyDirectory(object):
+    '''A vocabulary_config directory the tests write vocabulary files to.'''
+
+    def __init__(self, test):
+        self.path = tempfile.mkdtemp()
+        test.addCleanup(shutil.rmtree, self.path)
+        self.index_path = os.path.join(self.path, 'cache', 'vocabulary.index')
+        self._edits = 0
+
+    def write(self, kind, name, vocabularies):
+        directory = os.path.join(self.path, kind)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, name + '.json')
+        with open(path, 'w') as vocabulary_file:
+            json.dump(vocabularies, vocabulary_file, indent=4)
+        # Edits within the same second must still look like edits.
+        self._edits += 1
+        os.utime(path, (1000000000 + self._edits,) * 2)
+        return path
+
+
+class Vocabularies(object):
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self):
+        self.refreshes += 1
+        return 0
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import vocabulary_index
+        self.vocabulary_index = vocabulary_index
+        self.saved = vocabulary_index._vocabularies, vocabulary_index._last_refresh
+        self.vocabularies = vocabulary_index._vocabularies = Vocabularies()
+        vocabulary_index._last_refresh = None
+
+    def tearDown(self):
+        (self.vocabulary_index._vocabularies,
+         self.vocabulary_index._last_refresh) = self.saved
+
+    def test_refresh_is_throttled(self):
+        for utterance in range(10):
+            self.vocabulary_index.refresh()
+        self.assertEqual(self.vocabularies.refreshes, 1)
+
+        self.vocabulary_index._last_refresh -= (
+            self.vocabulary_index.REFRESH_INTERVAL)
+        self.assertEqual(self.vocabulary_index.refresh(), 0)
+        self.assertEqual(self.vocabularies.refreshes, 2)
+
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import vocabulary_index
+        self.vocabulary_index = vocabulary_index
+        self.directory = VocabularyDirectory(self)
+        self.directory.write('static', 'names', {
+            'tags': ['vim', 'multiedit'],
+            'vocabulary': {'alice': 'Alice', 'bob': 'Bob'},
+            'shortcuts': {'save it': 'c-s'},
+        })
+        self.directory.write('dynamic', 'python', {
+            'tags': ['vim.code'],
+            'vocabulary': {'deaf': 'def ', 'percent': '%%'},
+        })
+
+    def open(self):
+        index = self.vocabulary_index.open_index(
+            self.directory.index_path, self.directory.path)
+        self.addCleanup(index.close)
+        return index
+
+    def assertMatchesSources(self, index):
+        compiled = self.vocabulary_index.compile_vocabularies(
+            self.directory.path)
+        for kind in self.vocabulary_index.KINDS:
+            self.assertEqual(index.tags(kind), sorted(compiled[kind]))
+            for tag, vocabularies in compiled[kind].iteritems():
+                entries = {}
+                for name, vocabulary in vocabularies:
+                    entries.update(vocabulary)
+                self.assertEqual(index.entries(kind, tag), entries)
+
+    def test_built_from_the_sources(self):
+        index = self.open()
+        self.assertTrue(os.path.exists(self.directory.index_path))
+        self.assertFalse(index.stale(self.directory.path))
+        self.assertMatchesSources(index)
+        self.assertEqual(index.entries('static', 'vim')['save it'],
+                         (('Key', ('c-s',), True),))
+        self.assertEqual(index.entries('dynamic', 'vim.code')['deaf'],
+                         (('Text', ('def ',), True),))
+
+    def test_edited_file_rebuilds_the_index(self):
+        index = self.open()
+        self.directory.write('static', 'names', {
+            'tags': ['vim'],
+            'vocabulary': {'alice': 'Alicia', 'carol': 'Carol'},
+        })
+        self.assertTrue(index.stale(self.directory.path))
+
+        index = self.open()
+        self.assertFalse(index.stale(self.directory.path))
+        self.assertMatchesSources(index)
+        self.assertEqual(sorted(index.entries('static', 'vim')),
+                         ['alice', 'carol'])
+        self.assertEqual(index.tags('static'), ['vim'])
+
+    def test_added_and_removed_files_rebuild_the_index(self):
+        index = self.open()
+        path = self.directory.write('dynamic', 'shell', {
+            'tags': ['vim.code'], 'vocabulary': {'grep': 'grep '},
+        })
+        self.assertTrue(index.stale(self.directory.path))
+        index = self.open()
+        self.assertIn('grep', index.entries('dynamic', 'vim.code'))
+
+        os.remove(path)
+        self.assertTrue(index.stale(self.directory.path))
+        index = self.open()
+        self.assertNotIn('grep', index.entries('dynamic', 'vim.code'))
+        self.assertMatchesSources(index)
+
+    def test_corrupt_index_is_rebuilt(self):
+        self.open()
+        with open(self.directory.index_path, 'wb') as index_file:
+            index_file.write('not an index')
+        self.assertMatchesSources(self.open())
+
+
+
+class IncrementalRefreshTest(unittest.TestCase):
+    '''refresh() applies an edit the same way a full reload would.'''
+
+    def setUp(self):
+        support.engine()
+        import vocabulary_index
+        self.vocabulary_index = vocabulary_index
+        self.directory = VocabularyDirectory(self)
+        self.write([
+            {'name': 'words', 'tags': ['code'],
+             'vocabulary': {'one': '1', 'two': '2', 'three': '3'}},
+            {'name': 'more', 'tags': ['code'],
+             'vocabulary': {'three': 'III', 'four': '4'}},
+        ])
+        self.vocabularies = self.open()
+        self.list = self.vocabularies.dynamic_vocabulary('code')
+
+    def write(self, vocabularies):
+        self.directory.write('dynamic', 'words', vocabularies)
+
+    def open(self):
+        return self.vocabulary_index.Vocabularies(
+            self.directory.path, self.directory.index_path)
+
+    def texts(self):
+        '''spoken -> text of the list refresh() keeps up to date.'''
+        return dict((spoken, specs[0][1][0]) for (spoken, specs)
+                    in self.vocabularies._entries['code'].iteritems())
+
+    def assertLikeFullReload(self):
+        full = self.open()
+        full.dynamic_vocabulary('code')
+        self.assertEqual(self.vocabularies._entries['code'],
+                         full._entries['code'])
+        self.assertEqual(sorted(self.list), sorted(full._entries['code']))
+
+    def test_added_removed_and_changed_entries(self):
+        self.write([
+            {'name': 'words', 'tags': ['code'],
+             'vocabulary': {'one': 'uno', 'three': '3', 'five': '5'}},
+            {'name': 'more', 'tags': ['code'],
+             'vocabulary': {'three': 'III', 'four': '4'}},
+        ])
+        # "one" changed, "two" was removed, "five" was added.
+        self.assertEqual(self.vocabularies.refresh(), 3)
+        self.assertEqual(self.texts(), {
+            'one': 'uno', 'three': 'III', 'four': '4', 'five': '5'})
+        self.assertLikeFullReload()
+
+    def test_removed_entry_uncovers_an_earlier_one(self):
+        self.write([
+            {'name': 'words', 'tags': ['code'],
+             'vocabulary': {'one': '1', 'two': '2', 'three': '3'}},
+            {'name': 'more', 'tags': ['code'], 'vocabulary': {'four': '4'}},
+        ])
+        self.assertEqual(self.vocabularies.refresh(), 1)
+        self.assertEqual(self.texts()['three'], '3')
+        self.assertLikeFullReload()
+
+    def test_reordered_vocabularies(self):
+        self.write([
+            {'name': 'more', 'tags': ['code'],
+             'vocabulary': {'three': 'III', 'four': '4'}},
+            {'name': 'words', 'tags': ['code'],
+             'vocabulary': {'one': '1', 'two': '2', 'three': '3'}},
+        ])
+        # The later vocabulary wins "three" now.
+        self.assertEqual(self.vocabularies.refresh(), 1)
+        self.assertEqual(self.texts()['three'], '3')
+        self.assertLikeFullReload()
+
+    def test_unchanged_file(self):
+        self.write([
+            {'name': 'words', 'tags': ['code'],
+             'vocabulary': {'one': '1', 'two': '2', 'three': '3'}},
+            {'name': 'more', 'tags': ['code'],
+             'vocabulary': {'three': 'III', 'four': '4'}},
+        ])
+        self.assertEqual(self.vocabularies.refresh(), 0)
+        self.assertLikeFullReload()
+
+
+
+class LanguageTest(unittest.TestCase):
+    def setUp(self):
+        support.engine()
+        import vocabulary_index
+        directory = VocabularyDirectory(self)
+        directory.write('dynamic', 'common', {
+            'tags': ['code'], 'vocabulary': {'equals': ' = '},
+        })
+        directory.write('dynamic', 'python', {
+            'tags': ['code'], 'languages': ['python'],
+            'vocabulary': {'deaf': 'def ', 'none': 'None'},
+        })
+        directory.write('dynamic', 'rust', {
+            'tags': ['code'], 'languages': ['rust'],
+            'vocabulary': {'funk': 'fn ', 'none': 'None()'},
+        })
+        self.vocabularies = vocabulary_index.Vocabularies(
+            directory.path, directory.index_path)
+        self.list = self.vocabularies.dynamic_vocabulary('code')
+
+    def active(self):
+        return dict((spoken, specs[0][1][0]) for (spoken, specs)
+                    in self.vocabularies._entries['code'].iteritems()
+                    if spoken in self.list)
+
+    def test_switching_language_swaps_the_lists(self):
+        everything = self.active()
+        self.assertEqual(sorted(everything),
+                         ['deaf', 'equals', 'funk', 'none'])
+
+        self.assertEqual(self.vocabularies.set_language('code', 'python'), 2)
+        self.assertEqual(self.active(),
+                         {'equals': ' = ', 'deaf': 'def ', 'none': 'None'})
+
+        self.vocabularies.set_language('code', 'rust')
+        self.assertEqual(self.active(),
+                         {'equals': ' = ', 'funk': 'fn ', 'none': 'None()'})
+        self.assertEqual(sorted(self.list), ['equals', 'funk', 'none'])
+
+        self.vocabularies.set_language('code', 'python')
+        self.assertEqual(self.active(),
+                         {'equals': ' = ', 'deaf': 'def ', 'none': 'None'})
+
+        self.assertEqual(self.vocabularies.set_language('code', 'python'), 0)
+        self.vocabularies.set_language('code', None)
+        self.assertEqual(self.active(), everything)
+
+    def test_unknown_language_keeps_the_common_vocabularies(self):
+        self.vocabularies.set_language('code', 'cobol')
+        self.assertEqual(self.active(), {'equals': ' = '})
+
+
+
+class StaticActionTest(unittest.TestCase):
+    '''Static actions type what the vocabulary's spec would have typed.'''
+
+    def setUp(self):
+        support.engine()
+        import aenea
+        import aenea.communications
+        import vocabulary_index
+        self.aenea = aenea
+        self.vocabulary_index = vocabulary_index
+        self.server = aenea.communications.server
+        self.server.take()
+
+    def typed(self, action, data):
+        import batch_executor
+        action.execute(data)
+        # Joined actions type the same text in fewer events.
+        return batch_executor.merge_commands(self.server.take()[0])
+
+    def test_percent_is_unescaped_once(self):
+        parse_specs = self.vocabulary_index.parse_specs
+        self.assertEqual(parse_specs('100%%', 'Text'),
+                         (('Text', ('100%',), True),))
+        self.assertEqual(parse_specs('%%%%', 'Text'),
+                         (('Text', ('%%',), True),))
+        # A spec with fields is formatted when it runs, so it stays as it is.
+        self.assertEqual(parse_specs('%(text)s%%', 'Text'),
+                         (('Text', ('%(text)s%%',), False),))
+
+    def test_static_actions_type_the_same(self):
+        data = {'text': 'x', '_node': None}
+        for value in ['def ', '100%%', '<%%= x %%>', '%%%%', '%(text)s%%',
+                      [{'type': 'Text', 'args': ['()']},
+                       {'type': 'Key', 'args': ['left']}],
+                      ['a%%', 'b']]:
+            compiled = self.vocabulary_index.action(
+                self.vocabulary_index.parse_specs(value, 'Text'))
+            if isinstance(value, basestring):
+                value = [value]
+            uncompiled = reduce(lambda first, second: first + second, [
+                self.aenea.Text(item) if isinstance(item, basestring)
+                else getattr(self.aenea, item['type'])(*item['args'])
+                for item in value])
+            self.assertEqual(self.typed(compiled, data),
+                             self.typed(uncompiled, data), value)
+
+    def test_index_keeps_escaped_percent(self):
+        directory = VocabularyDirectory(self)
+        directory.write('dynamic', 'templates', {
+            'tags': ['code'], 'vocabulary': {'percent': '%%', 'mod': ' %% '},
+        })
+        vocabularies = self.vocabulary_index.Vocabularies(
+            directory.path, directory.index_path)
+        words = vocabularies.dynamic_vocabulary('code')
+        self.assertEqual(
+            self.typed(words['percent'] + words['mod'], {}),
+            [('write_text', (), {'text': '% % '})])
+
+
+if __name__ == '__main__':
+    unittest.main()
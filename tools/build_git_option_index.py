@@ -0,0 +1,88 @@
+'''
+Builds _git/git_option_index.json, the list of every long option of each git
+command that the git grammar knows, for dictating options (see
+_git/git_options.py).
+
+The options are read from ``git <command> -h`` of the git installed where this
+runs, so run it again after upgrading git:
+
+    python tools/build_git_option_index.py [--git PATH] [--output FILE]
+
+Commands whose ``-h`` only prints a usage line (e.g. log) get no options here;
+the grammar falls back to the options listed in git_commands.py for them.
+'''
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GIT_DIRECTORY = os.path.join(HERE, '..', '_git')
+
+# An option at the start of a help line, e.g. "    -q, --quiet" or
+# "    --[no-]verify".
+_OPTION_LINE = re.compile(r'^\s{2,}(?:-\w,\s+)?(--(?:\[no-\])?[a-z0-9][a-z0-9-]*)')
+_NEGATABLE = re.compile(r'^--\[no-\](.+)$')
+
+
+def command_names():
+    '''Returns the commands defined in git_commands.py, in order.'''
+    with open(os.path.join(GIT_DIRECTORY, 'git_commands.py')) as source:
+        names = re.findall(r"GitCommandRuleBuilder\(name='([\w-]+)'", source.read())
+    return [name for name in names if name != 'common_refs']
+
+
+def parse_options(help_text):
+    options = []
+    for line in help_text.splitlines():
+        match = _OPTION_LINE.match(line)
+        if match is None:
+            continue
+        option = match.group(1)
+        negatable = _NEGATABLE.match(option)
+        if negatable:
+            candidates = ['--' + negatable.group(1), '--no-' + negatable.group(1)]
+        else:
+            candidates = [option]
+        for candidate in candidates:
+            if candidate not in options:
+                options.append(candidate)
+    return options
+
+
+def command_help(git, command):
+    process = subprocess.Popen(
+        [git, command, '-h'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    output, _ = process.communicate()
+    return output.decode('utf-8', 'replace')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--git', default='git')
+    parser.add_argument(
+        '--output', default=os.path.join(GIT_DIRECTORY, 'git_option_index.json'))
+    arguments = parser.parse_args(argv)
+
+    version = subprocess.check_output([arguments.git, '--version']).strip()
+    index = {'git_version': version.decode('utf-8'), 'commands': {}}
+    for command in command_names():
+        options = parse_options(command_help(arguments.git, command))
+        index['commands'][command] = options
+        print('%-12s %3d options' % (command, len(options)))
+
+    with open(arguments.output, 'w') as output:
+        json.dump(index, output, indent=1, sort_keys=True,
+                  separators=(',', ': '))
+        output.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
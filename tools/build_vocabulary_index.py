@@ -0,0 +1,117 @@
+'''
+Compiles vocabulary_config into the index the grammars load their
+vocabularies from (see shared/vocabulary_index.py), and reports how long
+loading takes from the JSON files and from the index.
+
+The grammars rebuild the index themselves when a vocabulary file changes, so
+running this is optional; it is useful to measure a large vocabulary.
+``--entries N`` measures a generated vocabulary of N entries instead of
+vocabulary_config.
+
+Usage::
+
+    python tools/build_vocabulary_index.py [--entries N] [--repeat N]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'replay'))
+import replay_bench
+
+
+def generate_vocabularies(directory, entries):
+    '''Writes ``entries`` made up entries, split over four tags.'''
+    for kind in ('static', 'dynamic'):
+        os.makedirs(os.path.join(directory, kind))
+    for number in range(4):
+        vocabulary = {
+            'name': 'generated %d' % number,
+            'tags': ['generated.%d' % number],
+            'vocabulary': dict(
+                ('entry %d %d' % (number, entry), 'text %d' % entry)
+                for entry in range(number, entries, 4)
+            ),
+        }
+        path = os.path.join(directory, 'dynamic', 'generated%d.json' % number)
+        with open(path, 'w') as vocabulary_file:
+            json.dump(vocabulary, vocabulary_file)
+
+
+def best_time(function, repeat):
+    times = []
+    for iteration in range(repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int,
+                        help='measure a generated vocabulary this big')
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args(argv)
+
+    replay_bench.setup_paths()
+    try:
+        import vocabulary_index
+    except ImportError:
+        print 'Building the vocabulary index needs dragonfly: pip install dragonfly2'
+        return 2
+
+    directory = vocabulary_index.VOCABULARY_DIRECTORY
+    path = vocabulary_index.INDEX_PATH
+    temporary_directory = None
+    if arguments.entries:
+        temporary_directory = tempfile.mkdtemp()
+        directory = os.path.join(temporary_directory, 'vocabulary_config')
+        path = os.path.join(temporary_directory, 'vocabulary.index')
+        generate_vocabularies(directory, arguments.entries)
+
+    try:
+        build_time = best_time(
+            lambda: vocabulary_index.write_index(
+                path, vocabulary_index.build_index(directory)),
+            arguments.repeat)
+        index = vocabulary_index.VocabularyIndex(path)
+        tags = [(kind, tag) for kind in vocabulary_index.KINDS
+                for tag in index.tags(kind)]
+        entries = sum(len(index.entries(kind, tag)) for (kind, tag) in tags)
+        print 'Compiled %d files, %d tags and %d entries into %s (%d bytes)' % (
+            len(index.sources), len(tags), entries, path,
+            os.path.getsize(path))
+        index.close()
+
+        def load_index(tags):
+            index = vocabulary_index.open_index(path, directory)
+            for kind, tag in tags:
+                index.entries(kind, tag)
+            index.close()
+
+        row = '%-28s %10s'
+        print row % ('', 'ms')
+        print row % ('build the index', '%.2f' % (build_time * 1000))
+        print row % ('parse the JSON files', '%.2f' % (best_time(
+            lambda: vocabulary_index.compile_vocabularies(directory),
+            arguments.repeat) * 1000))
+        print row % ('load every tag from index', '%.2f' % (best_time(
+            lambda: load_index(tags), arguments.repeat) * 1000))
+        if tags:
+            print row % ('load one tag from index', '%.2f' % (best_time(
+                lambda: load_index(tags[:1]), arguments.repeat) * 1000))
+    finally:
+        if temporary_directory is not None:
+            shutil.rmtree(temporary_directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+'''
+Times shared/formatting.py on long dictated identifiers.
+
+Each case is an utterance such as "camel <dictation>" with dictation of 50,
+200 or 1000 words, some of them Dragon's "written\\spoken" tokens, tokens
+holding two words and punctuation tokens. It is formatted three ways:
+
+- reference: the per-grammar code the grammars used before formatting.py
+  (lower case, split off the written form, filter with a regex, then split
+  and flatten with reduce)
+- uncached: format_words with its cache cleared before every call
+- cached: format_words saying the same utterance again
+
+and the output of all three is checked to be the same.
+
+Usage::
+
+    python tools/formatting_benchmark.py [--repeat N]
+'''
+
+import argparse
+import operator
+import os
+import random
+import re
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'shared'))
+import formatting
+
+LENGTHS = [50, 200, 1000]
+FORMATS = ['camel', 'score', 'proper', 'natword', 'title']
+_VOCABULARY = [
+    'open', 'file', 'buffer', 'Window', 'count', 'index', 'value', 'off-campus',
+    'I\\pronoun', 'control panel', '\x96\\dash\\dash', 'list', 'read', 'line',
+]
+
+
+def reference_format(words):
+    '''The formatting charwise vim did before formatting.py.'''
+    lowercase = words[0] != 'natural'
+    uppercase = words[0] == 'upper'
+    if lowercase:
+        words = [word.lower() for word in words]
+    if uppercase:
+        words = [word.upper() for word in words]
+    if words[0].lower() in ('upper', 'natural'):
+        del words[0]
+    format_type = words[0].lower().replace('-', '')
+    del words[0]
+
+    words = [
+        word.split('\\', 1)[0].replace('-', '')
+        for word in words
+        if not re.match(r'^[,\x96\x97]', word)
+    ]
+    split = [word.split(' ') for word in words]
+    words = reduce(operator.add, split) if split else []
+    words = [word for word in words if word]
+    return formatting.FORMATTERS[format_type](words)
+
+
+def utterance(format_name, length, seed):
+    generator = random.Random(seed)
+    return [format_name] + [
+        generator.choice(_VOCABULARY) for index in range(length)]
+
+
+def uncached(words):
+    formatting._cache.clear()
+    return formatting.format_words(words)
+
+
+def time_per_call(function, words, repeat):
+    start = timeit.default_timer()
+    for iteration in range(repeat):
+        function(list(words))
+    return (timeit.default_timer() - start) / repeat
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    arguments = parser.parse_args(argv)
+
+    row = '%-8s %6s %14s %14s %12s %s'
+    print row % ('format', 'words', 'reference us', 'uncached us',
+                 'cached us', 'output')
+    mismatches = 0
+    for length in LENGTHS:
+        for format_name in FORMATS:
+            words = utterance(format_name, length, length)
+            expected = reference_format(list(words))
+            correct = (uncached(list(words)) == expected and
+                       formatting.format_words(list(words)) == expected)
+            mismatches += not correct
+            print row % (
+                format_name, length,
+                '%.1f' % (time_per_call(
+                    reference_format, words, arguments.repeat) * 1e6),
+                '%.1f' % (time_per_call(
+                    uncached, words, arguments.repeat) * 1e6),
+                '%.1f' % (time_per_call(
+                    formatting.format_words, words, arguments.repeat) * 1e6),
+                'same' if correct else 'DIFFERENT')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
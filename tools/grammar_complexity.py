@@ -0,0 +1,323 @@
+'''
+Reports how complex each grammar is, and fails when one grows past its limit.
+
+Speech engines reject grammars that are too complex (Dragon says "grammar too
+complex" and loads nothing), and the limit is easy to hit with nested
+repetitions. This loads every module the same way the replay harness does
+(dragonfly's text engine and the stand-in aenea package in tools/replay),
+builds its grammars and walks their element trees. For each grammar, and each
+rule in it, it reports:
+
+- rules: the rules in the grammar, counting the ones only referred to
+- nodes: elements the engine has to compile; a referenced rule counts once
+- words: distinct words in literals and lists
+- depth: the deepest nesting of elements, following rule references
+- log10 paths: an estimate of how many word sequences can be said, as a power
+  of ten (a dictation or list slot counts as one word sequence per entry)
+
+Usage::
+
+    python tools/grammar_complexity.py [--rules] [--limits FILE]
+        [--json FILE] [--compare FILE [--tolerance 0.1]] [MODULE ...]
+
+The limits in tools/grammar_limits.json are checked on every run: the exit
+status is 1 if a grammar exceeds one. ``--compare`` also fails if a grammar's
+nodes or paths grew by more than ``--tolerance`` compared to results saved
+earlier with ``--json``.
+'''
+
+import argparse
+import json
+import math
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'replay'))
+import replay_bench
+
+METRICS = ['rules', 'nodes', 'words', 'depth', 'log10_paths']
+
+
+def log10(paths):
+    if paths <= 0:
+        return 0.0
+    return math.log10(paths)
+
+
+class ComplexityWalker(object):
+    '''
+    Measures element trees. Results are memoized per element, since rules and
+    repeated children are shared.
+    '''
+
+    def __init__(self):
+        from dragonfly import (
+            Alternative,
+            Dictation,
+            ListRef,
+            Literal,
+            Optional,
+            RuleRef,
+            Sequence,
+        )
+        from dragonfly.grammar.elements_basic import Impossible
+        self.types = {
+            'alternative': Alternative,
+            'dictation': Dictation,
+            'impossible': Impossible,
+            'list': ListRef,
+            'literal': Literal,
+            'optional': Optional,
+            'rule_ref': RuleRef,
+            'sequence': Sequence,
+        }
+        self._depths = {}
+        self._paths = {}
+
+    def _is(self, element, kind):
+        return isinstance(element, self.types[kind])
+
+    def depth(self, element):
+        key = id(element)
+        if key not in self._depths:
+            # Guards against rules that refer to themselves.
+            self._depths[key] = 1
+            if self._is(element, 'rule_ref'):
+                depth = 1 + self.depth(element.rule.element)
+            else:
+                depth = 1 + max(
+                    [self.depth(child) for child in element.children] or [0])
+            self._depths[key] = depth
+        return self._depths[key]
+
+    def paths(self, element):
+        key = id(element)
+        if key not in self._paths:
+            self._paths[key] = 1
+            if self._is(element, 'rule_ref'):
+                paths = self.paths(element.rule.element)
+            elif self._is(element, 'list'):
+                paths = len(element.list)
+            elif self._is(element, 'impossible'):
+                paths = 0
+            elif self._is(element, 'alternative'):
+                paths = sum(self.paths(child) for child in element.children)
+            elif self._is(element, 'optional'):
+                paths = 1 + self.paths(element.children[0])
+            elif self._is(element, 'sequence'):
+                paths = 1
+                for child in element.children:
+                    paths *= self.paths(child)
+            else:
+                # A literal, dictation or empty element.
+                paths = 1
+            self._paths[key] = paths
+        return self._paths[key]
+
+    def own_elements(self, element):
+        '''Yields the elements of one rule, stopping at references.'''
+        yield element
+        if self._is(element, 'rule_ref'):
+            return
+        for child in element.children:
+            for descendant in self.own_elements(child):
+                yield descendant
+
+    def words(self, elements):
+        words = set()
+        for element in elements:
+            if self._is(element, 'literal'):
+                words.update(word.lower() for word in element.words)
+            elif self._is(element, 'list'):
+                for entry in element.list:
+                    words.update(entry.lower().split())
+        return words
+
+    def referenced_rules(self, rule):
+        for element in self.own_elements(rule.element):
+            if self._is(element, 'rule_ref'):
+                yield element.rule
+
+
+def grammar_rules(walker, grammar):
+    '''Returns the grammar's rules and every rule they refer to, in order.'''
+    rules = []
+    seen = set()
+    pending = list(grammar.rules)
+    while pending:
+        rule = pending.pop(0)
+        if id(rule) in seen:
+            continue
+        seen.add(id(rule))
+        rules.append(rule)
+        pending.extend(walker.referenced_rules(rule))
+    return rules
+
+
+def measure_grammar(walker, grammar):
+    rules = {}
+    words = set()
+    nodes = 0
+    paths = 0
+    depth = 0
+    for rule in grammar_rules(walker, grammar):
+        elements = list(walker.own_elements(rule.element))
+        rule_words = walker.words(elements)
+        rule_paths = walker.paths(rule.element)
+        rule_depth = walker.depth(rule.element)
+        rules[rule.name] = {
+            'exported': rule.exported,
+            'nodes': len(elements),
+            'words': len(rule_words),
+            'depth': rule_depth,
+            'log10_paths': log10(rule_paths),
+        }
+        words.update(rule_words)
+        nodes += len(elements)
+        depth = max(depth, rule_depth)
+        if rule.exported:
+            paths += rule_paths
+    return {
+        'rules': len(rules),
+        'nodes': nodes,
+        'words': len(words),
+        'depth': depth,
+        'log10_paths': log10(paths),
+        'rule_details': rules,
+    }
+
+
+def loaded_grammars(engine):
+    '''
+    Returns the engine's grammars that can recognise something, by name. This
+    leaves out the placeholders of lazy grammars, whose only rule is disabled.
+    '''
+    return dict(
+        (grammar.name, grammar) for grammar in engine.grammars
+        if any(rule.enabled for rule in grammar.rules)
+    )
+
+
+def measure_modules(engine, names):
+    import aenea.proxy_contexts
+
+    results = {}
+    walker = ComplexityWalker()
+    for name in names:
+        before = set(loaded_grammars(engine))
+        aenea.proxy_contexts.window.update(replay_bench.EMPTY_WINDOW)
+        module = replay_bench.load_module(name)
+        if 'lazy_grammar' in sys.modules:
+            sys.modules['lazy_grammar'].build_all()
+        try:
+            for grammar_name, grammar in loaded_grammars(engine).iteritems():
+                if grammar_name not in before:
+                    results[grammar_name] = measure_grammar(walker, grammar)
+        finally:
+            if hasattr(module, 'unload'):
+                module.unload()
+    return results
+
+
+def report(results, show_rules):
+    row = '%-28s %6s %7s %6s %6s %12s'
+    print row % ('grammar / rule', 'rules', 'nodes', 'words', 'depth',
+                 'log10 paths')
+    for name in sorted(results):
+        result = results[name]
+        print row % (name, result['rules'], result['nodes'], result['words'],
+                     result['depth'], '%.1f' % result['log10_paths'])
+        if not show_rules:
+            continue
+        details = result['rule_details']
+        for rule_name in sorted(details, key=lambda rule: (
+                -details[rule]['log10_paths'], rule)):
+            rule = details[rule_name]
+            print row % (
+                '  ' + rule_name + ('' if rule['exported'] else ' (ref)'),
+                '', rule['nodes'], rule['words'], rule['depth'],
+                '%.1f' % rule['log10_paths'])
+
+
+def check_limits(results, limits):
+    failures = []
+    for name, result in sorted(results.iteritems()):
+        grammar_limits = dict(limits.get('default', {}))
+        grammar_limits.update(limits.get('grammars', {}).get(name, {}))
+        for metric in METRICS:
+            limit = grammar_limits.get(metric)
+            if limit is not None and result[metric] > limit:
+                failures.append('%s: %s is %s, more than the limit of %s' % (
+                    name, metric, _format(result[metric]), limit))
+    return failures
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, result in sorted(results.iteritems()):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if old['nodes'] and result['nodes'] > old['nodes'] * (1 + tolerance):
+            failures.append('%s: nodes %d -> %d' % (
+                name, old['nodes'], result['nodes']))
+        # Paths are compared as powers of ten.
+        if result['log10_paths'] > old['log10_paths'] + math.log10(
+                1 + tolerance):
+            failures.append('%s: log10 paths %.1f -> %.1f' % (
+                name, old['log10_paths'], result['log10_paths']))
+    return failures
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.1f' % value
+    return str(value)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('modules', nargs='*', default=replay_bench.MODULES)
+    parser.add_argument('--rules', action='store_true',
+                        help='also report every rule of each grammar')
+    parser.add_argument('--limits',
+                        default=os.path.join(HERE, 'grammar_limits.json'))
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results saved by an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    arguments = parser.parse_args(argv)
+
+    replay_bench.setup_paths()
+    try:
+        from dragonfly import get_engine
+    except ImportError:
+        print 'The complexity report needs dragonfly: pip install dragonfly2'
+        return 2
+    engine = get_engine('text')
+
+    results = measure_modules(engine, arguments.modules)
+    report(results, arguments.rules)
+
+    if arguments.json:
+        with open(arguments.json, 'w') as results_file:
+            json.dump(results, results_file, indent=4, sort_keys=True,
+                      separators=(',', ': '))
+
+    failures = []
+    if os.path.exists(arguments.limits):
+        with open(arguments.limits) as limits_file:
+            failures.extend(check_limits(results, json.load(limits_file)))
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            failures.extend(compare(results, json.load(baseline_file),
+                                    arguments.tolerance))
+    for failure in failures:
+        print 'TOO COMPLEX %s' % failure
+    if failures:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
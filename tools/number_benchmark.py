@@ -0,0 +1,117 @@
+'''
+Compares the number elements the grammars can use for counts: dragonfly's
+IntegerRef and the CompactInteger of shared/elements.py.
+
+For each range it reports the size of a grammar holding only that number
+(elements, as counted by tools/grammar_complexity.py), how long the grammar
+takes to load, and how long recognising each number in the range takes on
+dragonfly's text engine. It also checks that both give every number in the
+range the same value.
+
+Usage::
+
+    python tools/number_benchmark.py [--repeat N]
+'''
+
+import argparse
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'replay'))
+import replay_bench
+
+RANGES = [(1, 10), (1, 100), (0, 100)]
+_UNITS = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven',
+          'eight', 'nine', 'ten', 'eleven', 'twelve', 'thirteen', 'fourteen',
+          'fifteen', 'sixteen', 'seventeen', 'eighteen', 'nineteen']
+_TENS = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy',
+         'eighty', 'ninety']
+
+
+def spoken(number):
+    if number < 20:
+        return [_UNITS[number]]
+    words = [_TENS[number // 10]]
+    if number % 10:
+        words.append(_UNITS[number % 10])
+    return words
+
+
+def measure(engine, name, element, numbers, repeat):
+    from dragonfly import CompoundRule, Grammar
+    import grammar_complexity
+
+    recognised = []
+
+    class NumberRule(CompoundRule):
+        spec = 'number <n>'
+        extras = [element]
+
+        def _process_recognition(self, node, extras):
+            recognised.append(extras['n'])
+
+    start = timeit.default_timer()
+    grammar = Grammar('number_benchmark_' + name)
+    grammar.add_rule(NumberRule())
+    grammar.load()
+    load_time = timeit.default_timer() - start
+
+    walker = grammar_complexity.ComplexityWalker()
+    nodes = grammar_complexity.measure_grammar(walker, grammar)['nodes']
+    try:
+        utterances = [['number'] + spoken(number) for number in numbers]
+        start = timeit.default_timer()
+        for iteration in range(repeat):
+            for words in utterances:
+                engine.mimic(words)
+        recognise_time = (timeit.default_timer() - start) / (
+            repeat * len(utterances))
+    finally:
+        grammar.unload()
+
+    return {
+        'nodes': nodes,
+        'load_ms': load_time * 1000,
+        'recognise_us': recognise_time * 1e6,
+        'values': recognised[:len(numbers)],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args(argv)
+
+    replay_bench.setup_paths()
+    try:
+        from dragonfly import get_engine, IntegerRef
+    except ImportError:
+        print 'The number benchmark needs dragonfly: pip install dragonfly2'
+        return 2
+    engine = get_engine('text')
+    import elements
+
+    row = '%-16s %-8s %6s %8s %14s %s'
+    print row % ('element', 'range', 'nodes', 'load ms', 'recognise us',
+                 'values')
+    mismatches = 0
+    for (low, high) in RANGES:
+        numbers = range(low, high)
+        for name, element in [
+                ('IntegerRef', IntegerRef('n', low, high)),
+                ('CompactInteger',
+                 elements.CompactInteger('n', low, high))]:
+            result = measure(engine, name, element, numbers, arguments.repeat)
+            correct = result['values'] == numbers
+            mismatches += not correct
+            print row % (name, '%d-%d' % (low, high - 1), result['nodes'],
+                         '%.2f' % result['load_ms'],
+                         '%.1f' % result['recognise_us'],
+                         'ok' if correct else 'WRONG')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+'''
+Stand-in for the Aenea client package, used by the replay harness.
+
+It provides the names the grammars in this repository import from Aenea,
+backed by real dragonfly elements. Proxy actions hand their events to
+``aenea.communications.server``, which records them instead of sending them
+to a server, and proxy contexts match against a fake window that the harness
+sets in ``aenea.proxy_contexts.window``.
+'''
+
+from dragonfly import (
+    Alternative,
+    AppContext,
+    Choice,
+    CompoundRule,
+    Dictation,
+    DictList,
+    DictListRef,
+    Function,
+    Grammar,
+    IntegerRef,
+    Literal,
+    MappingRule,
+    Mouse,
+    Pause,
+    Repetition,
+    RuleRef,
+    Sequence,
+    )
+
+from aenea.proxy_actions import (
+    Key,
+    NoAction,
+    Text,
+    )
+
+from aenea.proxy_contexts import (
+    AlwaysContext,
+    NeverContext,
+    ProxyAppContext,
+    ProxyPlatformContext,
+    )
+
+from aenea.wrappers import AeneaContext
+
+import aenea.communications
+import aenea.config
+import aenea.configuration
+import aenea.format
+import aenea.misc
+import aenea.vocabulary
+import aenea.wrappers
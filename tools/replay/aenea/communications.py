@@ -0,0 +1,39 @@
+'''Records what would be sent to the Aenea server.'''
+
+import time
+
+
+class RecordingServer(object):
+    def __init__(self):
+        self.commands = []
+        self.calls = 0
+        # Seconds each call takes, standing in for the round trip to a real
+        # server.
+        self.round_trip = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.round_trip:
+            time.sleep(self.round_trip)
+
+    def execute_batch(self, commands):
+        self._call()
+        self.commands.extend(commands)
+
+    def take(self):
+        '''Returns and forgets everything recorded so far.'''
+        commands, calls = self.commands, self.calls
+        self.commands, self.calls = [], 0
+        return commands, calls
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self._call()
+            self.commands.append((name, args, kwargs))
+        return record
+
+
+server = RecordingServer()
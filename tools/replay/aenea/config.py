@@ -0,0 +1,11 @@
+import os
+
+# The repository root, so grammar_config/ and vocabulary_config/ are found
+# the same way as in a real installation.
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', '..')
+    )
+
+
+def proxy_active():
+    return True
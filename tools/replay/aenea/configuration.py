@@ -0,0 +1,32 @@
+import json
+import os
+
+import aenea.config
+
+
+class ConfigWatcher(object):
+    '''Reads PROJECT_ROOT/<path>.json once, or {} if it doesn't exist.'''
+
+    def __init__(self, path, default={}):
+        if not isinstance(path, basestring):
+            path = os.path.join(*path)
+        self._path = os.path.join(aenea.config.PROJECT_ROOT, path + '.json')
+        self.conf = dict(default)
+        if os.path.exists(self._path):
+            with open(self._path) as config_file:
+                self.conf = json.load(config_file)
+
+    def refresh(self):
+        return False
+
+
+def make_grammar_commands(module_name, mapping, config_key='commands'):
+    conf = ConfigWatcher(('grammar_config', module_name)).conf
+    commands = conf.get(config_key, {})
+    if not commands:
+        return dict(mapping)
+    result = {}
+    for (spoken, name) in commands.iteritems():
+        if name in mapping:
+            result[str(spoken)] = mapping[name]
+    return result
@@ -0,0 +1 @@
+from aenea.proxy_actions import Key, Text
@@ -0,0 +1,33 @@
+from dragonfly import Choice, Repetition
+
+LETTERS = {
+    'alpha': 'a', 'bravo': 'b', 'charlie': 'c', 'delta': 'd', 'echo': 'e',
+    'foxtrot': 'f', 'golf': 'g', 'hotel': 'h', 'india': 'i', 'juliet': 'j',
+    'kilo': 'k', 'lima': 'l', 'mike': 'm', 'november': 'n', 'oscar': 'o',
+    'papa': 'p', 'queen': 'q', 'romeo': 'r', 'sierra': 's', 'tango': 't',
+    'uniform': 'u', 'victor': 'v', 'whiskey': 'w', 'x-ray': 'x',
+    'yankee': 'y', 'zulu': 'z',
+    }
+LETTERS.update(('upper %s' % spoken, letter.upper())
+               for (spoken, letter) in LETTERS.items())
+
+DIGITS = {
+    'zero': '0', 'one': '1', 'two': '2', 'three': '3', 'four': '4',
+    'five': '5', 'six': '6', 'seven': '7', 'eight': '8', 'nine': '9',
+    }
+
+ALPHANUMERIC = dict(LETTERS)
+ALPHANUMERIC.update(DIGITS)
+
+
+class DigitalInteger(Repetition):
+    '''An integer spoken digit by digit (min and max as for Repetition).'''
+
+    child = Choice('digit', DIGITS)
+
+    def __init__(self, name, min, max, *args, **kwargs):
+        Repetition.__init__(self, self.child, min, max, name=name,
+                            *args, **kwargs)
+
+    def value(self, node):
+        return int(''.join(Repetition.value(self, node)))
@@ -0,0 +1,63 @@
+'''Key and Text actions that send their events through the recording server.'''
+
+import re
+
+import dragonfly
+
+import aenea.communications
+
+_KEY_ELEMENT = re.compile(
+    r'^(?:(?P<modifiers>[acswkACSWK]+)-)?(?P<key>[^:/]+)'
+    r'(?::(?P<count>\d+|up|down))?(?:/(?P<delay>[\d.]+))?$'
+    )
+
+_MODIFIER_NAMES = {
+    'a': 'alt', 'c': 'control', 's': 'shift', 'w': 'super', 'k': 'hyper',
+    }
+
+
+class Key(dragonfly.DynStrActionBase):
+    def _parse_spec(self, spec):
+        events = []
+        for element in spec.split(','):
+            element = element.strip()
+            if not element:
+                continue
+            match = _KEY_ELEMENT.match(element)
+            if match is None:
+                raise dragonfly.ActionError('Invalid key spec: %r' % element)
+            count = match.group('count') or '1'
+            direction = 'press'
+            if count in ('up', 'down'):
+                direction, count = count, '1'
+            modifiers = [_MODIFIER_NAMES[modifier]
+                         for modifier in (match.group('modifiers') or '').lower()]
+            events.append({
+                'key': match.group('key').strip(),
+                'modifiers': modifiers,
+                'direction': direction,
+                'count': int(count),
+                'count_delay': float(match.group('delay') or 0),
+                })
+        return events
+
+    def _execute_events(self, events):
+        aenea.communications.server.execute_batch(
+            [('key_press', (), event) for event in events]
+            )
+        return True
+
+
+class Text(dragonfly.DynStrActionBase):
+    def _parse_spec(self, spec):
+        return spec
+
+    def _execute_events(self, events):
+        if events:
+            aenea.communications.server.write_text(text=events)
+        return True
+
+
+class NoAction(dragonfly.ActionBase):
+    def _execute(self, data=None):
+        return True
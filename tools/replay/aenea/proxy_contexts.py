@@ -0,0 +1,66 @@
+'''Proxy contexts that match against a fake foreground window.'''
+
+import re
+
+import dragonfly
+
+from dragonfly import Context
+
+AlwaysContext = dragonfly.Context
+
+
+class NeverContext(Context):
+    def matches(self, executable, title, handle):
+        return False
+
+
+# Set by the harness for each module that is replayed.
+window = {
+    'id': 1,
+    'title': '',
+    'executable': '',
+    'cls': '',
+    'cls_name': '',
+    'app_id': '',
+    }
+platform = 'linux'
+
+
+def _get_context():
+    return window
+
+
+class ProxyAppContext(Context):
+    def __init__(self, match='substring', case_sensitive=False, logic='and',
+                 **attributes):
+        Context.__init__(self)
+        self._match = match
+        self._case_sensitive = case_sensitive
+        self._logic = logic
+        self._attributes = attributes
+
+    def _matches(self, pattern, value):
+        value = value or ''
+        if self._match == 'regex':
+            return re.match(pattern, value) is not None
+        if not self._case_sensitive:
+            pattern, value = pattern.lower(), value.lower()
+        if self._match == 'substring':
+            return pattern in value
+        return pattern == value
+
+    def matches(self, executable, title, handle):
+        results = [self._matches(pattern, window.get(key))
+                   for (key, pattern) in self._attributes.iteritems()]
+        if self._logic == 'or':
+            return any(results)
+        return all(results)
+
+
+class ProxyPlatformContext(Context):
+    def __init__(self, platform_name):
+        Context.__init__(self)
+        self._platform = platform_name
+
+    def matches(self, executable, title, handle):
+        return self._platform == platform
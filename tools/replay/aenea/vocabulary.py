@@ -0,0 +1,74 @@
+'''Vocabulary loaded from the repository's vocabulary_config directory.'''
+
+import glob
+import json
+import os
+
+from dragonfly import DictList
+
+import aenea.config
+from aenea.proxy_actions import Key, Text
+
+_ACTION_TYPES = {'Key': Key, 'Text': Text}
+
+
+def _action(value, default_type):
+    if isinstance(value, basestring):
+        return default_type(str(value))
+    actions = [_ACTION_TYPES[spec['type']](*[str(arg) for arg in spec['args']])
+               for spec in value]
+    return reduce(lambda first, second: first + second, actions)
+
+
+def _load(kind):
+    by_tag = {}
+    pattern = os.path.join(
+        aenea.config.PROJECT_ROOT, 'vocabulary_config', kind, '*.json'
+        )
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as vocabulary_file:
+            entries = json.load(vocabulary_file)
+        if isinstance(entries, dict):
+            entries = [entries]
+        for entry in entries:
+            for tag in entry.get('tags', []):
+                mapping = by_tag.setdefault(str(tag), {})
+                for (spoken, value) in entry.get('vocabulary', {}).iteritems():
+                    mapping[str(spoken)] = _action(value, Text)
+                for (spoken, value) in entry.get('shortcuts', {}).iteritems():
+                    mapping[str(spoken)] = _action(value, Key)
+    return by_tag
+
+
+_static = None
+_dynamic = None
+_lists = {}
+
+
+def get_static_vocabulary(tag):
+    global _static
+    if _static is None:
+        _static = _load('static')
+    return dict(_static.get(tag, {}))
+
+
+def register_dynamic_vocabulary(tag):
+    global _dynamic
+    if _dynamic is None:
+        _dynamic = _load('dynamic')
+    if tag not in _lists:
+        _lists[tag] = DictList('dynamic %s' % tag)
+        _lists[tag].update(_dynamic.get(tag, {}))
+    return _lists[tag]
+
+
+def unregister_dynamic_vocabulary(tag):
+    _lists.pop(tag, None)
+
+
+def inhibit_global_dynamic_vocabulary(name, tags, context=None):
+    pass
+
+
+def uninhibit_global_dynamic_vocabulary(name, tags):
+    pass
@@ -0,0 +1,288 @@
+'''
+Replays recorded utterances through the grammars and reports how long each
+one takes from recognition to the last emitted keystroke.
+
+This runs anywhere dragonfly can be imported: its "text" engine parses the
+mimicked words, so neither Dragon nor Windows is needed. Aenea is replaced by
+the stand-in package next to this file, whose server records the keystrokes
+instead of sending them.
+
+Usage::
+
+    python tools/replay/replay_bench.py [--corpus FILE] [--repeat N] [--dump]
+        [--lazy] [--round-trip MS] [--unbatched] [--json FILE]
+        [--compare FILE [--tolerance 0.25]] [MODULE ...]
+
+``--json`` saves the results, and ``--compare`` fails (exit status 1) if any
+module's median latency grew by more than ``--tolerance`` compared to results
+saved earlier, which is how hot-path regressions are caught. A module none of
+whose utterances is recognised fails too, so a grammar that can't fire isn't
+reported as measured.
+
+The grammars are built right after their module is imported, so that doesn't
+count towards the first utterance. With ``--lazy`` they are left to
+lazy_grammar instead, as in a real session: only its stub is loaded, and its
+timer's check of the foreground window builds the grammar before the first
+utterance.
+
+The stand-in server answers at once. ``--round-trip`` makes each call to it
+take that many milliseconds, like a call over the network to a real Aenea
+server, and ``--unbatched`` executes the actions of an utterance one by one
+instead of in one batch (see shared/batch_executor.py), which shows what
+batching saves.
+'''
+
+import argparse
+import gc
+import imp
+import json
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, '..', '..'))
+MODULES = ['_vim', '_multiedit', '_charwise_vim', '_git', '_chromium',
+           '_awesome']
+EMPTY_WINDOW = {'id': 1, 'title': '', 'executable': '', 'cls': '',
+                'cls_name': '', 'app_id': ''}
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def setup_paths():
+    # The stand-in aenea package must shadow any real installation.
+    sys.path.insert(0, HERE)
+    sys.path.insert(1, os.path.join(ROOT, 'shared'))
+    for module in MODULES:
+        sys.path.append(os.path.join(ROOT, module))
+
+
+def load_module(name):
+    return imp.load_source(name, os.path.join(ROOT, name, name + '.py'))
+
+
+class AllocationCounter(object):
+    '''
+    Counts allocations made while replaying one utterance: memory blocks with
+    tracemalloc where it exists, otherwise net new gc-tracked objects.
+    '''
+
+    unit = 'blocks' if tracemalloc is not None else 'objects'
+
+    def start(self):
+        if tracemalloc is not None:
+            tracemalloc.start()
+            self._before = tracemalloc.take_snapshot()
+        else:
+            gc.collect()
+            gc.disable()
+            self._before = gc.get_count()[0]
+
+    def stop(self):
+        if tracemalloc is not None:
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            return sum(stat.count_diff for stat in
+                       after.compare_to(self._before, 'filename')
+                       if stat.count_diff > 0)
+        allocated = gc.get_count()[0] - self._before
+        gc.enable()
+        return max(allocated, 0)
+
+
+def keystrokes(commands):
+    '''Counts the keys pressed and characters typed by recorded commands.'''
+    count = 0
+    for name, args, kwargs in commands:
+        if name == 'key_press':
+            count += kwargs.get('count', 1)
+        elif name == 'write_text':
+            count += len(kwargs.get('text', ''))
+    return count
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def execute_unbatched(batch):
+    '''Executes an ActionBatch's actions one by one, as before batching.'''
+    pending, batch._pending = batch._pending, []
+    for action, data in pending:
+        action.execute(data)
+
+
+def replay_module(engine, name, recording, repeat, dump, lazy=False):
+    import aenea.communications
+    import aenea.proxy_contexts
+
+    server = aenea.communications.server
+    window = aenea.proxy_contexts.window
+    window.clear()
+    window.update(EMPTY_WINDOW)
+    window.update(recording.get('window', {}))
+    aenea.proxy_contexts.platform = recording.get('platform', 'linux')
+
+    # The text engine runs timers in another thread, so the harness checks
+    # the window for lazy_grammar instead.
+    import lazy_grammar
+    lazy_grammar.WATCH_INTERVAL = 0
+    module = load_module(name)
+    if lazy:
+        lazy_grammar.build_matching()
+    else:
+        lazy_grammar.build_all()
+    latencies = []
+    allocations = []
+    calls = []
+    keys = []
+    failures = []
+    counter = AllocationCounter()
+    try:
+        for iteration in range(repeat):
+            for utterance in recording['utterances']:
+                words = utterance.split()
+                server.take()
+                counter.start()
+                start = timeit.default_timer()
+                try:
+                    engine.mimic(words)
+                except Exception as error:
+                    counter.stop()
+                    if iteration == 0:
+                        failures.append((utterance, error))
+                    continue
+                latencies.append(timeit.default_timer() - start)
+                allocations.append(counter.stop())
+                commands, call_count = server.take()
+                calls.append(call_count)
+                keys.append(keystrokes(commands))
+                if dump and iteration == 0:
+                    print '  %-40s -> %r' % (utterance, commands)
+    finally:
+        if hasattr(module, 'unload'):
+            module.unload()
+
+    count = len(latencies)
+    return {
+        'utterances': count,
+        'failures': len(failures),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+        'calls_per_utterance': float(sum(calls)) / count if count else 0.0,
+        'keystrokes_per_utterance':
+            float(sum(keys)) / count if count else 0.0,
+        'allocations_per_utterance':
+            float(sum(allocations)) / count if count else 0.0,
+        }, failures
+
+
+def report(results):
+    print '%-14s %5s %5s %8s %8s %8s %8s %7s %6s %10s' % (
+        'module', 'utts', 'fail', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'calls', 'keys', AllocationCounter.unit)
+    for name in sorted(results):
+        result = results[name]
+        print '%-14s %5d %5d %8.3f %8.3f %8.3f %8.3f %7.2f %6.1f %10.1f' % (
+            name, result['utterances'], result['failures'], result['p50_ms'],
+            result['p90_ms'], result['p99_ms'], result['max_ms'],
+            result['calls_per_utterance'],
+            result.get('keystrokes_per_utterance', 0.0),
+            result['allocations_per_utterance'])
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.iteritems()):
+        if name not in baseline or not baseline[name]['p50_ms']:
+            continue
+        growth = result['p50_ms'] / baseline[name]['p50_ms'] - 1
+        if growth > tolerance:
+            regressions.append('%s: median %.3f ms -> %.3f ms (+%.0f%%)' % (
+                name, baseline[name]['p50_ms'], result['p50_ms'],
+                growth * 100))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'corpus.json'))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--dump', action='store_true',
+                        help='print the keystrokes each utterance emitted')
+    parser.add_argument('--lazy', action='store_true',
+                        help='build the grammars through lazy_grammar')
+    parser.add_argument('--round-trip', type=float, default=0,
+                        help='milliseconds each call to the server takes')
+    parser.add_argument('--unbatched', action='store_true',
+                        help='execute the actions of an utterance one by one')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results saved by an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    arguments = parser.parse_args(argv)
+
+    setup_paths()
+    try:
+        from dragonfly import get_engine
+    except ImportError:
+        print 'The replay harness needs dragonfly: pip install dragonfly2'
+        return 2
+    engine = get_engine('text')
+
+    import aenea.communications
+    aenea.communications.server.round_trip = arguments.round_trip / 1000.0
+    if arguments.unbatched:
+        import batch_executor
+        batch_executor.ActionBatch.execute = execute_unbatched
+
+    with open(arguments.corpus) as corpus_file:
+        corpus = json.load(corpus_file)
+
+    results = {}
+    for name in arguments.modules:
+        if name not in corpus:
+            print 'No recorded utterances for %s' % name
+            continue
+        print '%s:' % name
+        results[name], failures = replay_module(
+            engine, name, corpus[name], arguments.repeat, arguments.dump,
+            arguments.lazy)
+        for utterance, error in failures:
+            print '  not recognised: %r (%s)' % (utterance, error)
+    report(results)
+    unrecognised = sorted(
+        name for (name, result) in results.iteritems()
+        if not result['utterances'])
+    for name in unrecognised:
+        print 'NOT RECOGNISED %s: none of its utterances matched' % name
+
+    if arguments.json:
+        with open(arguments.json, 'w') as results_file:
+            json.dump(results, results_file, indent=4, sort_keys=True)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  arguments.tolerance)
+        for regression in regressions:
+            print 'REGRESSION %s' % regression
+        if regressions:
+            return 1
+    if unrecognised:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
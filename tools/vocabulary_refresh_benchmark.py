@@ -0,0 +1,177 @@
+'''
+Times reloading a dynamic vocabulary after one of its entries is edited,
+incrementally (shared/vocabulary_index.py) and in full (recompiling every
+file and setting the whole DictList, as the grammars used to).
+
+A generated vocabulary of ``--entries`` entries (10,000 by default), split
+over ``--files`` files, is registered as a DictList in a grammar loaded on
+dragonfly's text engine. Each iteration edits the first file, then reloads
+the vocabulary both ways. Only the edited file is parsed again by the
+incremental reload, so its cost follows the size of that file.
+
+It reports the time each reload took, how many entries changed and how often
+the engine was sent the list, and checks that both ways end up with the same
+list.
+
+Usage::
+
+    python tools/vocabulary_refresh_benchmark.py [--entries N] [--files N]
+        [--repeat N]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'replay'))
+import replay_bench
+
+TAG = 'benchmark'
+EDITS = ['change one entry', 'add one entry', 'remove one entry']
+
+
+class VocabularyFile(object):
+    '''A generated vocabulary file, written out after every edit.'''
+
+    def __init__(self, path, numbers):
+        self.path = path
+        self.entries = dict(
+            ('entry %d' % number, 'text %d' % number) for number in numbers)
+        self._mtime = 1000000000
+        self.write()
+
+    def write(self):
+        with open(self.path, 'w') as vocabulary_file:
+            json.dump({'name': TAG, 'tags': [TAG],
+                       'vocabulary': self.entries}, vocabulary_file)
+        # Edits can come faster than the file system's mtime resolution.
+        self._mtime += 1
+        os.utime(self.path, (self._mtime, self._mtime))
+
+    def edit(self, kind, iteration):
+        if kind == 'change one entry':
+            self.entries[min(self.entries)] = 'changed %d' % iteration
+        elif kind == 'add one entry':
+            self.entries['added %d' % iteration] = 'added'
+        else:
+            self.entries.pop(max(self.entries))
+        self.write()
+
+
+def list_grammar(dict_list):
+    '''Loads a grammar using ``dict_list`` and counts the list's updates.'''
+    from dragonfly import DictListRef, Grammar, Rule
+
+    grammar = Grammar('vocabulary_refresh_benchmark')
+    grammar.add_rule(Rule(
+        name='entry', element=DictListRef('entry', dict_list), exported=True))
+    grammar.load()
+    grammar.updates = 0
+    update_list = grammar.update_list
+
+    def counting_update_list(updated):
+        grammar.updates += 1
+        update_list(updated)
+    grammar.update_list = counting_update_list
+    return grammar
+
+
+def full_reload(vocabulary_index, directory, path, dict_list):
+    vocabulary_index.write_index(path, vocabulary_index.build_index(directory))
+    index = vocabulary_index.VocabularyIndex(path)
+    try:
+        dict_list.set(dict(
+            (spoken, vocabulary_index.action(specs))
+            for (spoken, specs) in index.entries('dynamic', TAG).iteritems()
+        ))
+    finally:
+        index.close()
+
+
+def contents(dict_list):
+    return dict((spoken, repr(action)) for (spoken, action) in dict_list.iteritems())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args(argv)
+
+    replay_bench.setup_paths()
+    try:
+        from dragonfly import DictList, get_engine
+    except ImportError:
+        print 'The refresh benchmark needs dragonfly: pip install dragonfly2'
+        return 2
+    get_engine('text')
+    import vocabulary_index
+
+    temporary_directory = tempfile.mkdtemp()
+    directory = os.path.join(temporary_directory, 'vocabulary_config')
+    for kind in vocabulary_index.KINDS:
+        os.makedirs(os.path.join(directory, kind))
+    vocabulary_files = [
+        VocabularyFile(
+            os.path.join(directory, 'dynamic', 'benchmark%d.json' % number),
+            range(number, arguments.entries, arguments.files))
+        for number in range(arguments.files)
+    ]
+
+    vocabularies = vocabulary_index.Vocabularies(
+        directory, os.path.join(temporary_directory, 'incremental.index'))
+    incremental_list = vocabularies.dynamic_vocabulary(TAG)
+    full_path = os.path.join(temporary_directory, 'full.index')
+    full_list = DictList('full %s' % TAG)
+    full_reload(vocabulary_index, directory, full_path, full_list)
+    grammars = [list_grammar(incremental_list), list_grammar(full_list)]
+
+    row = '%-18s %16s %10s %8s %16s'
+    print '%d entries in %d files' % (arguments.entries, arguments.files)
+    print row % ('edit', 'incremental ms', 'full ms', 'changed',
+                 'engine updates')
+    mismatches = 0
+    try:
+        for edit in EDITS:
+            incremental_time = full_time = 0
+            changed = 0
+            for grammar in grammars:
+                grammar.updates = 0
+            for iteration in range(arguments.repeat):
+                vocabulary_files[0].edit(edit, iteration)
+
+                start = timeit.default_timer()
+                changed += vocabularies.refresh()
+                incremental_time += timeit.default_timer() - start
+
+                start = timeit.default_timer()
+                full_reload(vocabulary_index, directory, full_path, full_list)
+                full_time += timeit.default_timer() - start
+
+                mismatches += contents(incremental_list) != contents(full_list)
+            print row % (
+                edit,
+                '%.2f' % (incremental_time * 1000 / arguments.repeat),
+                '%.2f' % (full_time * 1000 / arguments.repeat),
+                changed / arguments.repeat,
+                '%d vs %d' % (grammars[0].updates / arguments.repeat,
+                              grammars[1].updates / arguments.repeat))
+    finally:
+        for grammar in grammars:
+            grammar.unload()
+        vocabularies.index().close()
+        shutil.rmtree(temporary_directory)
+    if mismatches:
+        print 'The incremental and full reloads differ'
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))